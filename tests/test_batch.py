@@ -0,0 +1,111 @@
+import os
+import sys
+
+import pytest
+
+from yerba.batch import (
+    group_by_folder, build_deck, build_decks, _forget_modules
+)
+from yerba.utils.fingerprint import (
+    get_build_fingerprint, save_build_fingerprint
+)
+
+
+@pytest.fixture
+def manim():
+    # building (even an up to date deck) resets the parser params, which
+    # imports manim
+    return pytest.importorskip("manim")
+
+
+def write(filename, text):
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w") as f:
+        f.write(text)
+
+
+def make_up_to_date_deck(filename, size=1):
+    """A deck with its PDF and the fingerprint of its last build."""
+    folder, basename = os.path.split(filename)
+    write(filename, "# A\n" + "x"*size)
+    write(os.path.splitext(filename)[0] + ".pdf", "pdf")
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        os.makedirs("media", exist_ok=True)
+        fingerprint = get_build_fingerprint(basename)
+        save_build_fingerprint(basename, basename[:-3] + ".pdf", fingerprint)
+    finally:
+        os.chdir(cwd)
+
+
+def test_group_by_folder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("a/small.md", "x")
+    write("a/big.md", "x"*100)
+    write("b/other.md", "x"*50)
+    write("c/huge.md", "x"*500)
+
+    assert group_by_folder(["a/small.md", "b/other.md", "a/big.md",
+                            "c/huge.md"]) == [
+        ["c/huge.md"], ["a/big.md", "a/small.md"], ["b/other.md"]
+    ]
+    # the same folder with other spellings
+    assert group_by_folder(["a/big.md", "./a//small.md"]) == [
+        ["a/big.md", "./a//small.md"]
+    ]
+
+
+def test_forget_modules(tmp_path, monkeypatch):
+    write(str(tmp_path/"custom_template_for_test.py"), "X = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    modules = set(sys.modules)
+    import custom_template_for_test  # noqa: F401
+    assert "custom_template_for_test" in sys.modules
+
+    _forget_modules(modules, str(tmp_path))
+    assert "custom_template_for_test" not in sys.modules
+    assert "pytest" in sys.modules
+
+
+def test_build_deck_up_to_date(tmp_path, monkeypatch, manim):
+    monkeypatch.chdir(tmp_path)
+    make_up_to_date_deck("sub/deck.md")
+    path = list(sys.path)
+
+    result = build_deck("sub/deck.md")
+    assert result.status == "up to date"
+    assert result.error is None
+    # the folder and the import path are restored
+    assert os.getcwd() == str(tmp_path)
+    assert sys.path == path
+
+
+def test_build_deck_failed(tmp_path, monkeypatch, manim):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("sub")
+    result = build_deck("sub/missing.md")
+    assert result.status == "failed"
+    assert result.error
+    assert os.getcwd() == str(tmp_path)
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_build_decks(tmp_path, monkeypatch, manim, jobs):
+    monkeypatch.chdir(tmp_path)
+    make_up_to_date_deck("a/one.md", size=10)
+    make_up_to_date_deck("a/two.md", size=20)
+    make_up_to_date_deck("b/three.md")
+
+    seen = []
+    results = build_decks(["a/one.md", "a/two.md", "b/three.md"],
+                          jobs=jobs, on_result=seen.append)
+    assert sorted(r.filename for r in results) == [
+        "a/one.md", "a/two.md", "b/three.md"
+    ]
+    assert all(r.status == "up to date" for r in results)
+    assert seen == results
+    # the decks of a folder are built in order, biggest first
+    folder_a = [r.filename for r in results if r.filename.startswith("a/")]
+    assert folder_a == ["a/two.md", "a/one.md"]
+    assert os.getcwd() == str(tmp_path)
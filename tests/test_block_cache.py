@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+pytest.importorskip("manim")
+
+import manim  # noqa: E402
+from manim import Mobject  # noqa: E402
+
+from yerba.base import block_cache  # noqa: E402
+from yerba.base.block_cache import (  # noqa: E402
+    PythonBlockRecorder, get_python_block_cache_filename,
+    _NOT_REPLAYABLE_METHODS
+)
+from yerba.base.box import Box, NamedBoxes  # noqa: E402
+
+
+class FakeSlide:
+    def __init__(self):
+        self.linked_positions = []
+
+
+class FakePresentation:
+    """The parts of a presentation that the block cache uses."""
+
+    def __init__(self):
+        self.named_boxes = NamedBoxes(content=Box.get_full_box(),
+                                      left=Box.get_left_box(4))
+        self.named_boxes.set_current_box("content")
+        self.slide_number = 1
+        self.subslide_number = 0
+        self.template_params = {"font_size": 30}
+        self.colors = {"RED": "#ff0000"}
+        self.current_slide = FakeSlide()
+        self.added = []
+
+    def get_box(self, name):
+        return getattr(self.named_boxes, name)
+
+    def add(self, mobjects, idx=-1, box=None):
+        self.added.append((mobjects, box))
+
+
+for _name in _NOT_REPLAYABLE_METHODS:
+    setattr(FakePresentation, _name, lambda self, *args, **kwargs: None)
+
+
+@pytest.fixture(autouse=True)
+def media(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_key_depends_on_the_inputs(monkeypatch):
+    p = FakePresentation()
+    filename = get_python_block_cache_filename(p, "code")
+    assert get_python_block_cache_filename(p, "code") == filename
+    assert filename.endswith(".pkl")
+
+    def changed(change):
+        p = FakePresentation()
+        change(p)
+        return get_python_block_cache_filename(p, "code") != filename
+
+    assert get_python_block_cache_filename(p, "other code") != filename
+    assert changed(lambda p: setattr(p, "slide_number", 2))
+    assert changed(lambda p: setattr(p, "subslide_number", 1))
+    assert changed(lambda p: p.template_params.update(font_size=20))
+    assert changed(lambda p: p.colors.update(RED="#f00000"))
+    assert changed(lambda p: p.named_boxes.set_current_box("left"))
+    assert changed(lambda p: setattr(p.get_box("active"), "arrange",
+                                     "center"))
+
+    monkeypatch.setattr(block_cache, "get_yerba_version", lambda: "other")
+    assert changed(lambda p: None)
+    monkeypatch.undo()
+    monkeypatch.setattr(manim, "__version__", "0.0.0")
+    assert changed(lambda p: None)
+
+
+def record(p, filename, block):
+    recorder = PythonBlockRecorder(p)
+    with recorder.record():
+        block(p)
+    return recorder.dump(filename)
+
+
+def test_replay_round_trip():
+    p = FakePresentation()
+    filename = get_python_block_cache_filename(p, "code")
+    content_box = p.get_box("content")
+    other_box = Box.get_right_box(3)
+
+    mo1, mo2 = Mobject(), Mobject()
+    mo1.box = content_box
+
+    def block(p):
+        p.add([mo1], box=content_box)
+        p.add(mo2, box=other_box)
+
+    assert record(p, filename, block)
+    assert os.path.exists(filename)
+    # the recorder only wraps the methods while the block runs
+    assert "add" not in vars(p)
+    assert len(p.added) == 2
+
+    new_p = FakePresentation()
+    assert PythonBlockRecorder.replay(new_p, filename)
+    (mobjects1, box1), (mobjects2, box2) = new_p.added
+    # named boxes are the ones of the presentation that replays the block
+    assert box1 is new_p.get_box("content")
+    assert mobjects1[0].box is box1
+    # other boxes are rebuilt with the same geometry
+    assert box2 is not other_box
+    assert list(box2.center) == list(other_box.center)
+    assert (box2.width, box2.height) == (other_box.width, other_box.height)
+    assert isinstance(mobjects2[0], Mobject)
+
+
+@pytest.mark.parametrize("block", [
+    lambda p: p.pause(),
+    lambda p: p.add(Mobject(), idx=0),
+    lambda p: p.current_slide.linked_positions.append(None),
+])
+def test_not_replayable_blocks_are_not_cached(block):
+    p = FakePresentation()
+    filename = get_python_block_cache_filename(p, "code")
+    assert not record(p, filename, block)
+    assert not os.path.exists(filename)
+    assert not any(name in vars(p)
+                   for name in ("add", *_NOT_REPLAYABLE_METHODS))
+
+
+def test_replay_bad_files():
+    p = FakePresentation()
+    filename = get_python_block_cache_filename(p, "code")
+    assert not PythonBlockRecorder.replay(p, filename)
+
+    with open(filename, "wb") as f:
+        f.write(b"not a pickle")
+    assert not PythonBlockRecorder.replay(p, filename)
+    assert p.added == []
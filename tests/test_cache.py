@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from yerba.utils.cache import (
+    parse_size, format_size, get_entries, prune, write_cache_file,
+    open_cache_file, has_zstd
+)
+
+
+@pytest.mark.parametrize("size, expected", [
+    ("100", 100),
+    ("2K", 2048),
+    ("500M", 500*1024**2),
+    ("1.5GiB", int(1.5*1024**3)),
+    (" 2gb ", 2*1024**3),
+])
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+@pytest.mark.parametrize("size", ["", "G", "-1M", "2X", "1 2"])
+def test_parse_size_invalid(size):
+    with pytest.raises(ValueError):
+        parse_size(size)
+
+
+def test_format_size():
+    assert format_size(10) == "10 B"
+    assert format_size(1536) == "1.5 KiB"
+
+
+def write(path, size, last_used):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x"*size)
+    os.utime(path, (last_used, last_used))
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # a TeX snippet (.tex and .svg), and two slides of a deck
+    write("media/Tex/abc.tex", 10, 1000)
+    write("media/Tex/abc.svg", 20, 1000)
+    write("media/texts/new.svg", 30, 3000)
+    write("media/slides/deck.md/s0001_subs0001.svg", 40, 2000)
+    write("media/slides/deck.md/s0001_subs0002.svg", 40, 2000)
+    write("media/slides/deck.md/s0002_subs0001.svg", 50, 4000)
+
+
+def test_get_entries(media):
+    tex, = get_entries("tex")
+    assert tex.key == "abc"
+    assert tex.size == 30
+    assert len(tex.paths) == 2
+
+    slides = {e.key: e for e in get_entries("slides")}
+    assert set(slides) == {"deck.md/s0001", "deck.md/s0002"}
+    assert slides["deck.md/s0001"].size == 80
+    assert get_entries("images") == []
+
+
+def test_prune(media):
+    # the least recently used entries go first, whole
+    removed = prune(100, dry_run=True)
+    assert [e.key for e in removed] == ["abc", "deck.md/s0001"]
+    assert os.path.exists("media/Tex/abc.tex")
+
+    removed = prune(100)
+    assert [e.key for e in removed] == ["abc", "deck.md/s0001"]
+    assert not os.path.exists("media/Tex/abc.svg")
+    assert not os.path.exists("media/slides/deck.md/s0001_subs0002.svg")
+    assert os.path.exists("media/slides/deck.md/s0002_subs0001.svg")
+    assert os.path.exists("media/texts/new.svg")
+
+    assert prune(100) == []
+
+
+def test_cache_file_without_compression(tmp_path):
+    filename = str(tmp_path/"data")
+    write_cache_file(filename, b"data")
+    with open_cache_file(filename) as f:
+        assert f.read() == b"data"
+    with pytest.raises(ValueError):
+        write_cache_file(filename, b"data", compression="gzip")
+
+
+@pytest.mark.skipif(not has_zstd(), reason="zstandard is not installed")
+def test_cache_file_with_zstd(tmp_path):
+    filename = str(tmp_path/"data")
+    write_cache_file(filename, b"data"*100, compression="zstd")
+    assert os.path.getsize(filename) < 400
+    with open_cache_file(filename) as f:
+        assert f.read() == b"data"*100
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("manim")
+
+from yerba.utils.commands import (  # noqa: E402
+    parse_inline_command, iter_commands
+)
+from yerba.utils.parser import get_markdownit_nodes  # noqa: E402
+
+
+def test_parse_inline_command():
+    command = parse_inline_command("! add text - 'hello', color='RED'")
+    assert command.kind == "inline"
+    assert command.name == "add_text"
+    assert command.args.strip() == "'hello', color='RED'"
+    assert command.eval_args({}, {}) == (("hello",), {"color": "RED"})
+
+
+def test_parse_inline_command_without_args():
+    command = parse_inline_command("! pause")
+    assert command.name == "pause"
+    assert command.code is None
+    assert command.eval_args({}, {}) == ((), {})
+
+
+def test_parse_inline_command_python():
+    command = parse_inline_command("! `x = 1`")
+    assert command.kind == "python"
+    assert command.args is None
+
+
+def test_parse_inline_command_is_cached():
+    line = "! add text - 'cached'"
+    assert parse_inline_command(line) is parse_inline_command(line)
+
+
+@pytest.mark.parametrize("line, error", [
+    ("! 1abc - 2", SyntaxError),
+    ("not a command", ValueError),
+])
+def test_parse_inline_command_errors(line, error):
+    with pytest.raises(error):
+        parse_inline_command(line)
+
+
+def test_literal_args():
+    command = parse_inline_command("! set box - 'left', arrange='center'")
+    assert command.literal_args() == (("left",), {"arrange": "center"})
+
+
+@pytest.mark.parametrize("line", [
+    "! set box - name",
+    "! set box - f()",
+    "! set box - **kwargs",
+])
+def test_literal_args_rejects_code(line):
+    with pytest.raises(ValueError):
+        parse_inline_command(line).literal_args()
+
+
+def test_iter_commands():
+    nodes = get_markdownit_nodes(
+        "> ! add text - 'a'\n"
+        "> ! 1abc - 2\n"
+        "\n"
+        "```fragment\n"
+        "> ! pause\n"
+        "```\n"
+        "\n"
+        "```python\n"
+        "print(1)\n"
+        "```\n"
+    )
+    names = [command.name for command in iter_commands(nodes)]
+    # the invalid command and the plain code block are skipped, and the
+    # commands of the nested block follow the block
+    assert names == ["add_text", "md_fragment_block", "pause"]
@@ -0,0 +1,50 @@
+import os
+
+from yerba.utils.fingerprint import (
+    get_build_fingerprint, get_fingerprint_filename, is_build_up_to_date,
+    save_build_fingerprint
+)
+
+
+def write(filename, text):
+    with open(filename, "w") as f:
+        f.write(text)
+
+
+def test_fingerprint_of_deck_in_subfolder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("media")
+    os.makedirs("sub")
+    write("sub/deck.md", "# A\n")
+    write("sub/deck.pdf", "pdf")
+
+    filename = get_fingerprint_filename("sub/deck.md")
+    assert os.path.dirname(filename) == "./media"
+    assert filename == get_fingerprint_filename("./sub//deck.md")
+
+    fingerprint = get_build_fingerprint("sub/deck.md")
+    assert not is_build_up_to_date("sub/deck.md", "sub/deck.pdf",
+                                   fingerprint)
+    save_build_fingerprint("sub/deck.md", "sub/deck.pdf", fingerprint)
+    assert is_build_up_to_date("sub/deck.md", "sub/deck.pdf", fingerprint)
+
+
+def test_fingerprint_changes_with_the_deck(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write("deck.md", "# A\n")
+    fingerprint = get_build_fingerprint("deck.md")
+    assert get_build_fingerprint("deck.md") == fingerprint
+    assert get_build_fingerprint("deck.md", extra={"jobs": 2}) != fingerprint
+    write("deck.md", "# B\n")
+    assert get_build_fingerprint("deck.md") != fingerprint
+
+
+def test_fingerprint_follows_includes_of_deck_in_subfolder(tmp_path,
+                                                           monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("sub")
+    write("sub/deck.md", "# A\n\n!include ch1.md\n")
+    write("sub/ch1.md", "# B\n")
+    fingerprint = get_build_fingerprint("sub/deck.md")
+    write("sub/ch1.md", "# B changed\n")
+    assert get_build_fingerprint("sub/deck.md") != fingerprint
@@ -0,0 +1,77 @@
+import contextvars
+
+import pytest
+
+from yerba.globals import IdRegistry, current_ids, get_ids
+
+
+class Mo:
+    pass
+
+
+def test_add_and_get():
+    ids = IdRegistry()
+    a, b = Mo(), Mo()
+    ids.add("x", a)
+    ids.add("x", b)
+    # adding the same mobject again doesn't duplicate it
+    ids.add("x", a)
+    assert "x" in ids and "y" not in ids
+    assert ids.get("x") == [a, b]
+    assert ids.first("x") is a
+    assert ids.get("y") == []
+
+
+def test_set_and_pop():
+    ids = IdRegistry()
+    a, b = Mo(), Mo()
+    ids.add("x", a)
+    ids.set("x", [b])
+    assert ids.get("x") == [b]
+    assert ids.pop("x") == [b]
+    assert "x" not in ids
+
+
+def test_transfer():
+    ids = IdRegistry()
+    a, b, c = Mo(), Mo(), Mo()
+    ids.add("x", a)
+    ids.add("x", b)
+    version = ids.version
+
+    copy = Mo()
+    ids.transfer("x", a, copy)
+    assert ids.get("x") == [b, copy]
+    assert ids.version > version
+
+    with pytest.raises(ValueError):
+        ids.transfer("x", c, Mo())
+    with pytest.raises(ValueError):
+        ids.transfer("y", a, Mo())
+
+
+def test_version_changes():
+    ids = IdRegistry()
+    versions = [ids.version]
+    ids.add("x", Mo())
+    versions.append(ids.version)
+    ids.clear()
+    versions.append(ids.version)
+    assert versions == sorted(set(versions))
+    assert "x" not in ids
+
+
+def test_get_ids_per_context():
+    def in_context():
+        current_ids.set(None)
+        return get_ids()
+
+    ids = contextvars.copy_context().run(in_context)
+    other_ids = contextvars.copy_context().run(in_context)
+    assert ids is not other_ids
+
+    token = current_ids.set(ids)
+    try:
+        assert get_ids() is ids
+    finally:
+        current_ids.reset(token)
@@ -0,0 +1,120 @@
+import sys
+import time
+import threading
+
+import pytest
+
+pytest.importorskip("manim")
+
+from yerba.utils.orchestrator import (  # noqa: E402
+    BuildOrchestrator, get_tex_compilation_command
+)
+
+
+@pytest.fixture
+def orchestrator(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    orchestrator = BuildOrchestrator(max_jobs=2)
+    yield orchestrator
+    if not orchestrator.loop.is_closed():
+        orchestrator.close()
+
+
+def python(code):
+    return (sys.executable, "-c", code)
+
+
+def test_output_is_written_in_order(orchestrator):
+    written = []
+
+    def write(i):
+        time.sleep(0.01*(i % 2))
+        written.append(i)
+
+    for i in range(10):
+        orchestrator.submit_output(write, i)
+    orchestrator.flush()
+    assert written == list(range(10))
+
+
+def test_output_errors_are_raised(orchestrator):
+    def fail():
+        raise RuntimeError("can't write")
+
+    # raised by the next call, or when the output is flushed
+    with pytest.raises(RuntimeError):
+        orchestrator.submit_output(fail)
+        orchestrator.submit_output(lambda: None)
+        orchestrator.flush()
+
+
+def test_prefetch(orchestrator):
+    calls = []
+    release = threading.Event()
+
+    def load(name):
+        release.wait(5)
+        calls.append(name)
+
+    orchestrator.prefetch(load, "a")
+    # the same call is only prefetched once
+    orchestrator.prefetch(load, "a")
+    release.set()
+    orchestrator.wait_for(load, "a")
+    assert calls == ["a"]
+    # nothing to wait for
+    orchestrator.wait_for(load, "b")
+
+
+def test_run_tool(orchestrator):
+    assert orchestrator._submit(
+        orchestrator.run_tool(*python("raise SystemExit(3)"))
+    ).result() == 3
+
+
+def test_run_tool_limits_the_jobs(orchestrator, tmp_path):
+    # each tool writes a file while it runs and counts the others
+    code = (
+        "import os, sys, time, glob; "
+        "open(sys.argv[1], 'w').close(); time.sleep(0.3); "
+        "n = len(glob.glob(os.path.join(os.path.dirname(sys.argv[1]), "
+        "'*.running'))); os.remove(sys.argv[1]); raise SystemExit(n)"
+    )
+    jobs = [
+        orchestrator._submit(orchestrator.run_tool(
+            sys.executable, "-c", code, str(tmp_path/f"{i}.running")
+        ))
+        for i in range(4)
+    ]
+    assert max(job.result() for job in jobs) <= 2
+
+
+def test_close_stops_the_tools(orchestrator):
+    job = orchestrator._submit(
+        orchestrator.run_tool(*python("import time; time.sleep(60)"))
+    )
+    # wait for the process to start
+    for _ in range(100):
+        if orchestrator.processes:
+            break
+        time.sleep(0.05)
+
+    t0 = time.perf_counter()
+    orchestrator.close()
+    assert time.perf_counter() - t0 < 30
+    assert job.done()
+    assert orchestrator.loop.is_closed()
+
+
+def test_get_tex_compilation_command():
+    assert get_tex_compilation_command(
+        "xelatex", ".xdv", "a.tex", "out"
+    ) == ["xelatex", "-no-pdf", "-interaction=batchmode", "-halt-on-error",
+          "-output-directory=out", "a.tex"]
+    assert "-output-format=dvi" in get_tex_compilation_command(
+        "latex", ".dvi", "a.tex", "out"
+    )
+    with pytest.raises(ValueError):
+        get_tex_compilation_command("xelatex", ".dvi", "a.tex", "out")
+    with pytest.raises(ValueError):
+        get_tex_compilation_command("tectonic", ".pdf", "a.tex", "out")
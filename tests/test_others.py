@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("manim")
+
+from yerba.defaults import parser_params  # noqa: E402
+from yerba.utils.others import (  # noqa: E402
+    get_source_date_epoch, format_pdf_date
+)
+
+
+@pytest.mark.parametrize("env, reproducible, expected", [
+    (None, False, None),
+    (None, True, 0),
+    ("1700000000", False, 1700000000),
+    ("1700000000", True, 1700000000),
+    # an empty variable counts as not set
+    ("", True, 0),
+])
+def test_get_source_date_epoch(monkeypatch, env, reproducible, expected):
+    if env is None:
+        monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    else:
+        monkeypatch.setenv("SOURCE_DATE_EPOCH", env)
+    monkeypatch.setitem(parser_params, "output.reproducible", reproducible)
+    assert get_source_date_epoch() == expected
+
+
+def test_format_pdf_date():
+    assert format_pdf_date(0) == "1970-01-01T00:00:00Z"
+    assert format_pdf_date(1700000000) == "2023-11-14T22:13:20Z"
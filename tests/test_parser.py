@@ -0,0 +1,135 @@
+import os
+import shutil
+
+import pytest
+
+from yerba.utils.parser import (
+    parse_slide_ranges, get_slide_numbers_by_title,
+    get_slides_md_nodes_from_text, get_deck_slides, get_snapshot_filename,
+    get_slide_name_prefix, save_slide_numbers
+)
+
+
+@pytest.mark.parametrize("ranges, expected", [
+    ("3", {3}),
+    ("12-15,18", {12, 13, 14, 15, 18}),
+    (" 1 - 2 , 5 ,", {1, 2, 5}),
+    ("", set()),
+])
+def test_parse_slide_ranges(ranges, expected):
+    assert parse_slide_ranges(ranges) == expected
+
+
+def test_parse_slide_ranges_invalid():
+    with pytest.raises(ValueError):
+        parse_slide_ranges("a-b")
+
+
+def test_get_slide_numbers_by_title():
+    slides = get_slides_md_nodes_from_text(
+        "# Intro\n\ntext\n\n# Results\n\n# results\n\n# End\n"
+    )
+    assert get_slide_numbers_by_title(slides, [" Results"]) == {2, 3}
+    assert get_slide_numbers_by_title(slides, ["missing"]) == set()
+
+
+# -- decks
+
+def write(filename, text):
+    with open(filename, "w") as f:
+        f.write(text)
+    # the parsed files are cached by size and modification time
+    st = os.stat(filename)
+    os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+
+def build(filename):
+    """Save what a build saves to compare the next one (see MainRutine)."""
+    slides, sources = get_deck_slides(filename)
+    for source in sources:
+        shutil.copy2(source, get_snapshot_filename(source))
+    save_slide_numbers(filename, slides)
+    return slides
+
+
+def get_new_slides(filename):
+    slides, _ = get_deck_slides(filename)
+    return [s["name"] for s in slides if s["is_new_slide"]]
+
+
+@pytest.fixture
+def deck(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("media")
+    write("deck.md", "# A\n\n!include chap.md\n\n# B\n")
+    write("chap.md", "intro\n\n# C1\n\n# C2\n\ntext\n")
+    return "deck.md"
+
+
+def test_get_deck_slides_names(deck):
+    slides, sources = get_deck_slides(deck)
+    assert sources == ["deck.md", "chap.md"]
+
+    prefix = get_slide_name_prefix("chap.md", is_main_file=False)
+    assert prefix.startswith("chap-")
+    assert [s["name"] for s in slides] == [
+        "s0000", "s0001", f"{prefix}s0001", f"{prefix}s0002", "s0002"
+    ]
+    assert [s["slide_number"] for s in slides] == [0, 1, 2, 3, 4]
+    assert [s["source"] for s in slides] == [
+        "deck.md", "deck.md", "chap.md", "chap.md", "deck.md"
+    ]
+    # the content before the first title goes to the including slide
+    assert slides[1]["content"][0].children[0].content == "intro"
+
+
+def test_get_deck_slides_new_slides(deck):
+    # without a previous build (the empty slide 0 doesn't change)
+    assert len(get_new_slides(deck)) == 4
+    build(deck)
+    assert get_new_slides(deck) == []
+
+    # only the changed slide of the included file
+    write("chap.md", "intro\n\n# C1\n\n# C2\n\nother text\n")
+    prefix = get_slide_name_prefix("chap.md", is_main_file=False)
+    assert get_new_slides(deck) == [f"{prefix}s0002"]
+    build(deck)
+
+    # a new slide in the included file changes the number of the next
+    # slides of the deck
+    write("chap.md", "intro\n\n# C1\n\n# C2\n\nother text\n\n# C3\n")
+    new_slides = get_new_slides(deck)
+    assert f"{prefix}s0003" in new_slides and "s0002" in new_slides
+    assert "s0001" not in new_slides and f"{prefix}s0001" not in new_slides
+
+
+def test_get_deck_slides_with_text(deck):
+    build(deck)
+    slides, _ = get_deck_slides(deck, text=open(deck).read())
+    assert all(s["is_new_slide"] for s in slides[1:])
+
+
+def test_get_deck_slides_included_twice(deck):
+    write("deck.md", "# A\n\n!include chap.md\n\n# B\n\n!include chap.md\n")
+    with pytest.raises(ValueError):
+        get_deck_slides(deck)
+
+
+def test_get_deck_slides_outside_the_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("media")
+    os.makedirs("sub/parts")
+    # include paths are relative to the file that has them
+    write("sub/deck.md", "# A\n\n!include parts/ch1.md\n")
+    write("sub/parts/ch1.md", "# C1\n\n!include ch2.md\n")
+    write("sub/parts/ch2.md", "# C2\n")
+
+    slides, sources = get_deck_slides("sub/deck.md")
+    assert sources == ["sub/deck.md", "sub/parts/ch1.md", "sub/parts/ch2.md"]
+    assert len(slides) == 4
+
+    build("sub/deck.md")
+    assert get_new_slides("sub/deck.md") == []
+    write("sub/parts/ch2.md", "# C2\n\ntext\n")
+    prefix = get_slide_name_prefix("sub/parts/ch2.md", is_main_file=False)
+    assert get_new_slides("sub/deck.md") == [f"{prefix}s0001"]
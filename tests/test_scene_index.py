@@ -0,0 +1,117 @@
+import pytest
+
+pytest.importorskip("manim")
+
+from manim import Mobject, Group  # noqa: E402
+from manim.utils.family import extract_mobject_family_members  # noqa: E402
+
+from yerba.base.scene_index import SceneIndex  # noqa: E402
+
+
+def old_remove(mobject_list, to_remove):
+    """
+    The list helper that `SceneIndex.remove` replaced
+    (`restructure_list_to_exclude_certain_family_members`), to compare them.
+    """
+    new_list = []
+    to_remove = extract_mobject_family_members(to_remove)
+
+    def add_safe_mobjects_from_list(list_to_examine, set_to_remove):
+        removed = False
+        for mob in list_to_examine:
+            if mob in set_to_remove:
+                removed = True
+                continue
+            intersect = set_to_remove.intersection(mob.get_family())
+            if intersect:
+                removed = True
+                add_safe_mobjects_from_list(mob.submobjects, intersect)
+            else:
+                new_list.append(mob)
+        if not removed:
+            raise ValueError("Couldn't find the mobject in the list")
+
+    add_safe_mobjects_from_list(mobject_list, set(to_remove))
+    return new_list
+
+
+@pytest.fixture
+def tree():
+    a, b, c, d = (Mobject() for _ in range(4))
+    inner = Group(b, c)
+    outer = Group(a, inner)
+    return dict(a=a, b=b, c=c, d=d, inner=inner, outer=outer,
+                roots=[outer, d])
+
+
+@pytest.mark.parametrize("names", [
+    ["c"], ["a"], ["d"], ["inner"], ["outer"], ["a", "d"], ["b", "c"],
+    # only some of them are in the list
+    ["c", "missing"],
+])
+def test_remove_as_old_helper(tree, names):
+    tree["missing"] = Mobject()
+    to_remove = [tree[n] for n in names]
+    expected = old_remove(tree["roots"], to_remove)
+    assert SceneIndex().remove(to_remove, tree["roots"]) == expected
+
+
+def test_remove_single_mobject(tree):
+    roots = SceneIndex().remove(tree["c"], tree["roots"])
+    assert roots == [tree["a"], tree["b"], tree["d"]]
+
+
+def test_remove_keeps_the_roots(tree):
+    roots = list(tree["roots"])
+    SceneIndex().remove([tree["c"]], roots)
+    assert roots == tree["roots"]
+
+
+def test_remove_missing(tree):
+    with pytest.raises(ValueError):
+        old_remove(tree["roots"], [Mobject()])
+    with pytest.raises(ValueError):
+        SceneIndex().remove([Mobject()], tree["roots"])
+
+
+def test_replace(tree):
+    index = SceneIndex()
+    e = Mobject()
+    index.replace(tree["b"], e, tree["roots"])
+    assert tree["inner"].submobjects == [e, tree["c"]]
+    assert not index.contains(tree["b"], tree["roots"])
+    assert index.get_path(e, tree["roots"]) == [tree["outer"], tree["inner"],
+                                                e]
+
+    with pytest.raises(ValueError):
+        index.replace(Mobject(), e, tree["roots"])
+
+
+def test_replace_root(tree):
+    e = Mobject()
+    SceneIndex().replace(tree["d"], e, tree["roots"])
+    assert tree["roots"] == [tree["outer"], e]
+
+
+def test_changes_outside_the_index(tree):
+    index = SceneIndex()
+    roots = tree["roots"]
+    assert index.contains(tree["c"], roots)
+
+    # the index is rebuilt when the mobjects change
+    f = Mobject()
+    tree["inner"].add(f)
+    tree["inner"].remove(tree["c"])
+    assert index.contains(f, roots)
+    assert not index.contains(tree["c"], roots)
+    assert index.remove([f], roots) == [tree["a"], tree["b"], tree["d"]]
+
+
+def test_add_roots(tree):
+    index = SceneIndex()
+    roots = tree["roots"]
+    index.rebuild(roots)
+    e = Mobject()
+    roots.append(e)
+    index.add_roots([e])
+    assert index.get_path(e, roots) == [e]
@@ -0,0 +1,81 @@
+import gzip
+
+import numpy as np
+import pytest
+
+pytest.importorskip("manim")
+
+from yerba.base.scene import Scene, PathItem  # noqa: E402
+from yerba.base.svg_writer import SvgWriter, write_svg  # noqa: E402
+
+TRANSPARENT = np.array([[0, 0, 0, 0.]])
+
+
+def square(x0=0., size=1., glyph_id="g", fill=(0, 0, 0, 1.)):
+    """A closed square made of straight cubic curves, in manim units."""
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]])*size
+    corners[:, 0] += x0
+    points = [corners[0]]
+    for p0, p3 in zip(corners[:-1], corners[1:]):
+        points += [p0 + (p3-p0)/3, p0 + 2*(p3-p0)/3, p3]
+    return PathItem(
+        subpaths=[(np.array(points), True)],
+        fill_rgbas=np.array([fill]),
+        stroke_rgbas=TRANSPARENT,
+        stroke_width=0.,
+        background_stroke_rgbas=TRANSPARENT,
+        background_stroke_width=0.,
+        gradient_points=np.zeros((2, 2)),
+        glyph_id=glyph_id,
+    )
+
+
+def get_scene(items):
+    # 100 px per manim unit
+    return Scene(1600, 900, 16., 9., items)
+
+
+def test_equal_glyphs_are_written_once():
+    svg = SvgWriter(get_scene([square(0.), square(1.)])).to_string()
+    assert svg.count('<path id="glyph0"') == 1
+    assert svg.count("<use ") == 2
+    assert 'transform="matrix(1 0 0 1 100 0)"' in svg
+
+
+def test_scaled_glyph_uses_a_transform():
+    svg = SvgWriter(get_scene([square(0.), square(0., size=2.)])).to_string()
+    assert svg.count('<path id="glyph0"') == 1
+    assert "matrix(2 0 0 2 -800 -450)" in svg
+
+
+def test_other_glyphs_are_not_merged():
+    svg = SvgWriter(get_scene([
+        square(0., glyph_id="a"), square(1., glyph_id="b"),
+        square(2., glyph_id=None),
+    ])).to_string()
+    assert 'id="glyph0"' in svg and 'id="glyph1"' in svg
+    assert svg.count("<use ") == 2
+    # without a glyph id it is written as a plain path
+    assert svg.count('<path d="') == 1
+
+
+def test_straight_curves_are_written_as_lines():
+    svg = SvgWriter(get_scene([square(glyph_id=None)])).to_string()
+    assert 'd="M800 450 L900 450 900 350 800 350 800 450 Z"' in svg
+
+
+def test_invalid_precision():
+    with pytest.raises(ValueError):
+        SvgWriter(get_scene([]), precision=0)
+
+
+def test_compressed_svg_is_deterministic(tmp_path):
+    scene = get_scene([square(0.), square(1.)])
+    a, b = tmp_path/"a.svgz", tmp_path/"b.svgz"
+    write_svg(scene, str(a), compress=True)
+    write_svg(scene, str(b), compress=True)
+    assert a.read_bytes() == b.read_bytes()
+
+    plain = tmp_path/"plain.svg"
+    write_svg(scene, str(plain))
+    assert gzip.decompress(a.read_bytes()) == plain.read_bytes()
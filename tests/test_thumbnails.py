@@ -0,0 +1,81 @@
+import os
+import json
+
+import pytest
+
+pytest.importorskip("cairo")
+pytest.importorskip("manim")
+
+from PIL import Image  # noqa: E402
+
+from yerba.base.scene import Scene  # noqa: E402
+from yerba.base.thumbnails import write_thumbnails  # noqa: E402
+from yerba.utils.cache import cache_stats  # noqa: E402
+from yerba.utils.parser import get_markdownit_nodes  # noqa: E402
+
+
+def write_page(filename, page_hash):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    Scene(160, 90, 16., 9., []).dump(filename)
+    with open(f"{filename}.hash", "w") as f:
+        f.write(page_hash)
+
+
+@pytest.fixture
+def pages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cache_stats, "counts", {})
+    pages = [f"./media/slides/deck.md/{name}.scene"
+             for name in ("s0001_subs0001", "s0001_subs0002",
+                          "s0002_subs0001")]
+    # the first two pages have the same scene
+    for page, page_hash in zip(pages, ("aaa", "aaa", "bbb")):
+        write_page(page, page_hash)
+    return pages
+
+
+def test_write_thumbnails(pages):
+    out_dir = "./media/thumbnails/deck.md"
+    os.makedirs(out_dir)
+    with open(os.path.join(out_dir, "old.png"), "w"):
+        pass
+    slides = {"s0001": dict(slide_number=1,
+                            title=get_markdownit_nodes("# Intro").children[0])}
+
+    index_filename = write_thumbnails(pages, 32, out_dir, slides, jobs=2)
+    assert index_filename == os.path.join(out_dir, "index.json")
+    with open(index_filename) as f:
+        index = json.load(f)
+
+    assert index["width"] == 32
+    assert [p["page"] for p in index["pages"]] == [1, 2, 3]
+    assert [p["hash"] for p in index["pages"]] == ["aaa", "aaa", "bbb"]
+    first, second, third = index["pages"]
+    assert first["file"] == "s0001_subs0001.png"
+    assert (first["slide_number"], first["subslide_number"],
+            first["title"]) == (1, 1, "Intro")
+    assert second["subslide_number"] == 2
+    assert third["slide_number"] is None and third["title"] is None
+
+    # the thumbnails of the previous build are removed
+    assert sorted(os.listdir(out_dir)) == [
+        "index.json", "s0001_subs0001.png", "s0001_subs0002.png",
+        "s0002_subs0001.png"
+    ]
+    with Image.open(os.path.join(out_dir, "s0002_subs0001.png")) as img:
+        assert img.size == (32, 18)
+
+    # equal pages are rasterized once
+    assert cache_stats.counts["thumbnails"] == [0, 2]
+
+
+def test_thumbnails_are_cached(pages):
+    write_thumbnails(pages, 32, "./media/thumbnails/deck.md")
+    cache_stats.counts.clear()
+    write_thumbnails(pages, 32, "./media/thumbnails/deck.md")
+    assert cache_stats.counts["thumbnails"] == [3, 0]
+
+    # other width, other thumbnails
+    cache_stats.counts.clear()
+    write_thumbnails(pages, 64, "./media/thumbnails/deck.md")
+    assert cache_stats.counts["thumbnails"] == [0, 2]
@@ -1,28 +1,311 @@
-import sys
 import os
-from .main_rutine import MainRutine
-from manim import logger
+import re
+import sys
+import argparse
 
+from .utils.timings import timings
 
-def cli_entry():
-    if len(sys.argv) == 1:
-        logger.error("You should specify an input filename")
-        quit()
-    elif len(sys.argv) == 2:
-        filename = sys.argv[1]
-        if os.path.exists(filename):
-            pass
-        elif os.path.exists(filename+".md"):
+
+def thumbnail_width(width) -> int:
+    """Parse widths like '320px' or '320'."""
+    m = re.fullmatch(r"\s*([1-9]\d*)\s*(?:px)?\s*", width)
+    if m is None:
+        raise argparse.ArgumentTypeError(f"invalid width {width!r}")
+    return int(m.group(1))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="yerba",
+        description="Create presentations from markdown files."
+    )
+    parser.add_argument("filename", help="markdown file of the presentation")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="only check that all the commands are valid, without rendering"
+    )
+    parser.add_argument(
+        "--backend", choices=["cairo", "svg"], default=None,
+        help="output backend: write SVG files and convert them with "
+             "rsvg-convert (default), or draw the PDF directly with cairo "
+             "(faster, but PDF images lose their clip paths, gradients and "
+             "embedded raster images)"
+    )
+    parser.add_argument(
+        "--slides", default=None, metavar="RANGES",
+        help="render only these slides, e.g. '12-15,18', to "
+             "<name>.partial.pdf"
+    )
+    parser.add_argument(
+        "--slide-title", action="append", default=[], metavar="TITLE",
+        help="render only the slide with this title (can be repeated)"
+    )
+    parser.add_argument(
+        "--svg-only", action="store_true",
+        help="with --slides or --slide-title, only write the svg files of "
+             "the slides to ./media/partial/<filename>/"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="build the presentation even if nothing changed since the last "
+             "build"
+    )
+    parser.add_argument(
+        "-k", "--keep-going", action="store_true",
+        help="replace the slides with errors by a placeholder and build the "
+             "rest, instead of stopping at the first error"
+    )
+    parser.add_argument(
+        "--thumbnails", type=thumbnail_width, default=None, metavar="WIDTH",
+        help="also write a PNG thumbnail of each subslide, e.g. '320px', and "
+             "an index.json to ./media/thumbnails/<filename>/"
+    )
+    parser.add_argument(
+        "--reproducible", action="store_true",
+        help="write the same PDF for the same input: seed `random` and "
+             "`np.random` on each slide and set the dates to "
+             "SOURCE_DATE_EPOCH (or 1970-01-01) instead of the current time"
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="show the time spent importing modules and in each build stage "
+             "(use `python -X importtime -m yerba` for a per-module report)"
+    )
+    return parser
+
+
+def get_parser_params_overrides(args):
+    overrides = {}
+    if args.backend is not None:
+        overrides["output.backend"] = args.backend
+    if args.keep_going:
+        overrides["errors.keep_going"] = True
+    if args.thumbnails is not None:
+        overrides["output.thumbnails"] = args.thumbnails
+    if args.reproducible:
+        overrides["output.reproducible"] = True
+    return overrides
+
+
+def get_serve_parser():
+    parser = argparse.ArgumentParser(
+        prog="yerba serve",
+        description="Render slides on demand for editor integrations "
+                    "(JSON-RPC over a Unix socket)."
+    )
+    parser.add_argument(
+        "--socket", default="./media/yerba.sock",
+        help="path of the Unix socket (default: ./media/yerba.sock)"
+    )
+    return parser
+
+
+def serve_entry(argv):
+    args = get_serve_parser().parse_args(argv)
+    from .server import RenderServer
+
+    socket_dir = os.path.dirname(args.socket)
+    if socket_dir:
+        os.makedirs(socket_dir, exist_ok=True)
+    RenderServer(args.socket).serve_forever()
+
+
+def get_cache_parser():
+    parser = argparse.ArgumentParser(
+        prog="yerba cache",
+        description="Inspect and prune the caches in ./media."
+    )
+    actions = parser.add_subparsers(dest="action", required=True)
+    actions.add_parser(
+        "stats", help="show the entries and size of each cache, and its "
+                      "hits and misses in the last builds"
+    )
+    prune_parser = actions.add_parser(
+        "prune", help="remove the least recently used entries"
+    )
+    prune_parser.add_argument(
+        "--max-size", required=True, metavar="SIZE",
+        help="total size to keep, e.g. '2G' or '500M'"
+    )
+    prune_parser.add_argument(
+        "--dry-run", action="store_true",
+        help="only show what would be removed"
+    )
+    return parser
+
+
+def print_cache_stats():
+    from .utils.cache import get_stats, format_size
+
+    stats = get_stats()
+    builds = max((s["builds"] for s in stats.values()), default=0)
+    print(f"{'cache':<14}{'entries':>9}{'size':>12}{'hits':>9}"
+          f"{'misses':>9}{'hit rate':>10}")
+    for name, s in stats.items():
+        total = s["hits"] + s["misses"]
+        rate = f"{100*s['hits']/total:.0f}%" if total else "-"
+        print(f"{name:<14}{s['entries']:>9}{format_size(s['size']):>12}"
+              f"{s['hits']:>9}{s['misses']:>9}{rate:>10}")
+    size = sum(s["size"] for s in stats.values())
+    entries = sum(s["entries"] for s in stats.values())
+    print(f"{'total':<14}{entries:>9}{format_size(size):>12}")
+    print(f"(hits and misses of the last {builds} build(s))")
+
+
+def cache_entry(argv):
+    args = get_cache_parser().parse_args(argv)
+    from .utils.cache import prune, parse_size, format_size
+
+    if args.action == "stats":
+        print_cache_stats()
+    elif args.action == "prune":
+        try:
+            max_size = parse_size(args.max_size)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            quit(1)
+        removed = prune(max_size, dry_run=args.dry_run)
+        size = format_size(sum(e.size for e in removed))
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"{verb} {len(removed)} entries ({size})")
+
+
+def get_build_parser():
+    parser = argparse.ArgumentParser(
+        prog="yerba build",
+        description="Build several presentations in the same run."
+    )
+    parser.add_argument("filenames", nargs="+", metavar="filename",
+                        help="markdown files of the presentations")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1,
+        help="number of presentations built at the same time, each one in "
+             "its own process (default: 1)"
+    )
+    parser.add_argument(
+        "--backend", choices=["cairo", "svg"], default=None,
+        help="output backend (see `yerba --help`)"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="build the presentations even if nothing changed since their "
+             "last build"
+    )
+    parser.add_argument(
+        "-k", "--keep-going", action="store_true",
+        help="replace the slides with errors by a placeholder (see "
+             "`yerba --help`)"
+    )
+    parser.add_argument(
+        "--thumbnails", type=thumbnail_width, default=None, metavar="WIDTH",
+        help="write PNG thumbnails of the subslides (see `yerba --help`)"
+    )
+    parser.add_argument(
+        "--reproducible", action="store_true",
+        help="write the same PDF for the same input (see `yerba --help`)"
+    )
+    parser.add_argument(
+        "--shared-cache", default="./media/yerba_cache", metavar="DIR",
+        help="folder for the caches shared by all the presentations (TeX "
+             "formats and resampled images, default: ./media/yerba_cache)"
+    )
+    return parser
+
+
+def build_entry(argv):
+    args = get_build_parser().parse_args(argv)
+    from .batch import build_decks
+
+    filenames = []
+    for filename in args.filenames:
+        if not os.path.exists(filename) and os.path.exists(filename+".md"):
             filename = filename+".md"
-        else:
-            logger.error(f"File '{filename}' not found")
-            quit()
+        if not os.path.exists(filename):
+            print(f"File '{filename}' not found", file=sys.stderr)
+            quit(1)
+        filenames.append(filename)
+
+    def report(result):
+        print(f"{result.status:>10}  {result.filename} "
+              f"({result.seconds:.1f} s)")
+
+    results = build_decks(filenames, jobs=args.jobs,
+                          overrides=get_parser_params_overrides(args),
+                          force=args.force, shared_dir=args.shared_cache,
+                          on_result=report)
+
+    failed = [r for r in results if r.status == "failed"]
+    print(f"{len(results)} presentation(s), {len(failed)} failed")
+    for r in failed:
+        print(f"  {r.filename}: {r.error}", file=sys.stderr)
+    if failed:
+        quit(1)
+
+
+subcommands = {
+    "serve": serve_entry,
+    "cache": cache_entry,
+    "build": build_entry,
+}
+
+
+def cli_entry():
+    argv = sys.argv[1:]
+    if argv and argv[0] in subcommands:
+        return subcommands[argv[0]](argv[1:])
+
+    args = get_parser().parse_args(argv)
+
+    filename = args.filename
+    if os.path.exists(filename):
+        pass
+    elif os.path.exists(filename+".md"):
+        filename = filename+".md"
     else:
-        logger.error("Too many args")
+        print(f"File '{filename}' not found", file=sys.stderr)
         quit()
 
-    main_rutine = MainRutine(filename)
-    main_rutine.run()
+    overrides = get_parser_params_overrides(args)
+    output_filename = str(os.path.splitext(filename)[0])+".pdf"
+
+    partial = args.slides is not None or bool(args.slide_title)
+    if partial:
+        from .utils.parser import parse_slide_ranges
+        try:
+            slide_numbers = parse_slide_ranges(args.slides or "")
+        except ValueError:
+            print(f"Invalid slide ranges {args.slides!r}", file=sys.stderr)
+            quit(1)
+
+    if not args.check and not partial:
+        from .batch import build_presentation, BuildError
+
+        try:
+            built = build_presentation(filename, overrides, force=args.force)
+        except BuildError as e:
+            print(e, file=sys.stderr)
+            quit(1)
+        if not built:
+            print(f"Nothing changed, '{output_filename}' is up to date")
+        if args.timings:
+            timings.report()
+        return
+
+    with timings.measure("import manim"):
+        import manim  # noqa: F401
+    with timings.measure("import yerba"):
+        from .main_rutine import MainRutine
+
+    main_rutine = MainRutine(filename, parser_params_overrides=overrides)
+    if args.check:
+        if not main_rutine.validate():
+            quit(1)
+    else:
+        main_rutine.run_partial(slide_numbers, args.slide_title,
+                                svg_only=args.svg_only)
+
+    if args.timings:
+        timings.report()
 
 
 if __name__ == "__main__":
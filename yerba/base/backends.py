@@ -0,0 +1,240 @@
+from __future__ import annotations
+import os
+import glob
+import time
+import shutil
+import subprocess
+
+import cairo
+from manim import config, logger
+
+from .scene import Scene, draw_scene, image_to_cairo_surface
+from .slide import SubSlide
+from .svg_writer import write_svg
+from ..defaults import parser_params
+from ..utils.memory import BoundedCache
+from ..utils.cache import cache_stats
+from ..utils.others import get_source_date_epoch, format_pdf_date
+
+
+def reuse_unchanged_file(filename, scene_hash, old_slides_dir) -> bool:
+    """
+    If the file of the last build (in `old_slides_dir`) was written from a
+    scene with the same hash, move it (and its hash) to `filename` and
+    return True.
+    """
+    if old_slides_dir is None:
+        return False
+    old_filename = os.path.join(old_slides_dir, os.path.basename(filename))
+    try:
+        with open(f"{old_filename}.hash") as f:
+            if f.read() != scene_hash:
+                return False
+    except OSError:
+        return False
+    if not os.path.exists(old_filename):
+        return False
+
+    shutil.move(old_filename, filename)
+    shutil.move(f"{old_filename}.hash", f"{filename}.hash")
+    cache_stats.hit("slides", filename)
+    return True
+
+
+def get_slide_files(slides_dir, slide_name, extension) -> list[str]:
+    """Files of the subslides of a slide (see `SubSlide.get_filename`)."""
+    return sorted(glob.glob(
+        os.path.join(glob.escape(slides_dir),
+                     f"{glob.escape(slide_name)}_subs*.{extension}")
+    ))
+
+
+def write_scene_hash(filename, scene_hash) -> None:
+    with open(f"{filename}.hash", "w") as f:
+        f.write(scene_hash)
+
+
+class SvgBackend:
+    """
+    Write each subslide to a SVG file and convert all of them to a PDF with
+    rsvg-convert when the presentation is closed.
+
+    The files are gzipped (svgz) if 'svg.compress' is True.
+
+    Note that rsvg-convert embeds the raster images of each page again, so
+    images shown in several subslides are repeated in the PDF. The cairo
+    backend shares them.
+
+    If `old_slides_dir` is given, subslides whose scene didn't change since
+    the last build reuse their file from there instead of being written.
+    """
+
+    def __init__(self, output_filename, slides_dir="./media/slides",
+                 convert=True, old_slides_dir=None):
+        self.output_filename = output_filename
+        self.slides_dir = slides_dir
+        self.old_slides_dir = old_slides_dir
+        # if False, only the svg files are written
+        self.convert = convert
+        self.written_files: list[str] = []
+        # files of the pages, in order
+        self.pages: list[str] = []
+        self.precision = float(parser_params["svg.precision"])
+        self.compress = bool(parser_params["svg.compress"])
+        self.extension = "svgz" if self.compress else "svg"
+
+    def get_scene(self, subslide: SubSlide) -> Scene:
+        return subslide.get_scene(vectorize_svg_images=False)
+
+    def write_scene(self, filename, scene: Scene) -> None:
+        scene_hash = scene.get_hash(self.precision, self.compress)
+
+        if not reuse_unchanged_file(filename, scene_hash,
+                                    self.old_slides_dir):
+            write_svg(scene, filename, precision=self.precision,
+                      compress=self.compress)
+            write_scene_hash(filename, scene_hash)
+            cache_stats.miss("slides")
+            self.written_files.append(filename)
+        self.pages.append(filename)
+
+    def add_backup_slide(self, slide_name: str) -> None:
+        # the svg files of the slide are already in `slides_dir`
+        self.pages += get_slide_files(self.slides_dir, slide_name,
+                                      self.extension)
+
+    def close(self) -> None:
+        if not self.convert:
+            return
+        svg_files = self.pages
+        size = sum(os.path.getsize(f) for f in svg_files)
+
+        # rsvg-convert writes this date instead of the current one
+        env = None
+        epoch = get_source_date_epoch()
+        if epoch is not None:
+            env = {**os.environ, "SOURCE_DATE_EPOCH": str(epoch)}
+
+        t0 = time.perf_counter()
+        subprocess.run(["rsvg-convert", "-f", "pdf",
+                        "-o", self.output_filename, *svg_files], env=env)
+        logger.info(
+            f"Converted {len(svg_files)} {self.extension} files "
+            f"({size/1e6:.2f} MB) in {time.perf_counter() - t0:.2f} s"
+        )
+
+
+class CairoPdfBackend:
+    """
+    Draw each subslide directly in a cairo PDF surface, one page per subslide,
+    as soon as its slide is written.
+
+    The scene of each subslide is also stored in `slides_dir`, so unchanged
+    slides can be drawn again in the next builds without computing them.
+    As in `SvgBackend`, unchanged subslides reuse their scene file from
+    `old_slides_dir`.
+    """
+    extension = "scene"
+
+    def __init__(self, output_filename, slides_dir="./media/slides",
+                 old_slides_dir=None):
+        self.output_filename = output_filename
+        self.slides_dir = slides_dir
+        self.old_slides_dir = old_slides_dir
+        self.written_files: list[str] = []
+        # files of the pages, in order
+        self.pages: list[str] = []
+        self.compression = parser_params["cache.compression"]
+
+        # write to a temporary file so a failed build doesn't leave a broken
+        # PDF behind
+        self.tmp_filename = f"{output_filename}.part"
+        self.surface = cairo.PDFSurface(self.tmp_filename,
+                                        config.pixel_width,
+                                        config.pixel_height)
+        epoch = get_source_date_epoch()
+        if epoch is not None:
+            for key in (cairo.PDFMetadata.CREATE_DATE,
+                        cairo.PDFMetadata.MOD_DATE):
+                self.surface.set_metadata(key, format_pdf_date(epoch))
+        self.ctx = cairo.Context(self.surface)
+        self.image_surfaces = BoundedCache(
+            int(parser_params["memory.image_cache_size"]))
+
+    def get_image_surface(self, filename):
+        if filename not in self.image_surfaces:
+            self.image_surfaces[filename] = image_to_cairo_surface(filename)
+        return self.image_surfaces[filename]
+
+    def draw_page(self, scene: Scene) -> None:
+        draw_scene(self.ctx, scene, get_image_surface=self.get_image_surface)
+        self.surface.show_page()
+
+    def get_scene(self, subslide: SubSlide) -> Scene:
+        return subslide.get_scene()
+
+    def write_scene(self, filename, scene: Scene) -> None:
+        scene_hash = scene.get_hash()
+
+        if not reuse_unchanged_file(filename, scene_hash,
+                                    self.old_slides_dir):
+            scene.dump(filename, self.compression)
+            write_scene_hash(filename, scene_hash)
+            cache_stats.miss("slides")
+            self.written_files.append(filename)
+        self.draw_page(scene)
+        self.pages.append(filename)
+
+    def add_backup_slide(self, slide_name: str) -> None:
+        for f in get_slide_files(self.slides_dir, slide_name,
+                                 self.extension):
+            self.draw_page(Scene.load(f))
+            self.pages.append(f)
+
+    def close(self) -> None:
+        self.surface.finish()
+        os.replace(self.tmp_filename, self.output_filename)
+
+
+class BackgroundBackend:
+    """
+    Wrap a backend so that only the scenes of the subslides are computed
+    when a slide is written (they need the mobjects). The files and PDF pages
+    are written by the output thread of a `BuildOrchestrator`, in order,
+    while the next slides are computed.
+    """
+
+    def __init__(self, backend, orchestrator) -> None:
+        self.backend = backend
+        self.orchestrator = orchestrator
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def write_scene(self, filename, scene: Scene) -> None:
+        self.orchestrator.submit_output(self.backend.write_scene, filename,
+                                        scene)
+
+    def add_backup_slide(self, slide_name: str) -> None:
+        self.orchestrator.submit_output(self.backend.add_backup_slide,
+                                        slide_name)
+
+    def close(self) -> None:
+        self.orchestrator.submit_output(self.backend.close)
+        self.orchestrator.flush()
+
+
+backends: dict = {
+    "cairo": CairoPdfBackend,
+    "svg": SvgBackend,
+}
+
+
+def get_backend(name, output_filename, slides_dir="./media/slides",
+                old_slides_dir=None):
+    if name not in backends:
+        raise ValueError(
+            f"'output.backend' must be one of {list(backends)}, not {name!r}"
+        )
+    return backends[name](output_filename, slides_dir=slides_dir,
+                          old_slides_dir=old_slides_dir)
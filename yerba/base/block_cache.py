@@ -0,0 +1,172 @@
+from __future__ import annotations
+import io
+import os
+import pickle
+import hashlib
+from contextlib import contextmanager
+
+import manim
+from manim import logger
+
+from .box import Box
+from ..utils.others import get_cache_dir
+from ..utils.fingerprint import get_yerba_version
+from ..utils.cache import write_cache_file, open_cache_file
+from ..defaults import parser_params
+from ..globals import get_ids
+
+# methods that change the slide in a way that can't be replayed by only adding
+# the recorded mobjects again
+_NOT_REPLAYABLE_METHODS = (
+    "pause", "remove", "apply", "modify", "become", "mod", "app", "bec",
+    "set_box", "def_grid", "new_slide",
+)
+
+
+class _MobjectPickler(pickle.Pickler):
+    """
+    Pickler that stores boxes as references. Named boxes are stored by name and
+    the rest by their geometry, so the pickled mobjects don't drag the boxes
+    (and all the mobjects inside them) along.
+    """
+
+    def __init__(self, file, named_boxes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.box_names = {}
+        for name, box in named_boxes.__dict__.items():
+            if name != "active":
+                self.box_names.setdefault(id(box), name)
+        self.box_idx = {}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, Box):
+            return None
+        if id(obj) in self.box_names:
+            return ("named_box", self.box_names[id(obj)])
+        idx = self.box_idx.setdefault(id(obj), len(self.box_idx))
+        return ("box", idx, obj.center.copy(), obj.width, obj.height,
+                obj.arrange, obj.arrange_buff, obj.is_null, obj.is_unique)
+
+
+class _MobjectUnpickler(pickle.Unpickler):
+    def __init__(self, file, named_boxes):
+        super().__init__(file)
+        self.named_boxes = named_boxes
+        self.boxes = {}
+
+    def persistent_load(self, pid):
+        if pid[0] == "named_box":
+            return getattr(self.named_boxes, pid[1])
+        _, idx, center, width, height, arrange, buff, is_null, is_unique = pid
+        if idx not in self.boxes:
+            self.boxes[idx] = Box(center, width, height, arrange=arrange,
+                                  arrange_buff=buff, is_null=is_null,
+                                  is_unique=is_unique)
+        return self.boxes[idx]
+
+
+class PythonBlockRecorder:
+    """
+    Record the mobjects added by a `python yerba` block so they can be
+    replayed in the next builds without running the block again.
+    """
+
+    def __init__(self, presentation):
+        self.p = presentation
+        self.calls: list[tuple[list, object]] = []
+        self.replayable: bool = True
+
+    @contextmanager
+    def record(self):
+        p = self.p
+        original_add = p.add
+
+        def add(mobjects, idx=-1, box=None):
+            if idx != -1:
+                self.replayable = False
+            out = original_add(mobjects, idx=idx, box=box)
+            if not isinstance(mobjects, list):
+                mobjects = [mobjects]
+            self.calls.append((mobjects, box))
+            return out
+
+        def not_replayable(method):
+            def f(*args, **kwargs):
+                self.replayable = False
+                return method(*args, **kwargs)
+            return f
+
+        n_linked_positions = len(p.current_slide.linked_positions)
+        ids_version = get_ids().version
+
+        p.add = add
+        for name in _NOT_REPLAYABLE_METHODS:
+            setattr(p, name, not_replayable(getattr(p, name)))
+        try:
+            yield self
+        finally:
+            del p.add
+            for name in _NOT_REPLAYABLE_METHODS:
+                delattr(p, name)
+
+        if (len(p.current_slide.linked_positions) != n_linked_positions
+                or get_ids().version != ids_version):
+            self.replayable = False
+
+    def dump(self, filename) -> bool:
+        if not self.replayable:
+            logger.warning(
+                "This python block does more than adding mobjects, so it "
+                "can't be cached. Remove 'cache=True' to hide this warning."
+            )
+            return False
+
+        f = io.BytesIO()
+        try:
+            _MobjectPickler(f, self.p.named_boxes).dump(self.calls)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.warning(f"This python block can't be cached: {e}")
+            return False
+
+        write_cache_file(filename, f.getvalue(),
+                         parser_params["cache.compression"])
+        return True
+
+    @staticmethod
+    def replay(presentation, filename) -> bool:
+        """
+        Add the mobjects recorded in `filename`. Returns False, without
+        adding anything, if the file can't be read (e.g. it was written by
+        other versions of the libraries, or it is corrupt), so the block is
+        run instead.
+        """
+        try:
+            with open_cache_file(filename) as f:
+                calls = _MobjectUnpickler(f, presentation.named_boxes).load()
+        except Exception as e:
+            logger.debug(f"Cached python block '{filename}' can't be read: "
+                         f"{e}")
+            return False
+        for mobjects, box in calls:
+            presentation.add(mobjects, box=box)
+        return True
+
+
+def get_python_block_cache_filename(presentation, content) -> str:
+    """
+    The key of a cached python block is its source plus the inputs it can
+    read from the presentation: the template parameters, the colors, the
+    active box and the slide and subslide numbers. The versions of yerba and
+    manim are also part of it, since the mobjects are pickled.
+    """
+    box = presentation.get_box("active")
+    key = repr((
+        content,
+        get_yerba_version(), manim.__version__,
+        presentation.slide_number, presentation.subslide_number,
+        sorted(presentation.template_params.items()),
+        sorted(presentation.colors.items()),
+        tuple(box.center), box.width, box.height, box.arrange,
+    ))
+    h = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return os.path.join(get_cache_dir("python_yerba"), f"{h}.pkl")
@@ -7,8 +7,7 @@ from ..utils.constants import (
     UP, DOWN, LEFT, RIGHT, ORIGIN, SLIDE_HEIGHT, SLIDE_WIDTH,
     LEFT_EDGE, RIGHT_EDGE, SLIDE_X_RAD, SLIDE_Y_RAD, TOP_EDGE, BOTTOM_EDGE, UL, DR
 )
-from ..utils.others import (restructure_list_to_exclude_certain_family_members,
-                            replace_in_list)
+from .scene_index import SceneIndex
 
 
 class Box():
@@ -27,6 +26,7 @@ class Box():
 
         self.grid: dict[str, Box] | None = None
         self.mobjects: list = []
+        self.index = SceneIndex()
 
     @classmethod
     def from_vertex(cls, ul_vertex: tuple[float, float],
@@ -116,19 +116,19 @@ class Box():
                         height_units="manim")
 
         self.mobjects.append(mobject)
+        self.index.add_roots([mobject])
 
     def remove(self, mobjects):
         """Remove specified mobjects from the box."""
-        new_l = restructure_list_to_exclude_certain_family_members(
-            self.mobjects, mobjects)
-        self.mobjects = new_l
+        self.mobjects = self.index.remove(mobjects, self.mobjects)
 
     def replace(self, old_mo, new_mo):
-        """Remove specified mobjects from the box."""
-        replace_in_list(self.mobjects, old_mo, new_mo)
+        """Replace a mobject of the box (in place)."""
+        self.index.replace(old_mo, new_mo, self.mobjects)
 
     def remove_all_mobjects(self) -> None:
         self.mobjects = []
+        self.index.invalidate()
 
     def auto_arrange(self) -> None:
         """TODO(bersp): DOC"""
@@ -1,14 +1,76 @@
 import os
 import re
+import copy
+import hashlib
 import subprocess
 import shutil
-from manim import VGroup, Rectangle
+from functools import lru_cache
+from manim import VGroup, Rectangle, SVGMobject, logger
 from xml.etree import ElementTree
-from PIL import Image
 
 from ..utils.constants import SLIDE_X_RAD, SLIDE_Y_RAD, TO_PX, UL
-from ..defaults import colors
+from ..defaults import colors, parser_params
 from ..base.ptext import Ptex
+from ..utils.others import get_cache_dir
+from ..utils.images import get_resampled_image, get_image_size, get_file_hash
+from ..utils.orchestrator import current_orchestrator
+from ..utils.cache import cache_stats
+
+
+@lru_cache(maxsize=64)
+def _pdf_to_svg(filename, size, mtime_ns, backend) -> str:
+    assert backend == "poppler" or backend == "internal", (
+        "Backend must be 'poppler' or 'internal'"
+    )
+    opts = ["--export-plain-svg",
+            "--export-type=svg",
+            "--export-filename=-"]
+    if backend == "poppler":
+        opts.append("--pdf-poppler")
+    s = subprocess.run(["inkscape", *opts, filename],
+                       stdout=subprocess.PIPE, stderr=open(os.devnull, "w")
+                       ).stdout.decode("utf-8")
+
+    return s
+
+
+def convert_pdf_to_svg(filename, backend="poppler") -> str:
+    """
+    Convert the first page of a PDF to svg with Inkscape (cached by size and
+    mtime of the file).
+    """
+    st = os.stat(filename)
+    return _pdf_to_svg(filename, st.st_size, st.st_mtime_ns, backend)
+
+
+def load_image_data(func, *args):
+    """
+    Call one of the cached image loaders, waiting for it first if it is
+    being prefetched (see `prefetch_image`).
+    """
+    orchestrator = current_orchestrator.get()
+    if orchestrator is not None:
+        orchestrator.wait_for(func, *args)
+    return func(*args)
+
+
+def prefetch_image(orchestrator, filename, *_, backend="poppler",
+                   draft_mode=False, **__) -> None:
+    """
+    Start loading an image of an `add_image` command (same arguments) in the
+    prefetch pool of the orchestrator: the size and hash of raster images
+    and the svg of PDF images.
+    """
+    if draft_mode or not isinstance(filename, str):
+        return
+    if not os.path.exists(filename):
+        return
+    if filename.split('.')[-1].lower() == 'pdf':
+        if shutil.which("inkscape"):
+            orchestrator.prefetch(convert_pdf_to_svg, filename, backend)
+    else:
+        orchestrator.prefetch(get_image_size, filename)
+        orchestrator.prefetch(get_file_hash, filename)
 
 
 class ImageSvgBase(VGroup):
@@ -87,22 +149,33 @@ class ImageSvg(ImageSvgBase):
     def __init__(self, filename, width=None, height=None,
                  draft_mode=False, **_):
 
-        fw, fh = Image.open(filename).size
+        fw, fh = load_image_data(get_image_size, filename)
         width, height = self._get_width_and_height(width, height, fw, fh)
 
         super().__init__(filename, width, height, draft_mode)
 
-    def get_svg_str(self):
-        x0, y0, w, h = self._manim_to_svg_coords()
-        img_base64 = (
-            subprocess.run(["base64", self.filename],
-                           stdout=subprocess.PIPE)
-            .stdout.decode("utf-8").replace("\n", "")
+    def get_display_filename(self) -> str:
+        """
+        Return the file of the image resampled to the size at which it is
+        displayed ('images.target_dpi').
+        """
+        _, _, w, h = self._manim_to_svg_coords()
+        load_image_data(get_file_hash, self.filename)
+        return get_resampled_image(
+            self.filename, w, h,
+            target_dpi=parser_params["images.target_dpi"],
+            jpeg_quality=parser_params["images.jpeg_quality"]
         )
-        s = (f'<image width="{w}" height="{h}" x="{x0}" y="{y0}" '
-             f'href="data:image/png;base64,{img_base64}"/>')
 
-        return s
+
+@lru_cache(maxsize=None)
+def warn_vectorized_pdf_image(filename) -> None:
+    # once per file
+    logger.warning(
+        f"The cairo backend draws the PDF image '{filename}' without its "
+        "clip paths, gradients and raster images, use '--backend svg' if "
+        "it doesn't look right."
+    )
 
 
 class ImagePDFSvg(ImageSvgBase):
@@ -131,17 +204,48 @@ class ImagePDFSvg(ImageSvgBase):
         s = ElementTree.tostring(self.xml_tree, encoding='unicode')
         return s
 
-    def _get_svg_str_raw(self, filename, backend):
-        assert backend == "poppler" or backend == "internal", (
-            "Backend must be 'poppler' or 'internal'"
-        )
-        opts = ["--export-plain-svg",
-                "--export-type=svg",
-                "--export-filename=-"]
-        if backend == "poppler":
-            opts.append("--pdf-poppler")
-        s = subprocess.run(["inkscape", *opts, filename],
-                           stdout=subprocess.PIPE, stderr=open(os.devnull, "w")
-                           ).stdout.decode("utf-8")
+    def get_vector_mobject(self) -> SVGMobject:
+        """
+        Return the image as a SVGMobject with the size and position of this
+        mobject (used by backends that can't embed svg images). Manim's svg
+        parser ignores clip paths, gradients and embedded raster images, so
+        they are lost.
+        """
+        warn_vectorized_pdf_image(self.filename)
+        tree = copy.deepcopy(self.xml_tree)
+        for attr in ("x", "y"):
+            tree.attrib.pop(attr, None)
+
+        # add an invisible rectangle that covers the whole page, so the
+        # mobject is fitted using the page instead of its content
+        view_box = tree.get("viewBox")
+        if view_box is not None:
+            x, y, w, h = view_box.replace(",", " ").split()
+        else:
+            x, y = "0", "0"
+            w = tree.get("width").replace("pt", "")
+            h = tree.get("height").replace("pt", "")
+        ns = tree.tag[:-len("svg")]
+        page = ElementTree.Element(f"{ns}rect", dict(
+            x=x, y=y, width=w, height=h, style="fill:none;stroke:none"
+        ))
+        tree.insert(0, page)
+
+        svg_str = ElementTree.tostring(tree, encoding='unicode')
+        svg_hash = hashlib.sha256(svg_str.encode()).hexdigest()[:32]
+        svg_file = os.path.join(get_cache_dir("pdf_images"), f"{svg_hash}.svg")
+        if os.path.exists(svg_file):
+            cache_stats.hit("pdf_images", svg_file)
+        else:
+            cache_stats.miss("pdf_images")
+            with open(svg_file, "w") as f:
+                f.write(svg_str)
 
-        return s
+        mo = SVGMobject(svg_file, should_center=False, height=None)
+        mo.stretch_to_fit_width(self.width)
+        mo.stretch_to_fit_height(self.height)
+        mo.move_to(self.get_center())
+        return mo
+
+    def _get_svg_str_raw(self, filename, backend):
+        return load_image_data(convert_pdf_to_svg, filename, backend)
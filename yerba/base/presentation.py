@@ -1,20 +1,31 @@
 from __future__ import annotations
 import os
+import random
 import shutil
 import importlib
 from collections import defaultdict
 from typing import Callable, Iterable, Any
+import numpy as np
 from mdformat.renderer import MDRenderer
 
 from manim import Mobject, VMobject, logger
 
 from .slide import Slide
 from .box import Box, NamedBoxes
+from .backends import BackgroundBackend, get_backend
 from ..utils.latex import YerbaRenderers
-from ..globals import g_ids
+from ..globals import current_ids, get_ids
 from ..utils.others import LinkedPositions, exec_and_handle_exeption
+from ..utils.memory import (
+    MemoryReporter, bound_manim_svg_cache, release_memory
+)
+from ..utils.commands import (
+    Command, parse_inline_command, parse_block_command, get_command_lines,
+    iter_commands
+)
+from ..utils.parser import get_markdownit_nodes
 from ..properties import funcs_from_props
-from ..defaults import colors, codeblocks_namedict
+from ..defaults import colors, parser_params
 
 from manim import *
 
@@ -69,7 +80,8 @@ class _Presentation:
     background: Callable
     do_after_create_new_slide: Callable
 
-    def __init__(self, output_filename, *args, **kwargs) -> None:
+    def __init__(self, output_filename, *args, backend=None,
+                 orchestrator=None, **kwargs) -> None:
         self.outout_filename = output_filename
 
         super().__init__(*args, **kwargs)
@@ -81,13 +93,48 @@ class _Presentation:
         self.renderer: MDRenderer = MDRenderer()
         self.yerba_renderers: YerbaRenderers = YerbaRenderers()
 
-    def new_slide(self, slide_number=None) -> Slide:
-        g_ids.clear()
+        if backend is None:
+            backend = get_backend(parser_params["output.backend"],
+                                  output_filename,
+                                  old_slides_dir="./media/old_slides")
+        if orchestrator is not None:
+            # write the output while the next slides are computed
+            backend = BackgroundBackend(backend, orchestrator)
+        self.backend = backend
+
+        bound_manim_svg_cache(int(parser_params["memory.svg_cache_size"]))
+        self.memory_reporter: MemoryReporter | None = None
+        if parser_params["memory.report"]:
+            self.memory_reporter = MemoryReporter(
+                use_tracemalloc=parser_params["memory.report"] == "tracemalloc"
+            )
+
+    def write_current_slide(self) -> None:
+        """
+        Write the current slide with the backend. In streaming mode
+        ('memory.streaming'), the slide, its ids and the mobjects of the
+        boxes are dropped once it is written (so are the parsed svg of its
+        PDF images) and manim's SVG cache is emptied.
+        """
+        if self.current_slide is None:
+            return
+        slide_number = self.current_slide.slide_number
+        self.current_slide.write(self.backend)
+
+        if parser_params["memory.streaming"]:
+            self.current_slide = None
+            current_ids.set(None)
+            self.named_boxes.remove_all_mobjects()
+            release_memory(clear_svg_cache=True)
+
+        if self.memory_reporter is not None:
+            self.memory_reporter.slide_written(slide_number)
+
+    def new_slide(self, slide_number=None, name=None) -> Slide:
         self.named_boxes.set_current_box('new_slide_default')
 
         # write last slide before create a new one
-        if self.current_slide is not None:
-            self.current_slide.write()
+        self.write_current_slide()
 
         self.named_boxes.remove_all_mobjects()
 
@@ -96,21 +143,63 @@ class _Presentation:
         else:
             self.slide_number = slide_number
 
+        # seeded with the slide number, so the random parts of the slides
+        # (e.g. the background) are the same in every build and the slides
+        # that didn't change can be reused
+        seed = [int(self.template_params["random_seed"]), self.slide_number]
+        self.rng = np.random.default_rng(seed)
+        if parser_params["output.reproducible"]:
+            # the global generators are only reset on request, since python
+            # blocks may rely on them
+            np.random.seed(seed)
+            random.seed(f"{seed[0]}-{seed[1]}")
+
         background = self.background()
-        s = Slide(self.slide_number, background=background)
+        s = Slide(self.slide_number, background=background, name=name)
         self.current_slide = s
+        current_ids.set(s.ids)
         self.subslide_number = self.current_slide.subslide_number
 
         self.do_after_create_new_slide()
 
         return self.current_slide
 
+    def close_slide(self) -> None:
+        """Write the current slide now, instead of when the next one starts."""
+        self.write_current_slide()
+        self.current_slide = None
+
+    def add_error_slide(self, slide_number, name, message) -> None:
+        """
+        Write a slide that only shows an error message, in place of a slide
+        that failed (see 'errors.keep_going'). The slide being computed is
+        discarded.
+        """
+        self.current_slide = None
+        self.new_slide(slide_number=slide_number, name=name)
+
+        lines = [line[:100] for line in message.splitlines()[:12]]
+        text_mo = Text("\n".join(lines), font="Monospace", font_size=18,
+                       color=colors["RED"])
+        box = self.get_box("full_with_margins")
+        if text_mo.width > box.width:
+            text_mo.scale_to_fit_width(box.width)
+        self.add(text_mo, box=box)
+        self.close_slide()
+
+    def add_backup_slide(self, slide_name) -> None:
+        """
+        Add a slide that was written in a previous build (its files must be
+        already in the slides folder). `slide_name` is the name of its files
+        (see `SubSlide`).
+        """
+        self.write_current_slide()
+        self.current_slide = None
+        self.backend.add_backup_slide(slide_name)
+
     def close(self) -> None:
-        if self.current_slide:
-            self.current_slide.write()
-        os.system(
-            f"rsvg-convert -f pdf -o {self.outout_filename} ./media/slides/*.svg"
-        )
+        self.write_current_slide()
+        self.backend.close()
 
     def set_box(self, box, arrange=None):
         box = self.get_box(box)
@@ -118,16 +207,18 @@ class _Presentation:
             box.arrange = arrange
         self.named_boxes.set_current_box(box)
 
-    def get_box(self, box) -> Box:
+    def get_box(self, box, named_boxes=None) -> Box:
         err_msg = f"{box!r} is not a named box or a box instance"
+        if named_boxes is None:
+            named_boxes = self.named_boxes
         if isinstance(box, Box):
             return box
         elif box == "null":
             return Box.get_null_box()
         elif isinstance(box, str):
             pos, *grid_idx = box.split('.')
-            if hasattr(self.named_boxes, pos):
-                box = getattr(self.named_boxes, pos)
+            if hasattr(named_boxes, pos):
+                box = getattr(named_boxes, pos)
             else:
                 raise ValueError(err_msg)
 
@@ -190,11 +281,7 @@ class _Presentation:
         else:
             modified_mobject = mobject.copy()
             if transfer_id:
-                assert mobject in g_ids[transfer_id], (
-                    f"The original object does not have the id {transfer_id}"
-                )
-                g_ids[transfer_id].remove(mobject)
-                g_ids[transfer_id].append(modified_mobject)
+                get_ids().transfer(transfer_id, mobject, modified_mobject)
 
         if isinstance(funcs, Callable):
             funcs(modified_mobject, *f_args, **f_kwargs)
@@ -284,19 +371,21 @@ class _Presentation:
 
     def apply(self, mo_or_id, *args, **kwargs):
         if isinstance(mo_or_id, int):
-            assert mo_or_id in g_ids, f"id {mo_or_id} is not defined"
+            ids = get_ids()
+            assert mo_or_id in ids, f"id {mo_or_id} is not defined"
             return [self._apply_func_to_mobject(mo, *args, **kwargs)
-                    for mo in g_ids[mo_or_id]]
+                    for mo in ids.get(mo_or_id)]
         else:
             return self._apply_func_to_mobject(mo_or_id, *args, **kwargs)
 
     def modify(self, mo_or_id, *args, **kwargs):
         if isinstance(mo_or_id, int):
-            assert mo_or_id in g_ids, f"id {mo_or_id} is not defined"
+            ids = get_ids()
+            assert mo_or_id in ids, f"id {mo_or_id} is not defined"
             return [
                 self._modify_mobject_props(
                     mo, transfer_id=mo_or_id, *args, **kwargs
-                ) for mo in g_ids[mo_or_id].copy()
+                ) for mo in ids.get(mo_or_id)
             ]
         else:
             return self._modify_mobject_props(mo_or_id,
@@ -307,12 +396,13 @@ class _Presentation:
         if self.current_slide is None:
             raise ValueError("The presentation does not have any slide")
 
+        ids = get_ids()
         if isinstance(old, int):
-            assert old in g_ids, f"id {old} is not defined"
-            old = g_ids[old][0]
+            assert old in ids, f"id {old} is not defined"
+            old = ids.first(old)
         if isinstance(new, int):
-            assert new in g_ids, f"id {new} is not defined"
-            new = g_ids[new][0]
+            assert new in ids, f"id {new} is not defined"
+            new = ids.first(new)
 
         if "position" in kwargs:
             kwargs["position"] = {
@@ -354,12 +444,12 @@ class _MdComputations:
         elif node.type == "blockquote":
             return self.compute_inline_command(node, **f_kwargs)
         elif (node.type == "fence" and node.tag == "code"):
-            for block_type, names in codeblocks_namedict.items():
-                node_name, *args = node.info.split('-')
-                if node_name.strip() in names:
-                    return self.compute_md_block(
-                        block_type, node.content, args
-                    )
+            command = exec_and_handle_exeption(
+                parse_block_command, msg=f"```{node.info}",
+                f_kwargs=dict(info=node.info)
+            )
+            if command is not None:
+                return self.compute_md_block(command, node.content)
         else:
             pass
 
@@ -383,38 +473,28 @@ class _MdComputations:
 
     def compute_inline_command(self, node, **f_kwargs) -> None:
 
-        if node.children:
-            text = node.children[0].children[0].content
-        else:
+        if not node.children:
             return [('', None)]
 
         out = None
-        for t in text.split("\n"):
-            if t.strip().startswith("! `"):
-                # TODO(bersp): Use regex to identify >!`(.*)`
-                command = t.replace("!", "").replace("`", "").strip()
-                command = "p = self;" + command
+        for t in get_command_lines(node):
+            command = exec_and_handle_exeption(
+                parse_inline_command, msg=f">{t}", f_kwargs=dict(line=t)
+            )
+            if command.kind == "python":
                 exec_and_handle_exeption(
-                    lambda self, c: exec(c),
-                    msg=f">{t}",
-                    f_kwargs=dict(self=self, c=command)
+                    self._exec_python_command, msg=f">{t}",
+                    f_kwargs=dict(command=command)
                 )
-
-            elif t.strip().startswith("!"):
-                command, *str_args = (t.replace("!", "").strip()
-                                      .split("-", maxsplit=1))
-                command = command.strip().replace(" ", "_")
+            else:
                 out = exec_and_handle_exeption(
                     self._exec_inline_command, msg=f">{t}",
-                    f_kwargs=dict(
-                        command=command, str_args=str_args, f_kwargs=f_kwargs
-                    )
+                    f_kwargs=dict(command=command, f_kwargs=f_kwargs)
                 )
         return out
 
-    def compute_md_block(self, block_type: str, content: str, args: list[str]):
-        self._exec_block_command(block_type=block_type,
-                                 content=content, args=args)
+    def compute_md_block(self, command: Command, content: str):
+        self._exec_block_command(command=command, content=content)
 
     def compute_paragraph(self, node, **f_kwargs):
         paragraph = self.render_md(node)
@@ -423,16 +503,102 @@ class _MdComputations:
             msg=paragraph, f_kwargs=dict(text=paragraph, **f_kwargs)
         )
 
-    def _exec_inline_command(self, command, str_args, f_kwargs=None):
+    # -- TeX snippets, to compile them in advance
+
+    def get_tex_jobs(self, slides) -> dict[int, list[tuple]]:
+        """
+        Guess the TeX snippets (see `get_tex_jobs` in ptext) that computing
+        `slides` compiles, by slide number, so they can be compiled in
+        advance. `slides` must be all the slides, in order.
+
+        The active box of the paragraphs is followed through the `set_box`
+        and `def_grid` commands, on a copy of the named boxes. Other commands
+        and python code are ignored, so some guesses may be wrong, which only
+        costs a compilation.
+        """
+        named_boxes = NamedBoxes(**vars(self.named_boxes))
+        jobs = {}
+        for slide in slides:
+            slide_number = slide["slide_number"]
+            jobs[slide_number] = slide_jobs = []
+            try:
+                if slide_number != 0:
+                    named_boxes.set_current_box("new_slide_default")
+                    title = slide["title"].children[0].content
+                    if not title or title.lower() == "notitle":
+                        named_boxes.set_current_box("full_with_margins")
+                    else:
+                        slide_jobs += self.get_title_tex_jobs(title)
+                    slide_jobs += self.get_footer_tex_jobs(slide_number)
+
+                slide_jobs += self._get_nodes_tex_jobs(slide["content"],
+                                                       named_boxes)
+            except Exception:
+                # errors are reported when the slide is computed
+                continue
+        return jobs
+
+    def _get_nodes_tex_jobs(self, nodes, named_boxes) -> list[tuple]:
+        jobs = []
+        for node in nodes:
+            if node.type == "heading" and node.tag == "h2":
+                jobs += self.get_subtitle_tex_jobs(node.children[0].content)
+            elif node.type == "paragraph" or node.type == "math_block":
+                jobs += self.get_paragraph_tex_jobs(self.render_md(node),
+                                                    named_boxes.active)
+            elif node.type == "blockquote":
+                for command in iter_commands([node]):
+                    self._follow_box_command(command, named_boxes)
+            elif node.type == "fence" and node.tag == "code":
+                try:
+                    command = parse_block_command(node.info)
+                except SyntaxError:
+                    continue
+                if (command is not None
+                        and command.name != "python_yerba_block"):
+                    jobs += self._get_nodes_tex_jobs(
+                        get_markdownit_nodes(node.content), named_boxes
+                    )
+        return jobs
+
+    def _follow_box_command(self, command: Command, named_boxes) -> None:
+        """
+        Apply a `set_box` or `def_grid` command to `named_boxes`, if its
+        arguments are literals (the others aren't evaluated, since they could
+        have side effects).
+        """
+
+        def set_box(box, arrange=None):
+            named_boxes.set_current_box(self.get_box(box, named_boxes))
+
+        def def_grid(*args, from_box="active", **kwargs):
+            # the grid is defined in a copy, which replaces the box
+            original_box = self.get_box(from_box, named_boxes)
+            box = Box.from_box(original_box)
+            for name, b in list(vars(named_boxes).items()):
+                if b is original_box:
+                    named_boxes.add(name, box)
+            for subgrid_name, subgrid_box in box.def_grid(*args,
+                                                          **kwargs).items():
+                named_boxes.add(subgrid_name, subgrid_box)
+
+        follow = {"set_box": set_box, "def_grid": def_grid}
+        if command.kind != "inline" or command.name not in follow:
+            return
+        try:
+            args, kwargs = command.literal_args()
+        except ValueError:
+            return
+        follow[command.name](*args, **kwargs)
+
+    def _exec_python_command(self, command: Command):
+        exec(command.code, globals(), {"self": self})
+
+    def _exec_inline_command(self, command: Command, f_kwargs=None):
         f_kwargs = f_kwargs or {}
-        p = self
-        if str_args:
-            return eval(f"self.{command}({str_args[0]}, **f_kwargs)")
-        else:
-            return eval(f"self.{command}()")
+        args, kwargs = command.eval_args(globals(), {"p": self, "self": self})
+        return getattr(self, command.name)(*args, **kwargs, **f_kwargs)
 
-    def _exec_block_command(self, block_type, content, args):
-        if args:
-            return eval(f"self.{block_type}_block(content, {args[0]})")
-        else:
-            return eval(f"self.{block_type}_block(content)")
+    def _exec_block_command(self, command: Command, content):
+        args, kwargs = command.eval_args(globals(), {"p": self, "self": self})
+        return getattr(self, command.name)(content, *args, **kwargs)
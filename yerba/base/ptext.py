@@ -1,10 +1,167 @@
 from __future__ import annotations
-from manim import Tex, Text
+import os
+import hashlib
+import xml.etree.ElementTree as ET
+from functools import lru_cache
 
-from ..utils.latex import process_enhanced_text
+from manim import Tex, Text, config, logger
+from manim.mobject.text.tex_mobject import SingleStringMathTex
+
+from ..utils.latex import process_enhanced_text, get_precompiled_tex_template
 from ..utils.others import define_default_kwargs
+from ..utils.orchestrator import current_orchestrator, get_tex_svg_file
+from ..utils.cache import cache_stats
 from ..properties import funcs_from_props
-from ..globals import g_ids
+from ..globals import get_ids
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+SVG_SHAPES = {"path", "line", "rect", "circle", "ellipse", "polygon",
+              "polyline"}
+# elements whose content is only drawn when referenced
+SVG_NOT_RENDERED = {"defs", "symbol", "clipPath", "mask", "pattern",
+                    "marker"}
+
+
+@lru_cache(maxsize=256)
+def get_svg_glyph_ids(svg_filename) -> tuple[str | None, ...] | None:
+    """
+    Identify the glyphs of a dvisvgm svg file, in the same order in which
+    SVGMobject creates its submobjects. Each glyph is placed by a <use>
+    element, so its id is the hash of the outline it references. Shapes that
+    aren't glyphs (rules, for example) get None.
+
+    Returns None if the file can't be mapped to the submobjects.
+    """
+    try:
+        root = ET.parse(svg_filename).getroot()
+    except (OSError, ET.ParseError):
+        return None
+
+    paths_d = {el.get("id"): el.get("d")
+               for el in root.iter(f"{SVG_NS}path") if el.get("id")}
+
+    glyph_ids = []
+
+    def visit(el):
+        tag = el.tag.replace(SVG_NS, "", 1)
+        if tag in SVG_NOT_RENDERED:
+            return True
+        if tag == "use":
+            href = el.get(XLINK_HREF) or el.get("href") or ""
+            d = paths_d.get(href.lstrip("#"))
+            if not d:
+                # references something that isn't a single path
+                return False
+            glyph_ids.append(hashlib.sha1(d.encode()).hexdigest())
+            return True
+        if tag in SVG_SHAPES:
+            glyph_ids.append(None)
+            return True
+        return all(visit(child) for child in el)
+
+    if not visit(root):
+        return None
+    return tuple(glyph_ids)
+
+
+def set_glyph_ids(tex_mobject) -> None:
+    """
+    Tag the leaves of a Tex mobject with the `glyph_id` of the glyph they
+    come from. Leaves keep their tag when copied.
+    """
+    glyph_ids = get_svg_glyph_ids(str(tex_mobject.file_name))
+    leaves = tex_mobject.family_members_with_points()
+    if glyph_ids is None or len(glyph_ids) != len(leaves):
+        return
+    for mo, glyph_id in zip(leaves, glyph_ids):
+        mo.glyph_id = glyph_id
+
+
+STYLE_COMMANDS = {"bold": "textbf", "italic": "textit"}
+
+
+def apply_text_style(text, style) -> str:
+    if style == "regular":
+        return text
+    elif style == "bold_italic":
+        return fr"\textbf{{\textit{{{text}}}}}"
+    try:
+        command = STYLE_COMMANDS[style]
+    except KeyError:
+        raise ValueError(
+            "'style' must be 'regular', 'bold', 'italic' or 'bold_italic'"
+        )
+    return fr"\{command}{{{text}}}"
+
+
+_expression_helper = None
+# set to False if the guessed snippets don't match the files that manim
+# compiles (see `check_tex_jobs`), so they aren't compiled for nothing
+tex_jobs_enabled: bool = True
+
+
+def get_tex_jobs(text, style="regular", tex_environment="center",
+                 tex_template=None) -> list[tuple]:
+    """
+    Return the (expression, environment, template) of every TeX snippet that
+    `Ptex` compiles for `text`: the whole text and, if it has substrings with
+    props, each substring (see `MathTex._break_up_by_substrings`).
+    """
+    text, _ = process_enhanced_text(text)
+    return _get_processed_text_tex_jobs(text, style, tex_environment,
+                                        tex_template)
+
+
+def _get_processed_text_tex_jobs(text, style, tex_environment,
+                                 tex_template) -> list[tuple]:
+    # manim has no public way to get the expressions that it compiles, so
+    # they are computed with the (private) methods that Tex uses, and
+    # checked against the file of each Ptex (see `check_tex_jobs`)
+    global _expression_helper
+    if not tex_jobs_enabled:
+        return []
+    if _expression_helper is None:
+        # only used for its string methods, it doesn't compile anything
+        _expression_helper = Tex.__new__(Tex)
+        _expression_helper.substrings_to_isolate = []
+        _expression_helper.tex_to_color_map = {}
+
+    if tex_template is None:
+        tex_template = config["tex_template"]
+    else:
+        tex_template = get_precompiled_tex_template(tex_template)
+
+    tex_strings = _expression_helper._break_up_tex_strings(
+        [apply_text_style(text, style)]
+    )
+    expressions = [
+        SingleStringMathTex._get_modified_expression(_expression_helper, t)
+        for t in ["".join(tex_strings), *tex_strings]
+    ]
+    return [(e, tex_environment, tex_template)
+            for e in dict.fromkeys(expressions)]
+
+
+def check_tex_jobs(tex_mobject, jobs) -> None:
+    """
+    Check that the first guessed snippet (the whole text) is the file that
+    manim compiled for `tex_mobject`. If it isn't (e.g. another version of
+    manim changed how it builds its expressions), stop guessing snippets.
+    """
+    global tex_jobs_enabled
+    if not jobs or not tex_jobs_enabled:
+        return
+    file_name = getattr(tex_mobject, "file_name", None)
+    if file_name is None:
+        return
+    if (os.path.abspath(file_name)
+            != os.path.abspath(get_tex_svg_file(*jobs[0]))):
+        tex_jobs_enabled = False
+        logger.warning(
+            "The TeX snippets guessed for prefetching don't match the ones "
+            "compiled by this version of manim, prefetching is disabled."
+        )
 
 
 class Ptex(Tex):
@@ -13,20 +170,33 @@ class Ptex(Tex):
                  **tex_kwargs):
 
         tex_kwargs = define_default_kwargs(tex_kwargs, font_size=30)
+        if tex_kwargs.get("tex_template") is not None:
+            tex_kwargs["tex_template"] = get_precompiled_tex_template(
+                tex_kwargs["tex_template"]
+            )
         text, ismo_props_zip = process_enhanced_text(text)
 
-        if style == 'regular':
-            super().__init__(text, **tex_kwargs)
-        elif style == "bold_italic":
-            super().__init__(fr"\textbf{{\textit{{{text}}}}}", **tex_kwargs)
-        else:
-            try:
-                style = {"bold": "textbf", "italic": "textit"}[style]
-            except KeyError:
-                raise ValueError(
-                    "'style' must be 'regular', 'bold', 'italic' or 'bold_italic'"
-                )
-            super().__init__(fr"\{style}{{{text}}}", **tex_kwargs)
+        orchestrator = current_orchestrator.get()
+        tex_jobs = _get_processed_text_tex_jobs(
+            text, style,
+            tex_environment=tex_kwargs.get("tex_environment", "center"),
+            tex_template=tex_kwargs.get("tex_template")
+        )
+        for job in tex_jobs:
+            # the snippets may be being compiled in the background
+            if orchestrator is not None and orchestrator.wait_for_tex(*job):
+                cache_stats.miss("tex")
+                continue
+            svg_file = get_tex_svg_file(*job)
+            if svg_file.exists():
+                cache_stats.hit("tex", svg_file)
+            else:
+                cache_stats.miss("tex")
+
+        super().__init__(apply_text_style(text, style), **tex_kwargs)
+        check_tex_jobs(self, tex_jobs)
+
+        set_glyph_ids(self)
 
         for imo, props in ismo_props_zip:
             mo = self if imo == -1 else self.submobjects[imo]
@@ -39,9 +209,9 @@ class Ptex(Tex):
                 name = props.pop('id')
 
                 if name == 0:
-                    g_ids[name] = [mo]
+                    get_ids().set(name, [mo])
                 else:
-                    g_ids[name].append(mo)
+                    get_ids().add(name, mo)
 
                 if subslide_number is not None:
                     mo.origin_subslide_number = subslide_number
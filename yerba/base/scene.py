@@ -0,0 +1,294 @@
+from __future__ import annotations
+import pickle
+import hashlib
+import itertools as it
+from typing import NamedTuple
+
+import cairo
+import numpy as np
+from PIL import Image
+from manim import VGroup, config
+from manim.utils.family import extract_mobject_family_members
+
+from .image import ImageSvg, ImagePDFSvg
+from ..utils.images import get_file_hash
+from ..utils.cache import write_cache_file, open_cache_file
+
+CAIRO_LINE_WIDTH_MULTIPLE: float = 0.01
+
+
+class PathItem(NamedTuple):
+    """
+    Geometry and style of a VMobject.
+
+    Each subpath is a (points, closed) tuple where points are the start point
+    followed by the control points of its cubic curves, in manim units.
+
+    `glyph_id` identifies the outline of a TeX glyph (see `Ptex`), so equal
+    glyphs can be written only once.
+    """
+    subpaths: list[tuple[np.ndarray, bool]]
+    fill_rgbas: np.ndarray
+    stroke_rgbas: np.ndarray
+    stroke_width: float
+    background_stroke_rgbas: np.ndarray
+    background_stroke_width: float
+    gradient_points: np.ndarray
+    glyph_id: str | None = None
+
+
+class ImageItem(NamedTuple):
+    """A raster image placed at (x, y) with size (w, h), in pixels."""
+    filename: str
+    x: float
+    y: float
+    w: float
+    h: float
+
+
+class SvgImageItem(NamedTuple):
+    """An image given as a svg document (PDF images), in pixels."""
+    svg_str: str
+    x: float
+    y: float
+    w: float
+    h: float
+    vector_items: list[PathItem]
+
+
+class Scene(NamedTuple):
+    """
+    Everything needed to draw a subslide, without any reference to the
+    mobjects. Scenes can be pickled, so they are used to store subslides on
+    disk and to draw them in other processes.
+    """
+    pixel_width: int
+    pixel_height: int
+    frame_width: float
+    frame_height: float
+    items: list[PathItem | ImageItem | SvgImageItem]
+
+    def dump(self, filename, compression="none") -> None:
+        write_cache_file(
+            filename, pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL),
+            compression
+        )
+
+    @staticmethod
+    def load(filename) -> Scene:
+        with open_cache_file(filename) as f:
+            return pickle.load(f)
+
+    def get_hash(self, *extra) -> str:
+        """
+        Hash of the content of the scene (including the content of its
+        raster images) and of `extra` (e.g. options of the writer).
+
+        The whole scene is pickled to hash it, so the hash is only stable
+        while the pickles are: another version of python or numpy may give
+        other bytes for the same scene, which makes the unchanged subslides
+        be written again once (never reused wrongly). Random content must be
+        seeded (see `Presentation.new_slide`) for the hash to repeat.
+        """
+        h = hashlib.sha1(pickle.dumps((self, extra), protocol=4))
+        for item in self.items:
+            if isinstance(item, ImageItem):
+                h.update(get_file_hash(item.filename).encode())
+        return h.hexdigest()
+
+
+def _finite_points(points: np.ndarray) -> np.ndarray:
+    if not np.all(np.isfinite(points)):
+        return np.zeros((1, 3))
+    return points
+
+
+def path_item_from_vmobject(vmobject) -> PathItem | None:
+    points = _finite_points(vmobject.points)
+    if len(points) == 0:
+        return None
+
+    subpaths = []
+    for subpath in vmobject.gen_subpaths_from_points_2d(points):
+        quads = np.asarray(vmobject.gen_cubic_bezier_tuples_from_points(subpath))
+        if len(quads) == 0:
+            pts = subpath[:1, :2]
+        else:
+            pts = np.concatenate(
+                [quads[:1, 0, :2], quads[:, 1:, :2].reshape(-1, 2)]
+            )
+        closed = bool(
+            vmobject.consider_points_equals_2d(subpath[0], subpath[-1])
+        )
+        subpaths.append((pts, closed))
+
+    gradient_points = _finite_points(
+        np.asarray(vmobject.get_gradient_start_and_end_points())
+    )[:, :2]
+
+    return PathItem(
+        subpaths=subpaths,
+        fill_rgbas=np.asarray(vmobject.get_fill_rgbas()),
+        stroke_rgbas=np.asarray(vmobject.get_stroke_rgbas()),
+        stroke_width=float(vmobject.get_stroke_width()),
+        background_stroke_rgbas=np.asarray(
+            vmobject.get_stroke_rgbas(background=True)),
+        background_stroke_width=float(
+            vmobject.get_stroke_width(background=True)),
+        gradient_points=gradient_points,
+        glyph_id=getattr(vmobject, "glyph_id", None),
+    )
+
+
+def path_items_from_mobjects(mobjects) -> list[PathItem]:
+    items = []
+    for mo in extract_mobject_family_members(mobjects, True, True):
+        item = path_item_from_vmobject(mo)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def scene_from_mobjects(mobjects, vectorize_svg_images=True) -> Scene:
+    """
+    Build the scene of a list of top level mobjects (like
+    `SubSlide.mobjects`). As in the svg output, the images are drawn on top
+    of the vectorized mobjects.
+
+    If `vectorize_svg_images` is True, PDF images are also converted to
+    paths, so they can be drawn by backends that can't embed svg.
+    """
+    vec_mobjects = VGroup()
+    img_items = []
+    pdf_img_items = []
+
+    for mo in mobjects:
+        if isinstance(mo, ImageSvg) and mo.draft_mode is False:
+            img_items.append(ImageItem(mo.get_display_filename(),
+                                       *mo._manim_to_svg_coords()))
+        elif isinstance(mo, ImagePDFSvg) and mo.draft_mode is False:
+            if vectorize_svg_images:
+                vector_items = path_items_from_mobjects(
+                    [mo.get_vector_mobject()])
+            else:
+                vector_items = []
+            pdf_img_items.append(SvgImageItem(
+                mo.get_svg_str(), *mo._manim_to_svg_coords(),
+                vector_items=vector_items
+            ))
+        else:
+            vec_mobjects += mo
+
+    return Scene(
+        pixel_width=config.pixel_width,
+        pixel_height=config.pixel_height,
+        frame_width=config.frame_width,
+        frame_height=config.frame_height,
+        items=[*path_items_from_mobjects(vec_mobjects),
+               *img_items, *pdf_img_items],
+    )
+
+
+# -- drawing
+
+
+def _set_source_color(ctx, rgbas, gradient_points):
+    if len(rgbas) == 1:
+        ctx.set_source_rgba(*rgbas[0])
+    else:
+        pat = cairo.LinearGradient(*it.chain(*gradient_points))
+        step = 1.0 / (len(rgbas) - 1)
+        offsets = np.arange(0, 1 + step, step)
+        for rgba, offset in zip(rgbas, offsets):
+            pat.add_color_stop_rgba(offset, *rgba)
+        ctx.set_source(pat)
+
+
+def _apply_stroke(ctx, rgbas, width, gradient_points):
+    if width == 0:
+        return
+    _set_source_color(ctx, rgbas, gradient_points)
+    ctx.set_line_width(width * CAIRO_LINE_WIDTH_MULTIPLE)
+    ctx.stroke_preserve()
+
+
+def draw_path_item(ctx, item: PathItem) -> None:
+    ctx.new_path()
+    for pts, closed in item.subpaths:
+        ctx.new_sub_path()
+        ctx.move_to(*pts[0])
+        for p1, p2, p3 in zip(pts[1::3], pts[2::3], pts[3::3]):
+            ctx.curve_to(*p1, *p2, *p3)
+        if closed:
+            ctx.close_path()
+
+    _apply_stroke(ctx, item.background_stroke_rgbas,
+                  item.background_stroke_width, item.gradient_points)
+    _set_source_color(ctx, item.fill_rgbas, item.gradient_points)
+    ctx.fill_preserve()
+    _apply_stroke(ctx, item.stroke_rgbas, item.stroke_width,
+                  item.gradient_points)
+
+
+def image_to_cairo_surface(filename) -> cairo.ImageSurface:
+    """
+    Load an image as a cairo surface.
+
+    The surface is tagged with the hash of the file, so the PDF surface
+    embeds each image only once, whatever the number of pages that show it.
+    JPEG files are also attached as they are, so they are embedded without
+    being re-encoded.
+    """
+    with Image.open(filename) as src:
+        is_jpeg = src.format == "JPEG" and src.mode in ("RGB", "L")
+        img = src.convert("RGBA")
+    w, h = img.size
+    # cairo uses premultiplied alpha in native byte order (BGRA)
+    data = bytearray(img.convert("RGBa").tobytes("raw", "BGRa"))
+    stride = cairo.ImageSurface.format_stride_for_width(
+        cairo.FORMAT_ARGB32, w)
+    surface = cairo.ImageSurface.create_for_data(
+        data, cairo.FORMAT_ARGB32, w, h, stride)
+
+    surface.set_mime_data(cairo.MIME_TYPE_UNIQUE_ID,
+                          get_file_hash(filename).encode())
+    if is_jpeg:
+        with open(filename, "rb") as f:
+            surface.set_mime_data(cairo.MIME_TYPE_JPEG, f.read())
+    return surface
+
+
+def draw_image_surface(ctx, surface, x, y, w, h) -> None:
+    ctx.save()
+    ctx.translate(x, y)
+    ctx.scale(w/surface.get_width(), h/surface.get_height())
+    ctx.set_source_surface(surface, 0, 0)
+    ctx.paint()
+    ctx.restore()
+
+
+def draw_scene(ctx, scene: Scene, get_image_surface=image_to_cairo_surface):
+    """
+    Draw a scene on a cairo context whose user space is in pixels, i.e. it
+    spans `scene.pixel_width` x `scene.pixel_height` units.
+    """
+    pw, ph = scene.pixel_width, scene.pixel_height
+    fw, fh = scene.frame_width, scene.frame_height
+    px_matrix = ctx.get_matrix()
+    manim_matrix = (cairo.Matrix(pw/fw, 0, 0, -(ph/fh), pw/2, ph/2)
+                    .multiply(px_matrix))
+
+    ctx.save()
+    for item in scene.items:
+        if isinstance(item, PathItem):
+            ctx.set_matrix(manim_matrix)
+            draw_path_item(ctx, item)
+        elif isinstance(item, ImageItem):
+            ctx.set_matrix(px_matrix)
+            draw_image_surface(ctx, get_image_surface(item.filename),
+                               item.x, item.y, item.w, item.h)
+        elif isinstance(item, SvgImageItem):
+            ctx.set_matrix(manim_matrix)
+            for vector_item in item.vector_items:
+                draw_path_item(ctx, vector_item)
+    ctx.restore()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+from manim import Mobject
+
+
+def _index_of(mobjects: list, mobject) -> int | None:
+    for i, mo in enumerate(mobjects):
+        if mo is mobject:
+            return i
+    return None
+
+
+class SceneIndex:
+    """
+    Parent pointers of every family member of a list of mobjects (the
+    mobjects of a subslide or a box), so finding, removing and replacing a
+    mobject takes O(depth) instead of walking all the families.
+
+    The index doesn't keep a reference to the list of roots (so it can be
+    copied with its owner), it is passed to every method. Mobjects can be
+    changed outside the index (e.g. `become` or adding submobjects to a
+    group), so the path of a mobject is checked every time it is used, and
+    the index is rebuilt if it doesn't match.
+    """
+
+    def __init__(self):
+        self.parents: dict[int, Mobject | None] = {}
+        self.is_built: bool = False
+
+    def invalidate(self) -> None:
+        self.parents = {}
+        self.is_built = False
+
+    def rebuild(self, roots) -> None:
+        self.parents = {}
+        for mo in roots:
+            self._register(mo, None)
+        self.is_built = True
+
+    def _register(self, mobject, parent) -> None:
+        stack = [(mobject, parent)]
+        while stack:
+            mo, parent = stack.pop()
+            self.parents[id(mo)] = parent
+            stack.extend((sub, mo) for sub in mo.submobjects)
+
+    def add_roots(self, mobjects) -> None:
+        """Register mobjects added to the roots."""
+        if self.is_built:
+            for mo in mobjects:
+                self._register(mo, None)
+
+    def _get_path(self, mobject, roots) -> list | None:
+        path = [mobject]
+        while True:
+            mo = path[-1]
+            if id(mo) not in self.parents:
+                return None
+            parent = self.parents[id(mo)]
+            siblings = roots if parent is None else parent.submobjects
+            if _index_of(siblings, mo) is None:
+                return None
+            if parent is None:
+                return path[::-1]
+            path.append(parent)
+
+    def get_path(self, mobject, roots) -> list | None:
+        """
+        Return the mobjects from the root that contains `mobject` down to
+        `mobject`, or None if it isn't in `roots`.
+        """
+        if not self.is_built:
+            self.rebuild(roots)
+        path = self._get_path(mobject, roots)
+        if path is None:
+            # the index may be outdated
+            self.rebuild(roots)
+            path = self._get_path(mobject, roots)
+        return path
+
+    def contains(self, mobject, roots) -> bool:
+        return self.get_path(mobject, roots) is not None
+
+    def remove(self, mobjects, roots) -> list:
+        """
+        Return a new list of roots without `mobjects`. The groups that
+        contain a removed mobject are replaced by their other members (as in
+        `manim.Scene.remove`). Mobjects that aren't in `roots` are skipped,
+        a ValueError is raised only if none of them is found.
+        """
+        if isinstance(mobjects, Mobject):
+            mobjects = [mobjects]
+
+        roots = list(roots)
+        removed = False
+        for mobject in mobjects:
+            path = self.get_path(mobject, roots)
+            if path is None:
+                continue
+            removed = True
+
+            # the root that contains the mobject is replaced by the members
+            # of the groups in the path, except the ones in the path
+            before, after = [], []
+            for group, child in zip(path[:-1], path[1:]):
+                i = _index_of(group.submobjects, child)
+                before.extend(group.submobjects[:i])
+                after[0:0] = group.submobjects[i+1:]
+            new_roots = before + after
+            i = _index_of(roots, path[0])
+            roots[i:i+1] = new_roots
+
+            for mo in path:
+                self.parents.pop(id(mo), None)
+            for mo in new_roots:
+                self.parents[id(mo)] = None
+
+        if not removed:
+            raise ValueError("Couldn't find the mobject in the list")
+        return roots
+
+    def replace(self, old_mobject, new_mobject, roots) -> None:
+        """Replace `old_mobject` by `new_mobject` in place."""
+        path = self.get_path(old_mobject, roots)
+        if path is None:
+            raise ValueError("Couldn't find the mobject in the list")
+
+        parent = path[-2] if len(path) > 1 else None
+        siblings = roots if parent is None else parent.submobjects
+        siblings[_index_of(siblings, old_mobject)] = new_mobject
+
+        self.parents.pop(id(old_mobject), None)
+        self._register(new_mobject, parent)
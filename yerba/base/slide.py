@@ -1,4 +1,5 @@
 from __future__ import annotations
+import os
 from manim import Mobject, VGroup, Rectangle
 from collections.abc import Iterable, Callable
 
@@ -6,17 +7,18 @@ from ..defaults import colors
 from ..utils.constants import (
     SLIDE_HEIGHT, SLIDE_WIDTH, UP, LEFT, RIGHT, ORIGIN
 )
-from ..utils.others import (
-    restructure_list_to_exclude_certain_family_members, LinkedPositions
-)
+from ..utils.others import LinkedPositions
+from ..globals import IdRegistry
 from .box import Box
-from .image import ImageSvg, ImagePDFSvg
-from manim_mobject_svg import *
+from .scene_index import SceneIndex
+from .scene import Scene, scene_from_mobjects
+from .svg_writer import write_svg
 
 
 class SubSlide:
     def __init__(self, slide_number: int, subslide_number: int,
-                 background: Mobject | VGroup | None = None) -> None:
+                 background: Mobject | VGroup | None = None,
+                 name: str | None = None) -> None:
         """
         Initialize a SubSlide object.
 
@@ -28,11 +30,16 @@ class SubSlide:
             The subslide number.
         background : Mobject, optional
             Custom background (not implemented).
+        name : str, optional
+            Name of the files of the slide (see `get_deck_slides`). By
+            default, 's<slide number>'.
         """
 
         self.slide_number = slide_number
         self.subslide_number = subslide_number
+        self.name = name if name is not None else f"s{slide_number:04g}"
         self.mobjects = VGroup()
+        self.index = SceneIndex()
 
         if background is None:
             background = Rectangle(width=SLIDE_WIDTH, height=SLIDE_HEIGHT,
@@ -46,50 +53,46 @@ class SubSlide:
     def add(self, mobjects) -> None:
         """Add one or more mobjects to the subslide."""
         self.mobjects.add(*mobjects)
+        self.index.add_roots(mobjects)
 
     def remove(self, mobjects) -> None:
         """Remove specified mobjects from the subslide."""
-        new_l = restructure_list_to_exclude_certain_family_members(
-            self.mobjects, mobjects)
+        new_l = self.index.remove(mobjects, self.mobjects.submobjects)
         self.mobjects = VGroup(*new_l)
 
-    def write(self) -> None:
-        """Write the subslide to an SVG file."""
-        out_filename = (f"./media/slides/s{self.slide_number:04g}"
-                        f"_subs{self.subslide_number:04g}.svg")
-
-        vec_mobjects = VGroup()
-        img_mobjects = []
-        pdf_img_mobjects = []
-
-        for mo in self.mobjects:
-            if isinstance(mo, ImageSvg) and mo.draft_mode is False:
-                img_mobjects.append(mo)
-            elif isinstance(mo, ImagePDFSvg) and mo.draft_mode is False:
-                pdf_img_mobjects.append(mo)
-            else:
-                vec_mobjects += mo
+    def contains(self, mobject) -> bool:
+        """Check if a mobject (or any of its ancestors) is in the subslide."""
+        return self.index.contains(mobject, self.mobjects.submobjects)
 
-        vec_mobjects.to_svg(out_filename, crop=False)
+    def get_filename(self, extension, slides_dir="./media/slides") -> str:
+        return os.path.join(
+            slides_dir,
+            f"{self.name}_subs{self.subslide_number:04g}"
+            f".{extension}"
+        )
 
-        for img in img_mobjects:
-            # TODO(bersp): Figure out how to do this without coping the img
-            # shutil.copyfile(img.filename, f"./media/slides/{img.basename}")
-            self._write_img(out_filename, img.get_svg_str())
+    def get_scene(self, vectorize_svg_images=True) -> Scene:
+        """Return the scene (drawable content) of the subslide."""
+        return scene_from_mobjects(self.mobjects,
+                                   vectorize_svg_images=vectorize_svg_images)
 
-        for pimg in pdf_img_mobjects:
-            self._write_img(out_filename, pimg.get_svg_str())
+    def write(self, out_filename=None, precision=0.01, compress=False,
+              scene=None) -> None:
+        """
+        Write the subslide to an SVG (or SVGZ, if compressed) file. `scene`
+        can be given if it was already computed.
+        """
+        if out_filename is None:
+            out_filename = self.get_filename("svgz" if compress else "svg")
+        if scene is None:
+            scene = self.get_scene(vectorize_svg_images=False)
 
-    def _write_img(self, svg_file, svg_str):
-        with open(svg_file, 'r') as f:
-            t = f.read()
-        t = t.replace(r"</svg>", f"{svg_str}\n</svg>")
-        with open(svg_file, 'w') as f:
-            f.write(t)
+        write_svg(scene, out_filename, precision=precision, compress=compress)
 
 
 class Slide:
-    def __init__(self, slide_number: int, background=None) -> None:
+    def __init__(self, slide_number: int, background=None,
+                 name: str | None = None) -> None:
         """
         Initialize a Slide object.
 
@@ -97,17 +100,22 @@ class Slide:
         ----------
         slide_number : int
             The slide number.
+        name : str, optional
+            Name of the files of the slide (see `SubSlide`).
         """
 
         self.slide_number: int = slide_number
         self.subslide_number: int = 0
+        self.name: str | None = name
 
         self.subslides: list[SubSlide] = [
-            SubSlide(slide_number, self.subslide_number, background=background)
+            SubSlide(slide_number, self.subslide_number, background=background,
+                     name=name)
         ]
 
         self.linked_positions: list[LinkedPositions] = []
         self.boxes: list[Box] = []
+        self.ids: IdRegistry = IdRegistry()
 
     def add_new_subslide(self, n=1, background=None) -> None:
         """
@@ -117,7 +125,7 @@ class Slide:
             for _ in range(n):
                 self.subslide_number += 1
                 s = SubSlide(self.slide_number, self.subslide_number,
-                             background=background)
+                             background=background, name=self.name)
                 s.add(self.subslides[-1].mobjects)
 
                 self.subslides.append(s)
@@ -155,9 +163,10 @@ class Slide:
 
         return self._remove_from_subslide(mobjects, idx=-1)
 
-    def write(self) -> None:
+    def write(self, backend=None) -> None:
         """
-        Arrange mobjects in their boxes and write the all subslides to SVG files.
+        Arrange mobjects in their boxes and write the all subslides using the
+        output backend (or to SVG files if no backend is given).
         """
 
         for box in self.boxes:
@@ -165,8 +174,18 @@ class Slide:
 
         self.arrange_linked_positions()
 
-        for ss in self.subslides:
-            ss.write()
+        if backend is None:
+            for ss in self.subslides:
+                ss.write()
+            return
+
+        # compute all the scenes before writing any, so a slide that fails
+        # doesn't leave some of its pages in the output
+        scenes = [backend.get_scene(ss) for ss in self.subslides]
+        for ss, scene in zip(self.subslides, scenes):
+            backend.write_scene(
+                ss.get_filename(backend.extension, backend.slides_dir), scene
+            )
 
     def arrange_linked_positions(self):
         for lmp in self.linked_positions:
@@ -207,6 +226,11 @@ class Slide:
         self.subslides[idx].remove(mobjects)
 
     def _replace_from_last_subslide(self, old_mobject, new_mobject):
+        if not self.subslides[-1].contains(old_mobject):
+            raise ValueError(
+                f"{old_mobject!r} is not in the last subslide of slide "
+                f"{self.slide_number}"
+            )
         self._remove_from_subslide(old_mobject, idx=-1)
         self._add_to_subslide(new_mobject, idx=-1)
 
@@ -0,0 +1,287 @@
+from __future__ import annotations
+import math
+import gzip
+import base64
+
+import numpy as np
+from PIL import Image
+
+from .scene import (
+    Scene, PathItem, ImageItem, SvgImageItem, CAIRO_LINE_WIDTH_MULTIPLE
+)
+
+
+def _fmt(v: float, decimals: int = 3) -> str:
+    s = f"{v:.{decimals}f}".rstrip("0").rstrip(".")
+    return "0" if s == "-0" else s
+
+
+def _is_line(p0, p1, p2, p3, tol) -> bool:
+    """Check if the control points of a cubic curve lie on its chord."""
+    chord = p3 - p0
+    length = np.hypot(*chord)
+    if length <= tol:
+        return False
+    for q in (p1, p2):
+        v = q - p0
+        if abs(chord[0]*v[1] - chord[1]*v[0])/length > tol:
+            return False
+        t = (chord @ v)/length**2
+        if t < 0 or t > 1:
+            return False
+    return True
+
+
+def _color(rgba) -> str:
+    r, g, b = (int(round(c*255)) for c in rgba[:3])
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+class SvgWriter:
+    """
+    Write a scene as a SVG document.
+
+    Paths that come from the same glyph (see `Ptex`) are written once inside
+    <defs> and then referenced with <use> and a transform.
+
+    Coordinates are rounded to multiples of `precision` (in px), curves that
+    are straight lines are written as lines and the styles are written once
+    as CSS classes.
+    """
+
+    def __init__(self, scene: Scene, precision: float = 0.01):
+        if precision <= 0:
+            raise ValueError("'precision' must be positive")
+        self.scene = scene
+        self.precision = precision
+        self.decimals = max(0, math.ceil(-math.log10(precision)))
+        pw, ph = scene.pixel_width, scene.pixel_height
+        self.scale = np.array([pw/scene.frame_width, -ph/scene.frame_height])
+        self.offset = np.array([pw/2, ph/2])
+
+        self.defs: list[str] = []
+        self.body: list[str] = []
+        self.styles: dict[str, str] = {}
+        # glyph_id -> (symbol id, subpaths structure, points in px)
+        self.glyphs: dict[str, tuple[str, tuple, np.ndarray]] = {}
+        self.n_gradients: int = 0
+
+    def to_px(self, points: np.ndarray) -> np.ndarray:
+        return points*self.scale + self.offset
+
+    def quantize(self, values: np.ndarray) -> np.ndarray:
+        return np.round(np.asarray(values)/self.precision)*self.precision
+
+    def fmt(self, v: float) -> str:
+        return _fmt(round(v/self.precision)*self.precision, self.decimals)
+
+    def fmt_point(self, p) -> str:
+        return f"{self.fmt(p[0])} {self.fmt(p[1])}"
+
+    # -- style
+
+    def _paint(self, rgbas, gradient_points) -> tuple[str, float]:
+        if len(rgbas) == 1:
+            return _color(rgbas[0]), rgbas[0][3]
+
+        grad_id = f"gradient{self.n_gradients}"
+        self.n_gradients += 1
+        (x1, y1), (x2, y2) = self.to_px(gradient_points)
+        step = 1.0 / (len(rgbas) - 1)
+        offsets = np.arange(0, 1 + step, step)
+        stops = "".join(
+            f'<stop offset="{_fmt(o)}" stop-color="{_color(c)}" '
+            f'stop-opacity="{_fmt(c[3])}"/>'
+            for c, o in zip(rgbas, offsets)
+        )
+        self.defs.append(
+            f'<linearGradient id="{grad_id}" gradientUnits="userSpaceOnUse" '
+            f'x1="{self.fmt(x1)}" y1="{self.fmt(y1)}" '
+            f'x2="{self.fmt(x2)}" y2="{self.fmt(y2)}">'
+            f'{stops}</linearGradient>'
+        )
+        return f"url(#{grad_id})", 1
+
+    def _stroke_style(self, rgbas, width, gradient_points) -> str:
+        if width == 0 or np.all(np.asarray(rgbas)[:, 3] == 0):
+            return "stroke:none"
+        paint, opacity = self._paint(rgbas, gradient_points)
+        px_width = width * CAIRO_LINE_WIDTH_MULTIPLE * self.scale[0]
+        return (f"stroke:{paint};stroke-opacity:{_fmt(opacity)};"
+                f"stroke-width:{self.fmt(px_width)};stroke-miterlimit:10")
+
+    def _fill_style(self, rgbas, gradient_points) -> str:
+        if np.all(np.asarray(rgbas)[:, 3] == 0):
+            return "fill:none"
+        paint, opacity = self._paint(rgbas, gradient_points)
+        return f"fill:{paint};fill-opacity:{_fmt(opacity)}"
+
+    # -- paths
+
+    def _class(self, style: str) -> str:
+        if style not in self.styles:
+            self.styles[style] = f"s{len(self.styles)}"
+        return f'class="{self.styles[style]}"'
+
+    def _simplify_subpath(self, pts: np.ndarray) -> list[tuple]:
+        """
+        Return the commands of a subpath, as (kind, points) tuples, dropping
+        degenerate curves and merging consecutive collinear lines.
+        """
+        tol = self.precision/2
+        cmds = []
+        # start of the last command
+        last_start = None
+        for p0, p1, p2, p3 in zip(pts[:-1:3], pts[1::3], pts[2::3], pts[3::3]):
+            if np.all(np.abs(np.array([p1, p2, p3]) - p0) <= tol):
+                continue
+
+            if not _is_line(p0, p1, p2, p3, tol):
+                cmds.append(("C", (p1, p2, p3)))
+                last_start = p0
+                continue
+
+            if (cmds and cmds[-1][0] == "L"
+                    and _is_line(last_start, p0, p0, p3, tol)):
+                cmds[-1] = ("L", (p3,))
+            else:
+                cmds.append(("L", (p3,)))
+                last_start = p0
+        return cmds
+
+    def _path_d(self, subpaths_px) -> str:
+        d = []
+        for pts, closed in subpaths_px:
+            pts = self.quantize(pts)
+            cmds = self._simplify_subpath(pts)
+            if not cmds:
+                continue
+            d.append(f"M{self.fmt_point(pts[0])}")
+            last_kind = None
+            for kind, cmd_pts in cmds:
+                coords = " ".join(self.fmt_point(p) for p in cmd_pts)
+                d.append(coords if kind == last_kind else f"{kind}{coords}")
+                last_kind = kind
+            if closed:
+                d.append("Z")
+        return " ".join(d)
+
+    def _is_dedupable_glyph(self, item: PathItem) -> bool:
+        return (getattr(item, "glyph_id", None) is not None
+                and len(item.fill_rgbas) == 1
+                and item.stroke_width == 0
+                and item.background_stroke_width == 0)
+
+    def _glyph_use(self, item: PathItem, subpaths_px, d, style) -> str | None:
+        structure = tuple((len(p), closed) for p, closed in subpaths_px)
+        points = np.concatenate([p for p, _ in subpaths_px])
+
+        if item.glyph_id not in self.glyphs:
+            symbol_id = f"glyph{len(self.glyphs)}"
+            self.glyphs[item.glyph_id] = (symbol_id, structure, points)
+            self.defs.append(f'<path id="{symbol_id}" d="{d}"/>')
+            return f'<use xlink:href="#{symbol_id}" {self._class(style)}/>'
+
+        symbol_id, ref_structure, ref_points = self.glyphs[item.glyph_id]
+        if structure != ref_structure:
+            return None
+
+        # affine transform that maps the reference glyph into this one
+        src = np.column_stack([ref_points, np.ones(len(ref_points))])
+        m, *_ = np.linalg.lstsq(src, points, rcond=None)
+        if np.max(np.abs(src @ m - points)) > self.precision/2:
+            return None
+        (sa, sb), (sc, sd), (tx, ty) = m
+        # the scale factors need more precision than the coordinates
+        transform = " ".join(_fmt(v, 6) for v in (sa, sb, sc, sd, tx, ty))
+        return (f'<use xlink:href="#{symbol_id}" '
+                f'transform="matrix({transform})" {self._class(style)}/>')
+
+    def add_path(self, item: PathItem) -> None:
+        subpaths_px = [(self.to_px(pts), closed)
+                       for pts, closed in item.subpaths]
+
+        bg_stroke = self._stroke_style(item.background_stroke_rgbas,
+                                       item.background_stroke_width,
+                                       item.gradient_points)
+        d = self._path_d(subpaths_px)
+        if not d:
+            return
+
+        if bg_stroke != "stroke:none":
+            self.body.append(
+                f'<path d="{d}" {self._class(f"fill:none;{bg_stroke}")}/>'
+            )
+
+        style = ";".join([
+            self._fill_style(item.fill_rgbas, item.gradient_points),
+            self._stroke_style(item.stroke_rgbas, item.stroke_width,
+                               item.gradient_points)
+        ])
+
+        if self._is_dedupable_glyph(item):
+            use = self._glyph_use(item, subpaths_px, d, style)
+            if use is not None:
+                self.body.append(use)
+                return
+
+        self.body.append(f'<path d="{d}" {self._class(style)}/>')
+
+    # -- images
+
+    def add_image(self, item: ImageItem) -> None:
+        with Image.open(item.filename) as img:
+            mime = Image.MIME.get(img.format, "image/png")
+        with open(item.filename, "rb") as f:
+            img_base64 = base64.b64encode(f.read()).decode("ascii")
+        self.body.append(
+            f'<image x="{self.fmt(item.x)}" y="{self.fmt(item.y)}" '
+            f'width="{self.fmt(item.w)}" height="{self.fmt(item.h)}" '
+            f'preserveAspectRatio="none" '
+            f'xlink:href="data:{mime};base64,{img_base64}"/>'
+        )
+
+    def add_svg_image(self, item: SvgImageItem) -> None:
+        self.body.append(item.svg_str)
+
+    def to_string(self) -> str:
+        for item in self.scene.items:
+            if isinstance(item, PathItem):
+                self.add_path(item)
+            elif isinstance(item, ImageItem):
+                self.add_image(item)
+            elif isinstance(item, SvgImageItem):
+                self.add_svg_image(item)
+
+        css = "".join(f".{c}{{{style}}}" for style, c in self.styles.items())
+
+        pw, ph = self.scene.pixel_width, self.scene.pixel_height
+        return "\n".join([
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            f'width="{pw}pt" height="{ph}pt" viewBox="0 0 {pw} {ph}">',
+            f'<style type="text/css"><![CDATA[{css}]]></style>',
+            "<defs>", *self.defs, "</defs>",
+            *self.body,
+            "</svg>",
+            ""
+        ])
+
+
+def write_svg(scene: Scene, filename, precision: float = 0.01,
+              compress: bool = False) -> None:
+    """
+    Write a scene to a SVG file. If `compress` is True, the file is
+    gzipped (svgz), without the name and time of the file in its header, so
+    the same scene always gives the same bytes.
+    """
+    svg_str = SvgWriter(scene, precision=precision).to_string()
+    if compress:
+        with open(filename, "wb") as raw, \
+                gzip.GzipFile(filename="", mode="wb", fileobj=raw,
+                              mtime=0) as f:
+            f.write(svg_str.encode())
+    else:
+        with open(filename, "w") as f:
+            f.write(svg_str)
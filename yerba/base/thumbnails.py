@@ -0,0 +1,105 @@
+"""
+PNG thumbnails of the subslides (`yerba --thumbnails 320px`), rasterized from
+the files written by the backend (scenes with cairo, svg files with
+rsvg-convert) and cached by the hash of their scene.
+"""
+from __future__ import annotations
+import os
+import json
+import shutil
+import subprocess
+import concurrent.futures
+
+import cairo
+
+from .scene import Scene, draw_scene
+from ..utils.others import get_cache_dir
+from ..utils.images import get_file_hash
+from ..utils.cache import cache_stats
+
+
+def rasterize_page(filename, png_filename, width) -> None:
+    """Rasterize a page file (.scene, .svg or .svgz) to a PNG."""
+    tmp_filename = f"{png_filename}.{os.getpid()}.tmp"
+    if filename.endswith(".scene"):
+        scene = Scene.load(filename)
+        scale = width/scene.pixel_width
+        surface = cairo.ImageSurface(
+            cairo.FORMAT_ARGB32, width,
+            max(1, round(scene.pixel_height*scale))
+        )
+        ctx = cairo.Context(surface)
+        ctx.scale(scale, scale)
+        draw_scene(ctx, scene)
+        surface.write_to_png(tmp_filename)
+    else:
+        subprocess.run(["rsvg-convert", "-f", "png", "-w", str(width),
+                        "-o", tmp_filename, filename], check=True)
+    os.replace(tmp_filename, png_filename)
+
+
+def get_page_hash(filename) -> str:
+    try:
+        with open(f"{filename}.hash") as f:
+            return f.read()
+    except OSError:
+        return get_file_hash(filename)
+
+
+def write_thumbnails(pages, width, out_dir, slides=None, jobs=None) -> str:
+    """
+    Write a thumbnail of each page file in `out_dir`, and an index.json with
+    the pages in order. `slides` are the slides of the presentation by name
+    (see `get_deck_slides`), to add their number and title to the index.
+
+    The thumbnails are cached in ./media/yerba_cache/thumbnails by the hash
+    of the scene of the page and the width, so only the pages that changed
+    are rasterized, with `jobs` processes. Returns the filename of the index.
+    """
+    slides = slides or {}
+    cache_dir = get_cache_dir("thumbnails")
+
+    entries = []
+    # cached thumbnail -> page to rasterize
+    missing: dict[str, str] = {}
+    for page_number, page in enumerate(pages, 1):
+        page_hash = get_page_hash(page)
+        cached = os.path.join(cache_dir, f"{page_hash}_{width}.png")
+        if cached in missing:
+            pass
+        elif os.path.exists(cached):
+            cache_stats.hit("thumbnails", cached)
+        else:
+            cache_stats.miss("thumbnails")
+            missing[cached] = page
+
+        name = os.path.basename(page).split(".")[0]
+        slide_name, _, subslide = name.rpartition("_subs")
+        slide = slides.get(slide_name, {})
+        title = slide.get("title")
+        entries.append(dict(
+            page=page_number, name=name, file=f"{name}.png", hash=page_hash,
+            slide_number=slide.get("slide_number"),
+            subslide_number=int(subslide) if subslide.isdigit() else None,
+            title=None if title is None else title.children[0].content,
+            cached=cached,
+        ))
+
+    if missing:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as ex:
+            futures = [ex.submit(rasterize_page, page, cached, width)
+                       for cached, page in missing.items()]
+            for future in futures:
+                future.result()
+
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    for entry in entries:
+        shutil.copyfile(entry.pop("cached"),
+                        os.path.join(out_dir, entry["file"]))
+
+    index_filename = os.path.join(out_dir, "index.json")
+    with open(index_filename, "w") as f:
+        json.dump({"width": width, "pages": entries}, f, indent=2)
+    return index_filename
@@ -0,0 +1,191 @@
+"""
+Builds of presentations from the command line: one (`yerba deck.md`) or
+several in the same run (`yerba build a.md b.md -j N`).
+
+In a batch, each worker process imports manim once and builds its
+presentations one after the other, so they share the interpreter, the
+precompiled TeX formats and the in-memory caches. The TeX formats and
+resampled images are also stored in a folder shared by all the
+presentations ('cache.shared_dir').
+"""
+from __future__ import annotations
+import os
+import sys
+import time
+import concurrent.futures
+from typing import NamedTuple
+
+from .utils.timings import timings
+from .utils.fingerprint import (
+    get_build_fingerprint, is_build_up_to_date, save_build_fingerprint
+)
+
+
+class BuildError(Exception):
+    """The presentation was written, but some of its slides failed."""
+
+
+def build_presentation(filename, overrides=None, force=False,
+                       build_params=None) -> bool:
+    """
+    Build a presentation of the current folder, unless nothing changed since
+    the last build (see `fingerprint`) and `force` is False. Returns False
+    if it was up to date, and raises `BuildError` if some slides failed in
+    a keep-going build.
+
+    `overrides` are parser params given in the command line, and
+    `build_params` parser params that don't change the output (so they are
+    not part of the fingerprint), like the number of TeX jobs.
+    """
+    overrides = overrides or {}
+    output_filename = str(os.path.splitext(filename)[0])+".pdf"
+
+    with timings.measure("fingerprint"):
+        fingerprint = get_build_fingerprint(filename, extra=overrides)
+        up_to_date = is_build_up_to_date(filename, output_filename,
+                                         fingerprint)
+    if up_to_date and not force:
+        return False
+
+    with timings.measure("import manim"):
+        import manim  # noqa: F401
+    with timings.measure("import yerba"):
+        from .main_rutine import MainRutine
+
+    main_rutine = MainRutine(
+        filename, parser_params_overrides={**(build_params or {}),
+                                           **overrides}
+    )
+    main_rutine.run()
+    if main_rutine.failed_slides:
+        # so the next build isn't skipped
+        raise BuildError(f"{len(main_rutine.failed_slides)} slide(s) failed")
+    save_build_fingerprint(filename, output_filename, fingerprint)
+    return True
+
+
+class DeckResult(NamedTuple):
+    filename: str
+    # 'built', 'up to date' or 'failed'
+    status: str
+    seconds: float
+    error: str | None = None
+
+
+def _init_worker() -> None:
+    # import manim before the first presentation, once per worker
+    import manim  # noqa: F401
+    from .main_rutine import MainRutine  # noqa: F401
+
+
+def _forget_modules(modules, folder) -> None:
+    """
+    Remove from `sys.modules` the modules imported from `folder` (custom
+    templates) that weren't in `modules`, so the next presentations import
+    their own ones.
+    """
+    folder = os.path.join(folder, "")
+    for name in set(sys.modules) - modules:
+        filename = getattr(sys.modules[name], "__file__", None)
+        if filename and os.path.abspath(filename).startswith(folder):
+            del sys.modules[name]
+
+
+def build_deck(filename, overrides=None, force=False,
+               build_params=None) -> DeckResult:
+    """
+    Build a presentation in its folder with the default parameters (they are
+    restored before each build, so the front matter of a presentation
+    doesn't leak into the next ones), catching its errors.
+    """
+    from .defaults import reset_params
+
+    t0 = time.perf_counter()
+    deck_dir, basename = os.path.split(os.path.abspath(filename))
+    cwd = os.getcwd()
+    modules = set(sys.modules)
+    os.chdir(deck_dir)
+    sys.path.insert(0, deck_dir)
+    try:
+        reset_params()
+        built = build_presentation(basename, overrides, force, build_params)
+        return DeckResult(filename, "built" if built else "up to date",
+                          time.perf_counter() - t0)
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        # errors in the slides call quit() after logging them
+        return DeckResult(filename, "failed", time.perf_counter() - t0,
+                          str(e) or type(e).__name__)
+    finally:
+        sys.path.remove(deck_dir)
+        os.chdir(cwd)
+        _forget_modules(modules, deck_dir)
+
+
+def build_folder_decks(filenames, overrides=None, force=False,
+                       build_params=None) -> list[DeckResult]:
+    """Build presentations of the same folder, one after the other."""
+    return [build_deck(filename, overrides, force, build_params)
+            for filename in filenames]
+
+
+def group_by_folder(filenames) -> list[list[str]]:
+    """
+    Group the presentations by folder, biggest groups first. Presentations
+    in the same folder have their own slides (see `get_deck_dir`) but share
+    the rest of ./media, like manim's Tex folder, which manim cleans after
+    each compilation, so they can't be built at the same time.
+    """
+    groups: dict[str, list[str]] = {}
+    for filename in filenames:
+        folder = os.path.dirname(os.path.abspath(filename))
+        groups.setdefault(folder, []).append(filename)
+    return sorted(
+        (sorted(g, key=os.path.getsize, reverse=True)
+         for g in groups.values()),
+        key=lambda g: sum(map(os.path.getsize, g)), reverse=True
+    )
+
+
+def build_decks(filenames, jobs=1, overrides=None, force=False,
+                shared_dir=None, on_result=None) -> list[DeckResult]:
+    """
+    Build several presentations with `jobs` worker processes (in this
+    process if `jobs` is 1). Presentations of the same folder are built by
+    the same worker, one after the other (see `group_by_folder`), and the
+    biggest folders start first, so a long presentation doesn't end up
+    alone at the end. The TeX jobs of each build ('build.jobs') are divided
+    among the workers.
+
+    `on_result` is called with each `DeckResult` as soon as it's ready.
+    """
+    groups = group_by_folder(filenames)
+    jobs = max(1, min(jobs, len(groups)))
+    build_params = {
+        "build.jobs": max(1, (os.cpu_count() or 1) // jobs),
+        "cache.shared_dir": os.path.abspath(shared_dir) if shared_dir else "",
+    }
+
+    results = []
+    if jobs == 1:
+        for filename in (f for group in groups for f in group):
+            results.append(build_deck(filename, overrides, force,
+                                      build_params))
+            if on_result is not None:
+                on_result(results[-1])
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(build_folder_decks, group, overrides, force,
+                            build_params)
+            for group in groups
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    return results
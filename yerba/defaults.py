@@ -1,4 +1,5 @@
 from __future__ import annotations
+import copy
 from manim.mobject.types.vectorized_mobject import VMobject
 
 colors: dict[str, str] = {
@@ -22,15 +23,67 @@ colors: dict[str, str] = {
 
 VMobject.set_default(color=colors["BLACK"])
 
-parser_params: dict[str, bool] = {
+parser_params: dict[str, bool | str | float] = {
     "errors.verbose": False,
+    # render a placeholder for the slides with errors instead of stopping
+    # the build (see `MainRutine.render_slide_keep_going`)
+    "errors.keep_going": False,
     "only_calculate_new_slides": True,
+    # 'svg' (rsvg-convert) or 'cairo'. The cairo backend is faster, but it
+    # draws PDF images as manim paths, without their clip paths, gradients
+    # and embedded raster images (see `ImagePDFSvg.get_vector_mobject`)
+    "output.backend": "svg",
+    "svg.precision": 0.01,
+    "svg.compress": False,
+    # width in pixels of the PNG thumbnails of the subslides written to
+    # ./media/thumbnails/<filename>/ (see `write_thumbnails`), 0 to not
+    # write them
+    "output.thumbnails": 0,
+    # write the same PDF bytes for the same input: the dates in the PDF are
+    # SOURCE_DATE_EPOCH (or 1970-01-01 if it isn't set) instead of the
+    # current time (see `get_source_date_epoch`), and `random` and
+    # `np.random` are seeded at the start of each slide
+    "output.reproducible": False,
+
+    # drop each slide (its mobjects, ids and the parsed svg of its PDF
+    # images) and empty manim's SVG cache once the slide is written. The
+    # small caches of converted PDFs and file hashes are kept, so prefetched
+    # images are still reused
+    "memory.streaming": False,
+    "memory.report": False,
+    "memory.svg_cache_size": 512,
+    "memory.image_cache_size": 32,
+
+    "images.target_dpi": 144,
+    "images.jpeg_quality": 90,
+
+    # compile the TeX of the next slides and write the output in the
+    # background (see `BuildOrchestrator`). 'build.jobs' is the maximum
+    # number of TeX processes (0 means the number of CPUs). With
+    # 'build.tex_prepass' the TeX of the whole presentation is compiled from
+    # the start, otherwise only 'build.lookahead' slides ahead
+    "build.background": True,
+    "build.jobs": 0,
+    "build.lookahead": 2,
+    "build.tex_prepass": True,
+
+    # compression of the scenes and python blocks stored in ./media: 'none'
+    # or 'zstd' (needs the `zstandard` package). See `yerba cache`
+    "cache.compression": "none",
+    # folder for the caches that several presentations can share (TeX
+    # formats and resampled images), e.g. in `yerba build`. If empty, each
+    # presentation uses its ./media/yerba_cache
+    "cache.shared_dir": "",
 }
 
 template_params: dict[str, str | float | bool] = {
     "add_footer": True,
 
     "add_to_preamble": "",
+    # seed of the random generator of each slide (`self.rng` in the
+    # templates), combined with the slide number
+    "random_seed": 0,
+    "tex.precompiled_format": True,
 
     "title.font_size": 40,
     "title.color": colors["BLACK"],
@@ -57,6 +110,23 @@ box_params: dict[str, float] = {
     "arrange_buff": 0.25,
 }
 
+_initial_params = copy.deepcopy(
+    (colors, parser_params, template_params, box_params)
+)
+
+
+def reset_params() -> None:
+    """
+    Restore the default parameters and colors (in place, since they are
+    imported by other modules). Used when more than one presentation is
+    built in the same process.
+    """
+    for params, initial in zip(
+        (colors, parser_params, template_params, box_params), _initial_params
+    ):
+        params.clear()
+        params.update(copy.deepcopy(initial))
+
 
 codeblocks_namedict = {
     "python_yerba": ["python yerba", "yerba"],
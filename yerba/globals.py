@@ -1,3 +1,73 @@
-from collections import defaultdict
+from __future__ import annotations
+from contextvars import ContextVar
+from typing import Hashable
 
-g_ids = defaultdict(list)
+
+class IdRegistry:
+    """
+    Mobjects with an id in a slide. Each `Slide` owns one, so the ids live
+    as long as the slide.
+
+    The mobjects of each id are kept in insertion order, indexed by identity,
+    so adding, removing and transferring an id are O(1).
+    """
+
+    def __init__(self) -> None:
+        # id -> {id(mobject): mobject}
+        self._entries: dict[Hashable, dict[int, object]] = {}
+        # incremented on every change
+        self.version: int = 0
+
+    def __contains__(self, name) -> bool:
+        return name in self._entries
+
+    def add(self, name, mobject) -> None:
+        self._entries.setdefault(name, {})[id(mobject)] = mobject
+        self.version += 1
+
+    def set(self, name, mobjects) -> None:
+        """Replace all the mobjects of an id."""
+        self._entries[name] = {id(mo): mo for mo in mobjects}
+        self.version += 1
+
+    def get(self, name) -> list:
+        """Return the mobjects of an id."""
+        return list(self._entries.get(name, {}).values())
+
+    def first(self, name):
+        return next(iter(self._entries[name].values()))
+
+    def pop(self, name) -> list:
+        mobjects = self.get(name)
+        del self._entries[name]
+        self.version += 1
+        return mobjects
+
+    def transfer(self, name, old_mobject, new_mobject) -> None:
+        """Move an id from a mobject to its modified copy."""
+        entries = self._entries.get(name, {})
+        if id(old_mobject) not in entries:
+            raise ValueError(f"The original object does not have the id {name}")
+        del entries[id(old_mobject)]
+        entries[id(new_mobject)] = new_mobject
+        self.version += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.version += 1
+
+
+# id registry of the slide that is being computed (see `Presentation`). A
+# context variable, so each thread or task building a presentation has its
+# own one.
+current_ids: ContextVar[IdRegistry | None] = ContextVar("current_ids",
+                                                        default=None)
+
+
+def get_ids() -> IdRegistry:
+    """Return the id registry of the current slide."""
+    ids = current_ids.get()
+    if ids is None:
+        ids = IdRegistry()
+        current_ids.set(ids)
+    return ids
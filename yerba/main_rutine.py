@@ -1,14 +1,28 @@
 from __future__ import annotations
 import yaml
+import json
+import glob
 import shutil
 import os
 
 import manim
 
 from .base.presentation import make_presentation_from_template
-from .utils.parser import get_slides_md_nodes
+from .base.backends import SvgBackend, get_backend, get_slide_files
+from .base.image import prefetch_image
+from .base.thumbnails import write_thumbnails
+from .utils.parser import (
+    get_deck_slides, get_snapshot_filename, get_slide_numbers_by_title,
+    get_errors_filename, save_slide_numbers
+)
+from .utils.commands import validate_slides, iter_commands
+from .utils.timings import timings
+from .utils.cache import cache_stats
+from .utils.orchestrator import BuildOrchestrator, current_orchestrator
 from .utils.others import (
-    check_dependencies, create_folder_structure, exec_and_handle_exeption
+    check_dependencies, create_folder_structure, exec_and_handle_exeption,
+    get_deck_dir,
+    SlideError, raise_slide_errors
 )
 from .defaults import parser_params, template_params, colors
 
@@ -18,33 +32,58 @@ for k, v in colors.items():
 
 
 class MainRutine:
-    def __init__(self, filename) -> None:
-        check_dependencies()
-        create_folder_structure()
-
+    def __init__(self, filename, parser_params_overrides=None,
+                 text=None) -> None:
+        """
+        If `text` is given, it is used as the content of `filename` (e.g. an
+        unsaved editor buffer), and all the slides are considered new.
+        """
         self.filename: str = filename
         self.cover_metadata: dict | None = None
+        # parser params given in the command line (they have priority over
+        # the ones in the front matter)
+        self.parser_params_overrides: dict = parser_params_overrides or {}
 
-        old_filename = f"./media/.old.{filename}"
-        if os.path.exists(old_filename):
-            for f in os.listdir("./media/slides/"):
-                shutil.move(f"./media/slides/{f}", f"./media/old_slides/{f}")
-            slides = get_slides_md_nodes(filename, old_filename)
-        else:
-            slides = get_slides_md_nodes(filename, None)
+        self.old_filename: str = get_snapshot_filename(filename)
+        # files of the slides of this build and of the last one
+        self.slides_dir: str = get_deck_dir("slides", filename)
+        self.old_slides_dir: str = get_deck_dir("old_slides", filename)
+        with timings.measure("parse markdown"):
+            slides, sources = exec_and_handle_exeption(
+                get_deck_slides, error_type="custom",
+                msg="There seems to be an error reading the presentation.",
+                f_kwargs=dict(filename=filename, text=text)
+            )
         self.slides: list[dict] = slides
+        # markdown files of the presentation (the main one and the included)
+        self.sources: list[str] = sources
 
         self.template_name: str = "nice"
         self.custom_template_name: str | None = None
+        # TeX snippets of each slide that weren't sent to the orchestrator
+        self.tex_jobs: dict[int, list[tuple]] = {}
+        # slides replaced by a placeholder in keep-going builds
+        self.failed_slides: list[dict] = []
 
-    @staticmethod
-    def use_backup_slide(slide_number):
-        os.system(
-            f"find ./media/old_slides/ | grep -i 's{slide_number:04g}_'"
-            " | xargs mv -t ./media/slides/"
-        )
+    def backup_old_slides(self):
+        if os.path.exists(self.old_filename):
+            for f in os.listdir(self.slides_dir):
+                shutil.move(os.path.join(self.slides_dir, f),
+                            os.path.join(self.old_slides_dir, f))
+
+    def has_backup_slide(self, slide_name):
+        return bool(get_slide_files(self.old_slides_dir, slide_name,
+                                    self.p.backend.extension))
 
-    def initialize_presentation(self):
+    def use_backup_slide(self, slide_name):
+        for f in glob.glob(
+                os.path.join(self.old_slides_dir, f"{slide_name}_*")):
+            shutil.move(f, os.path.join(self.slides_dir,
+                                        os.path.basename(f)))
+        self.p.add_backup_slide(slide_name)
+        cache_stats.hit("slides")
+
+    def initialize_presentation(self, backend=None, orchestrator=None):
         Presentation = exec_and_handle_exeption(
             make_presentation_from_template, error_type="custom",
             msg="There seems to be an error loading the template.",
@@ -54,6 +93,10 @@ class MainRutine:
             )
         )
         output_filename = str(os.path.splitext(self.filename)[0])+".pdf"
+        if backend is None:
+            backend = get_backend(parser_params["output.backend"],
+                                  output_filename, slides_dir=self.slides_dir,
+                                  old_slides_dir=self.old_slides_dir)
 
         p = exec_and_handle_exeption(
             Presentation, error_type="custom",
@@ -61,16 +104,18 @@ class MainRutine:
             f_kwargs=dict(
                 output_filename=output_filename,
                 template_params=template_params,
-                colors=colors
+                colors=colors,
+                backend=backend,
+                orchestrator=orchestrator
             )
         )
         return p
 
-    def create_new_slide(self, slide_number):
+    def create_new_slide(self, slide_number, name=None):
         exec_and_handle_exeption(
             self.p.new_slide, error_type="custom",
             msg="There seems to be an error creating a new slide.",
-            f_kwargs=dict(slide_number=slide_number)
+            f_kwargs=dict(slide_number=slide_number, name=name)
         )
 
     def compute_front_matter(self, node):
@@ -102,7 +147,46 @@ class MainRutine:
         if "custom_template" in metadata:
             self.custom_template_name = metadata.pop("custom_template")
 
+    def compute_front_matter_if_exists(self):
+        slide0 = self.slides[0]
+        if slide0["content"] and slide0["content"][0].type == "front_matter":
+            node = slide0["content"].pop(0)
+            self.compute_front_matter(node)
+        parser_params.update(self.parser_params_overrides)
+
+    def validate(self) -> bool:
+        """
+        Check that every command of the presentation can be parsed and
+        dispatched, without rendering anything.
+        """
+        self.compute_front_matter_if_exists()
+        Presentation = exec_and_handle_exeption(
+            make_presentation_from_template, error_type="custom",
+            msg="There seems to be an error loading the template.",
+            f_kwargs=dict(
+                template_name=self.template_name,
+                custom_template_name=self.custom_template_name
+            )
+        )
+
+        errors = validate_slides(self.slides, Presentation)
+        for e in errors:
+            where = f"slide {e.slide_number}"
+            if e.title:
+                where += f" ('{e.title}')"
+            manim.logger.error(f"Error in {where}:\n>{e.source}\n{e.error}")
+
+        if errors:
+            manim.logger.error(f"Found {len(errors)} invalid command(s)")
+        else:
+            manim.logger.info("All commands are valid")
+
+        return not errors
+
     def run(self):
+        create_folder_structure(self.filename)
+        self.backup_old_slides()
+
         slide0 = self.slides[0]
 
         if slide0["is_new_slide"]:
@@ -112,43 +196,276 @@ class MainRutine:
             slide0["is_new_slide"] = True
             manim.logger.info("Loading configuration")
 
-        if slide0["content"] and slide0["content"][0].type == "front_matter":
-            node = self.slides[0]["content"].pop(0)
-            self.compute_front_matter(node)
+        self.compute_front_matter_if_exists()
+        check_dependencies()
 
-        # Create Presentation
-        self.p = self.initialize_presentation()
+        orchestrator = self.start_orchestrator()
+        try:
+            # Create Presentation
+            with timings.measure("load template"):
+                self.p = self.initialize_presentation(
+                    orchestrator=orchestrator)
+            self.prefetch_images()
+            self.plan_tex_prefetch()
 
-        if self.cover_metadata is not None:
-            exec_and_handle_exeption(
-                self.p.add_cover, error_type="custom",
-                msg="There seems to be an error creating the cover.",
-                f_kwargs=self.cover_metadata
+            if self.cover_metadata is not None:
+                exec_and_handle_exeption(
+                    self.p.add_cover, error_type="custom",
+                    msg="There seems to be an error creating the cover.",
+                    f_kwargs=self.cover_metadata
+                )
+
+            with timings.measure("render slides"):
+                self.render_slides()
+
+            with timings.measure("write output"):
+                self.p.close()
+        finally:
+            self.stop_orchestrator(orchestrator)
+        # after stopping the orchestrator, so its threads aren't forked
+        self.write_thumbnails()
+        self.save_failed_slides()
+
+        for f in os.listdir(self.old_slides_dir):
+            os.remove(os.path.join(self.old_slides_dir, f))
+        for source in self.sources:
+            # with its modification time (see `is_snapshot_up_to_date`)
+            shutil.copy2(source, get_snapshot_filename(source))
+        save_slide_numbers(self.filename, self.slides)
+        cache_stats.save()
+
+        manim.logger.info("Ready")
+
+    def start_orchestrator(self) -> BuildOrchestrator | None:
+        if not parser_params["build.background"]:
+            return None
+        orchestrator = BuildOrchestrator(
+            max_jobs=int(parser_params["build.jobs"]) or None)
+        current_orchestrator.set(orchestrator)
+        return orchestrator
+
+    def stop_orchestrator(self, orchestrator) -> None:
+        if orchestrator is not None:
+            current_orchestrator.set(None)
+            orchestrator.close()
+
+    def plan_tex_prefetch(self) -> None:
+        """
+        Guess the TeX snippets of every slide (see `get_tex_jobs` in the
+        presentation). If 'build.tex_prepass' is True, all the snippets of
+        the slides that will be computed start compiling now, otherwise each
+        slide sends its own when it's near (see `render_slides`).
+        """
+        if current_orchestrator.get() is None:
+            return
+        with timings.measure("guess TeX snippets"):
+            self.tex_jobs = self.p.get_tex_jobs(self.slides)
+        if parser_params["build.tex_prepass"]:
+            self.prefetch_tex(
+                s["slide_number"] for n, s in enumerate(self.slides)
+                if not self.can_use_backup_slide(n, s)
             )
 
+    def prefetch_tex(self, slide_numbers) -> None:
+        """Start compiling the TeX snippets of the given slides."""
+        orchestrator = current_orchestrator.get()
+        if orchestrator is None:
+            return
+        for slide_number in slide_numbers:
+            for job in self.tex_jobs.pop(slide_number, []):
+                orchestrator.prefetch_tex(*job)
+
+    def prefetch_images(self) -> None:
+        """
+        Start loading the images of every `add_image` command of the slides
+        that will be computed (see `prefetch_image`). Only commands whose
+        arguments are literals are followed (see `Command.literal_args`).
+        """
+        orchestrator = current_orchestrator.get()
+        if orchestrator is None:
+            return
+        for n, slide in enumerate(self.slides):
+            if self.can_use_backup_slide(n, slide):
+                continue
+            for command in iter_commands(slide["content"]):
+                if command.kind != "inline" or command.name != "add_image":
+                    continue
+                try:
+                    args, kwargs = command.literal_args()
+                except ValueError:
+                    continue
+                try:
+                    prefetch_image(orchestrator, *args, **kwargs)
+                except Exception:
+                    continue
+
+    def can_use_backup_slide(self, n, slide) -> bool:
+        return (parser_params["only_calculate_new_slides"]
+                and not slide["is_new_slide"] and n != 0
+                and self.has_backup_slide(slide["name"]))
+
+    def render_slides(self):
+        lookahead = int(parser_params["build.lookahead"])
         for n, slide in enumerate(self.slides):
             slide_number = slide["slide_number"]
-            self.p.slide_number = slide_number
 
-            if (parser_params["only_calculate_new_slides"]
-                    and not slide["is_new_slide"] and n != 0):
-                self.use_backup_slide(slide_number)
+            if self.can_use_backup_slide(n, slide):
+                self.p.slide_number = slide_number
+                self.use_backup_slide(slide["name"])
                 title = slide["title"].children[0].content
                 manim.logger.info(f"Loading backup of slide '{title}'")
                 continue
 
-            if n != 0:
-                title = slide["title"].children[0].content
-                manim.logger.info(f"Rendering slide '{title}'")
-                self.create_new_slide(slide_number)
-                self.p.compute_title(title)
+            # the next slides are compiled while this one is computed
+            self.prefetch_tex(
+                s["slide_number"]
+                for m, s in enumerate(self.slides[n:n+1+lookahead], n)
+                if not self.can_use_backup_slide(m, s)
+            )
+            if parser_params["errors.keep_going"]:
+                self.render_slide_keep_going(slide)
+            else:
+                self.render_slide(slide)
+
+    def render_slide(self, slide):
+        slide_number = slide["slide_number"]
+        self.p.slide_number = slide_number
 
-            for node in slide["content"]:
-                self.p.compute_slide_content(node)
+        if slide_number != 0:
+            title = slide["title"].children[0].content
+            manim.logger.info(f"Rendering slide '{title}'")
+            self.create_new_slide(slide_number, slide["name"])
+            self.p.compute_title(title)
+
+        for node in slide["content"]:
+            self.p.compute_slide_content(node)
+        # write it now, so its errors are reported with it
+        self.p.close_slide()
+
+    def render_slide_keep_going(self, slide):
+        """
+        Render a slide, or a placeholder with its error if it fails. The
+        files of the placeholder are removed after the build (see
+        `save_failed_slides`), so the next build renders the slide again
+        even if it didn't change.
+        """
+        token = raise_slide_errors.set(True)
+        try:
+            self.render_slide(slide)
+        except Exception as e:
+            if not isinstance(e, SlideError):
+                manim.logger.error(f"Python error: {e}")
+            title = ("" if slide["slide_number"] == 0
+                     else slide["title"].children[0].content)
+            self.failed_slides.append(dict(
+                slide_number=slide["slide_number"], name=slide["name"],
+                source=slide["source"], title=title, error=str(e)
+            ))
+            raise_slide_errors.set(False)
+            exec_and_handle_exeption(
+                self.p.add_error_slide, error_type="custom",
+                msg="There seems to be an error creating the placeholder of "
+                    "a slide.",
+                f_kwargs=dict(slide_number=slide["slide_number"],
+                              name=slide["name"],
+                              message=f"Error in slide '{title}':\n{e}")
+            )
+        finally:
+            raise_slide_errors.reset(token)
+
+    def write_thumbnails(self) -> None:
+        width = int(parser_params["output.thumbnails"])
+        if width <= 0:
+            return
+        with timings.measure("thumbnails"):
+            index_filename = write_thumbnails(
+                self.p.backend.pages, width,
+                slides={s["name"]: s for s in self.slides},
+                jobs=int(parser_params["build.jobs"]) or None,
+                out_dir=get_deck_dir("thumbnails", self.filename)
+            )
+        manim.logger.info(f"Thumbnails written to {index_filename}")
+
+    def save_failed_slides(self) -> None:
+        """
+        Record the slides that failed in ./media/.errors.<name>.json and
+        remove their files.
+        """
+        errors_filename = get_errors_filename(self.filename)
+        if not self.failed_slides:
+            if os.path.exists(errors_filename):
+                os.remove(errors_filename)
+            return
+
+        for slide in self.failed_slides:
+            for f in glob.glob(
+                    os.path.join(self.slides_dir, f"{slide['name']}_*")):
+                os.remove(f)
+        with open(errors_filename, "w") as f:
+            json.dump(self.failed_slides, f, indent=2)
+
+        manim.logger.error(
+            f"{len(self.failed_slides)} slide(s) failed and were replaced by "
+            f"a placeholder (see {errors_filename}): " + ", ".join(
+                str(s["slide_number"]) for s in self.failed_slides)
+        )
+
+    def render_selected_slides(self, slide_numbers, backend) -> None:
+        """
+        Render only some slides with the given backend, without using or
+        modifying the files of the last build (backups and .old snapshot).
+        The front matter must be already computed.
+        """
+        self.p = self.initialize_presentation(backend=backend)
+
+        for slide in self.slides:
+            if slide["slide_number"] not in slide_numbers:
+                continue
+            if slide["slide_number"] == 0 and self.cover_metadata is not None:
+                exec_and_handle_exeption(
+                    self.p.add_cover, error_type="custom",
+                    msg="There seems to be an error creating the cover.",
+                    f_kwargs=self.cover_metadata
+                )
+            self.render_slide(slide)
 
         self.p.close()
-        for f in os.listdir("./media/old_slides/"):
-            os.remove(f"./media/old_slides/{f}")
-        shutil.copyfile(self.filename, f"./media/.old.{self.filename}")
 
-        manim.logger.info("Ready")
+    def run_partial(self, slide_numbers=frozenset(), slide_titles=(),
+                    svg_only=False) -> None:
+        """
+        Render only the given slides (by number or title) to
+        ./media/partial/<filename>/, and convert them to `<name>.partial.pdf` unless
+        `svg_only` is True. The files of the full build are not modified.
+        """
+        slide_numbers = (set(slide_numbers)
+                         | get_slide_numbers_by_title(self.slides, slide_titles))
+        if not slide_numbers:
+            manim.logger.error("No slide matches the given numbers or titles")
+            quit()
+
+        create_folder_structure(self.filename)
+        slides_dir = get_deck_dir("partial", self.filename)
+        if os.path.exists(slides_dir):
+            shutil.rmtree(slides_dir)
+        os.makedirs(slides_dir)
+
+        self.compute_front_matter_if_exists()
+        output_filename = (str(os.path.splitext(self.filename)[0])
+                           + ".partial.pdf")
+        if svg_only:
+            backend = SvgBackend(output_filename, slides_dir=slides_dir,
+                                 convert=False)
+        else:
+            check_dependencies()
+            backend = get_backend(parser_params["output.backend"],
+                                  output_filename, slides_dir=slides_dir)
+
+        with timings.measure("render slides"):
+            self.render_selected_slides(slide_numbers, backend)
+
+        if svg_only:
+            manim.logger.info(f"Slides written to '{slides_dir}'")
+        else:
+            manim.logger.info(f"Partial presentation written to "
+                              f"'{output_filename}'")
@@ -2,7 +2,7 @@ from functools import partial
 from collections.abc import Callable
 
 from manim.mobject.mobject import Mobject
-from .globals import g_ids
+from .globals import get_ids
 
 
 def hide_func(mo, val):
@@ -13,7 +13,7 @@ def hide_func(mo, val):
 
 
 def id_func(mo, val):
-    return g_ids[val].append(mo)
+    return get_ids().add(val, mo)
 
 
 properties_set_dict: dict = {
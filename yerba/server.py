@@ -0,0 +1,334 @@
+"""
+`yerba serve`: a long running process that renders single slides for editor
+integrations, keeping manim, the templates and the TeX caches warm.
+
+The protocol is JSON-RPC 2.0 over a Unix socket, one JSON object per line.
+Methods:
+
+- `render`: params `document` (path of the markdown file), `text` (content
+  of the buffer, optional), `slide` (slide number) or `line` (0-based line
+  of the cursor), `format` ('svg', the default, or 'png'), `width` (of the
+  PNG files, in pixels) and `priority` (optional, lower is rendered first).
+  Returns `{"slide": n, "files": [...]}` with the absolute paths of the
+  files of its subslides. Pending render requests of a document are
+  cancelled when a newer one arrives.
+- `cancel`: params `id`, cancel a pending request.
+- `ping` and `shutdown`.
+
+The slides are rendered by a worker process for each folder of documents,
+which runs in that folder (yerba and manim use paths relative to it), so the
+server itself never changes its working directory.
+"""
+from __future__ import annotations
+import os
+import glob
+import json
+import queue
+import logging
+import itertools
+import threading
+import socketserver
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+RENDER_ERROR = -32000
+REQUEST_CANCELLED = -32800
+
+
+class InvalidParams(Exception):
+    """Params of a request that can't be rendered (e.g. a missing slide)."""
+
+
+class _LogCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages: list[str] = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@dataclass(order=True)
+class RenderRequest:
+    priority: int
+    seq: int
+    id: object = field(compare=False)
+    params: dict = field(compare=False)
+    reply: object = field(compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class RenderServer:
+    def __init__(self, socket_path) -> None:
+        self.socket_path = os.path.abspath(socket_path)
+        self.requests: queue.PriorityQueue = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        # pending requests by id and by document
+        self.pending: dict[object, RenderRequest] = {}
+        self.pending_by_doc: dict[str, list[RenderRequest]] = {}
+        self.server: socketserver.ThreadingUnixStreamServer | None = None
+        # folder of the documents -> its render process
+        self.executors: dict[str, concurrent.futures.Executor] = {}
+
+    # -- requests
+
+    def submit(self, request_id, params, reply) -> None:
+        document = os.path.abspath(params["document"])
+        req = RenderRequest(priority=int(params.get("priority", 0)),
+                            seq=next(self.seq), id=request_id,
+                            params=params, reply=reply)
+        with self.lock:
+            # a newer edit of the document makes its pending requests stale
+            for old in self.pending_by_doc.pop(document, []):
+                self._cancel(old)
+            self.pending_by_doc[document] = [req]
+            self.pending[request_id] = req
+        self.requests.put(req)
+
+    def cancel(self, request_id) -> bool:
+        with self.lock:
+            req = self.pending.get(request_id)
+            if req is None:
+                return False
+            self._cancel(req)
+            return True
+
+    def _cancel(self, req: RenderRequest) -> None:
+        req.cancelled = True
+        self.pending.pop(req.id, None)
+        req.reply(error=(REQUEST_CANCELLED, "Request cancelled"))
+
+    def _take(self, req: RenderRequest) -> bool:
+        with self.lock:
+            if req.cancelled:
+                return False
+            self.pending.pop(req.id, None)
+            document = os.path.abspath(req.params["document"])
+            doc_reqs = self.pending_by_doc.get(document, [])
+            if req in doc_reqs:
+                doc_reqs.remove(req)
+            return True
+
+    # -- rendering
+
+    def get_executor(self, deck_dir) -> concurrent.futures.Executor:
+        executor = self.executors.get(deck_dir)
+        if executor is None:
+            # spawned, since this process has threads
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, initializer=_init_deck_worker,
+                initargs=(deck_dir,),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            self.executors[deck_dir] = executor
+        return executor
+
+    def render(self, params) -> dict:
+        document = os.path.abspath(params["document"])
+        deck_dir = os.path.dirname(document)
+        try:
+            return self.get_executor(deck_dir).submit(render_slide,
+                                                      params).result()
+        except BrokenProcessPool:
+            # the worker died, the next request starts a new one
+            self.executors.pop(deck_dir).shutdown(wait=False)
+            raise RuntimeError("The render process of this folder died")
+
+    def worker(self) -> None:
+        while True:
+            req = self.requests.get()
+            if not self._take(req):
+                continue
+            try:
+                result = self.render(req.params)
+            except InvalidParams as e:
+                req.reply(error=(INVALID_PARAMS, str(e)))
+            except Exception as e:
+                req.reply(error=(RENDER_ERROR, str(e)))
+            else:
+                req.reply(result=result)
+
+    # -- protocol
+
+    def handle_message(self, msg, reply) -> None:
+        if not isinstance(msg, dict) or "method" not in msg:
+            reply(error=(INVALID_REQUEST, "Invalid request"))
+            return
+
+        method = msg["method"]
+        params = msg.get("params") or {}
+        if method == "render":
+            error = validate_render_params(params)
+            if error is not None:
+                reply(error=(INVALID_PARAMS, error))
+            else:
+                self.submit(msg.get("id"), params, reply)
+        elif method == "cancel":
+            reply(result=self.cancel(params.get("id")))
+        elif method == "ping":
+            reply(result="pong")
+        elif method == "shutdown":
+            reply(result=None)
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            reply(error=(METHOD_NOT_FOUND, f"Unknown method {method!r}"))
+
+    def make_handler(self):
+        rpc_server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                write_lock = threading.Lock()
+
+                def make_reply(request_id):
+                    def reply(result=None, error=None):
+                        response = {"jsonrpc": "2.0", "id": request_id}
+                        if error is None:
+                            response["result"] = result
+                        else:
+                            code, message = error
+                            response["error"] = {"code": code,
+                                                 "message": message}
+                        data = (json.dumps(response) + "\n").encode()
+                        with write_lock:
+                            try:
+                                self.wfile.write(data)
+                                self.wfile.flush()
+                            except OSError:
+                                pass
+                    return reply
+
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        msg = json.loads(line)
+                    except ValueError:
+                        make_reply(None)(error=(PARSE_ERROR, "Parse error"))
+                        continue
+                    request_id = msg.get("id") if isinstance(msg, dict) \
+                        else None
+                    rpc_server.handle_message(msg, make_reply(request_id))
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        # start the render process of the current folder, so the first
+        # request is fast
+        self.get_executor(os.getcwd())
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        worker = threading.Thread(target=self.worker, daemon=True)
+        worker.start()
+
+        self.server = socketserver.ThreadingUnixStreamServer(
+            self.socket_path, self.make_handler())
+        self.server.daemon_threads = True
+        print(f"Listening on {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+            for executor in self.executors.values():
+                executor.shutdown(wait=False)
+
+
+def validate_render_params(params) -> str | None:
+    """Return the error of the params of a render request, if any."""
+    if not isinstance(params, dict):
+        return "'params' must be an object"
+    if not isinstance(params.get("document"), str):
+        return "'document' is required"
+    for key in ("slide", "line", "priority", "width"):
+        value = params.get(key)
+        if value is not None and (not isinstance(value, int)
+                                  or isinstance(value, bool) or value < 0):
+            return f"'{key}' must be a non-negative integer"
+    if params.get("width") == 0:
+        return "'width' must be positive"
+    if params.get("format", "svg") not in ("svg", "png"):
+        return "'format' must be 'svg' or 'png'"
+    if params.get("text") is not None and not isinstance(params["text"],
+                                                         str):
+        return "'text' must be a string"
+    return None
+
+
+def _init_deck_worker(deck_dir) -> None:
+    os.chdir(deck_dir)
+    import manim  # noqa: F401
+    from .main_rutine import MainRutine  # noqa: F401
+
+
+def render_slide(params) -> dict:
+    """Render a slide of a document (in its render process, see
+    `RenderServer.get_executor`)."""
+    from manim import logger, config
+    from .defaults import reset_params
+    from .main_rutine import MainRutine
+    from .base.backends import SvgBackend
+    from .base.thumbnails import rasterize_page
+    from .utils.parser import get_slide_number_at_line
+
+    document = os.path.abspath(params["document"])
+    deck_dir, filename = os.path.split(document)
+    text = params.get("text")
+    if text is None:
+        with open(document) as f:
+            text = f.read()
+
+    collector = _LogCollector()
+    logger.addHandler(collector)
+    try:
+        reset_params()
+        main_rutine = MainRutine(filename, text=text)
+        if "slide" in params:
+            slide_number = params["slide"]
+        else:
+            slide_number = get_slide_number_at_line(main_rutine.slides,
+                                                    params.get("line", 0))
+        if slide_number >= len(main_rutine.slides):
+            raise InvalidParams(
+                f"Slide {slide_number} doesn't exist (the presentation has "
+                f"{len(main_rutine.slides)} slides)"
+            )
+
+        slides_dir = os.path.join(
+            deck_dir, "media", "serve", os.path.splitext(filename)[0])
+        os.makedirs(slides_dir, exist_ok=True)
+        slide_name = main_rutine.slides[slide_number]["name"]
+        for f in glob.glob(os.path.join(slides_dir, f"{slide_name}_*")):
+            os.remove(f)
+
+        backend = SvgBackend(None, slides_dir=slides_dir, convert=False)
+        main_rutine.compute_front_matter_if_exists()
+        main_rutine.render_selected_slides({slide_number}, backend)
+
+        files = backend.written_files
+        if params.get("format", "svg") == "png":
+            width = params.get("width") or config.pixel_width
+            png_files = []
+            for f in files:
+                png_file = os.path.splitext(f)[0] + ".png"
+                rasterize_page(f, png_file, width)
+                png_files.append(png_file)
+            files = png_files
+        return {"slide": slide_number, "files": files}
+    except InvalidParams:
+        raise
+    except BaseException as e:
+        # errors in the slides call quit() after logging them
+        messages = collector.messages or [str(e)]
+        raise RuntimeError("\n".join(messages)) from None
+    finally:
+        logger.removeHandler(collector)
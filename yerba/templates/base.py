@@ -1,4 +1,5 @@
 from __future__ import annotations
+import os
 import re
 from functools import cached_property
 from abc import ABCMeta, abstractmethod
@@ -8,15 +9,23 @@ from markdown_it.tree import SyntaxTreeNode
 from mdit_py_plugins.dollarmath import dollarmath_plugin
 
 from ..base.image import ImageSvg, ImagePDFSvg
-from ..base.ptext import Ptex
+from ..base.ptext import Ptex, get_tex_jobs
 from ..base.box import Box, NamedBoxes
 from ..base.slide import Slide
+from ..base.block_cache import (
+    PythonBlockRecorder, get_python_block_cache_filename
+)
 from ..properties import funcs_from_props
 from ..utils.others import define_default_kwargs, LinkedPositions
-from ..utils.latex import update_tex_enviroment_using_box, add_font_to_preamble
+from ..utils.latex import (
+    get_tex_environment_using_box, add_box_environment_to_preamble,
+    add_font_to_preamble
+)
 from ..utils.parser import get_markdownit_nodes
+from ..utils.commands import compile_python_block
+from ..utils.cache import cache_stats
 from ..utils.constants import DOWN, LEFT, ORIGIN, SLIDE_WIDTH, SLIDE_HEIGHT
-from ..globals import g_ids
+from ..globals import get_ids
 
 from manim import *  # to ensure access to manim from python_yerba
 
@@ -25,6 +34,8 @@ class PresentationTemplateAbstract(metaclass=ABCMeta):
     slide_number: int
     subslide_number: int
     current_slide: Slide
+    # random generator of the current slide (see `Presentation.new_slide`)
+    rng: np.random.Generator
 
     tex_template: TexTemplate
 
@@ -126,6 +137,7 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
         \usepackage[no-math]{fontspec}
         \usepackage{ragged2e}
         """+"\n" + self.template_params["add_to_preamble"])
+        add_box_environment_to_preamble(tt)
         return tt
 
     def set_main_font(self, regular, bold, italic, bold_italic, fonts_path=None):
@@ -222,8 +234,12 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
 
         box = self.get_box(box)
 
-        text_props["tex_template"] = update_tex_enviroment_using_box(
-            box, text_props["font_size"], text_props["tex_template"],
+        if "{yerbabox}" not in text_props["tex_template"].preamble:
+            text_props["tex_template"] = add_box_environment_to_preamble(
+                text_props["tex_template"].copy()
+            )
+        text_props["tex_environment"] = get_tex_environment_using_box(
+            box, text_props["font_size"], text_props["tex_environment"],
         )
 
         text_mo = Ptex(text, subslide_number=self.subslide_number,
@@ -290,46 +306,78 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
 
         return img_mo
 
-    def add_paragraph(self, text, box="active", **text_props):
+    def split_paragraph(self, text) -> tuple[list[tuple[str, str]], bool]:
+        """
+        Split a paragraph in its text and display math parts, as a list of
+        ("text" | "math", content). The second value is True if the whole
+        paragraph is a math block.
+        """
         tokens = MarkdownIt("commonmark").use(
             dollarmath_plugin, allow_space=True, double_inline=True
         ).parse(text)
         nodes = SyntaxTreeNode(tokens)[0]
 
-        box = self.get_box(box)
-
         if nodes.type == "math_block":
             t = self.render_md(nodes)[2:-3].strip()
-            return self.add_latex_math(t, box=box, **text_props)
+            return [("math", t)], True
         else:
             nodes = nodes[0]
 
-        mo_vg = VGroup()
+        parts = []
         acc_text = ""
         for node in nodes:
             if node.type == "math_inline_double":
                 acc_text = acc_text.strip()
                 if acc_text:
-                    mo = self.add_latex_text(acc_text, box=box, **text_props)
-                    mo_vg.add(mo)
+                    parts.append(("text", acc_text))
                 acc_text = ""
 
                 t = self.render_md(node)
-                mo = self.add_latex_math(t[2:-3], box=box, **text_props)
-                mo_vg.add(mo)
+                parts.append(("math", t[2:-3]))
             else:
                 acc_text += self.render_md(node)
         if acc_text:
-            mo = self.add_latex_text(acc_text, box=box, **text_props)
+            parts.append(("text", acc_text))
+
+        return parts, False
+
+    def add_paragraph(self, text, box="active", **text_props):
+        parts, is_math_block = self.split_paragraph(text)
+
+        box = self.get_box(box)
+
+        if is_math_block:
+            return self.add_latex_math(parts[0][1], box=box, **text_props)
+
+        mo_vg = VGroup()
+        for kind, t in parts:
+            if kind == "math":
+                mo = self.add_latex_math(t, box=box, **text_props)
+            else:
+                mo = self.add_latex_text(t, box=box, **text_props)
             mo_vg.add(mo)
 
         mo_vg.set(box=box)
 
         return mo_vg
 
-    def python_yerba_block(self, content):
-        p = self
-        exec("p = self;"+content)
+    def python_yerba_block(self, content, cache=False):
+        code = compile_python_block(content)
+        if not cache:
+            exec(code, globals(), {"self": self})
+            return
+
+        filename = get_python_block_cache_filename(self, content)
+        if (os.path.exists(filename)
+                and PythonBlockRecorder.replay(self, filename)):
+            cache_stats.hit("python_yerba", filename)
+            return
+        cache_stats.miss("python_yerba")
+
+        recorder = PythonBlockRecorder(self)
+        with recorder.record():
+            exec(code, globals(), {"self": self})
+        recorder.dump(filename)
 
     def md_alternate_block(self, content, arrange=None):
         nodes = get_markdownit_nodes(content)
@@ -380,11 +428,11 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
     def md_overwrite_block(self, content, *args, **properties):
         assert (
             len(args) == 1 and isinstance(args[0], int)
-            and args[0] in g_ids
+            and args[0] in get_ids()
         ), ("The first argument of an overwrite block "
             "must be a previously defined id")
         id = args[0]
-        original_mo_l = g_ids.pop(id)
+        original_mo_l = get_ids().pop(id)
 
         nodes = get_markdownit_nodes(content)
 
@@ -403,7 +451,7 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
         for node in nodes:
             mo = self.compute_slide_content(node, box=box_copy, **properties)
             new_mo_l.append(mo)
-            g_ids[id].append(mo)
+            get_ids().add(id, mo)
         box_copy.auto_arrange()
 
         self.current_slide.linked_positions.append(
@@ -421,6 +469,37 @@ class PresentationTemplateBase(PresentationTemplateAbstract):
 
         return vspace_mo
 
+    # -- TeX snippets of the content (see `_MdComputations.get_tex_jobs`)
+
+    def get_title_tex_jobs(self, title) -> list[tuple]:
+        return get_tex_jobs(title, self.template_params["title.style"],
+                            "justify", self.tex_template)
+
+    def get_subtitle_tex_jobs(self, subtitle) -> list[tuple]:
+        return get_tex_jobs(subtitle, self.template_params["subtitle.style"],
+                            "justify", self.tex_template)
+
+    def get_footer_tex_jobs(self, slide_number) -> list[tuple]:
+        if not self.template_params["add_footer"]:
+            return []
+        return get_tex_jobs(str(slide_number), "regular", "justify",
+                            self.tex_template)
+
+    def get_paragraph_tex_jobs(self, text, box) -> list[tuple]:
+        text_environment = get_tex_environment_using_box(
+            box, self.template_params["text.font_size"], "justify"
+        )
+        parts, _ = self.split_paragraph(text)
+        jobs = []
+        for kind, t in parts:
+            if kind == "math":
+                jobs += get_tex_jobs(t, "regular", "align*",
+                                     self.tex_template)
+            else:
+                jobs += get_tex_jobs(t, "regular", text_environment,
+                                     self.tex_template)
+        return jobs
+
     def do_after_create_new_slide(self, **kwargs):
         kwargs = define_default_kwargs(
             kwargs,
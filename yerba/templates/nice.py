@@ -45,14 +45,14 @@ class PresentationTemplate(PresentationTemplateBase):
                        color=self.colors["WHITE"], fill_opacity=1)
 
         for _ in range(20):
-            x, y = np.random.uniform(2, 6), np.random.uniform(0, 3.5)
-            if np.random.rand() > 0.5:
+            x, y = self.rng.uniform(2, 6), self.rng.uniform(0, 3.5)
+            if self.rng.random() > 0.5:
                 x, y = x, -y
             else:
                 x, y = -x, y
-            out_r = np.random.rand()
-            inn_r = np.random.uniform(out_r*.8, out_r)
-            alpha = (1-out_r)*np.random.uniform(0, 0.5)
+            out_r = self.rng.random()
+            inn_r = self.rng.uniform(out_r*.8, out_r)
+            alpha = (1-out_r)*self.rng.uniform(0, 0.5)
             o += ring(out_r, inn_r).move_to(x*RIGHT+y*UP).set_opacity(alpha)
 
         return o
@@ -0,0 +1,260 @@
+"""
+Caches that yerba keeps in ./media: hit/miss statistics of the builds,
+pruning by last use, and the optional zstd compression of the files yerba
+writes in them. Used by `yerba cache`, so, like `fingerprint`, this module
+must not import manim.
+"""
+from __future__ import annotations
+import io
+import os
+import re
+import json
+import time
+import shutil
+import threading
+from typing import NamedTuple
+
+try:
+    import zstandard
+except ImportError:  # compression is optional
+    zstandard = None
+
+STATS_FILE = "./media/yerba_cache/stats.json"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# name -> (folder, how its files are grouped in entries). Files of the same
+# entry are used and evicted together: 'stem' groups the files with the same
+# name before the first dot (e.g. a .tex and its .svg) and 'slide' the files
+# of the same slide (so a slide is never left with some of its subslides),
+# which are in a subfolder for each presentation
+CACHES: dict[str, tuple[str, str]] = {
+    "tex": ("./media/Tex", "stem"),
+    "texts": ("./media/texts", "stem"),
+    "tex_formats": ("./media/yerba_cache/tex_formats", "stem"),
+    "tex_jobs": ("./media/yerba_cache/tex_jobs", "stem"),
+    "images": ("./media/yerba_cache/images", "stem"),
+    "pdf_images": ("./media/yerba_cache/pdf_images", "stem"),
+    "python_yerba": ("./media/yerba_cache/python_yerba", "stem"),
+    "slides": ("./media/slides", "slide"),
+    "old_slides": ("./media/old_slides", "slide"),
+    "thumbnails": ("./media/yerba_cache/thumbnails", "stem"),
+}
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(size: str) -> int:
+    """Parse sizes like '2G', '500M' or '1.5GiB' (powers of 1024) to bytes."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*",
+                     size, flags=re.IGNORECASE)
+    if m is None:
+        raise ValueError(f"Invalid size {size!r}")
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "TiB"
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+# -- statistics
+
+def mark_used(filename) -> None:
+    """Set the access time of a cached file (see `get_entries`)."""
+    try:
+        st = os.stat(filename)
+        os.utime(filename, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+
+class CacheStats:
+    """Hits and misses of the caches in the current build."""
+
+    def __init__(self) -> None:
+        # cache name -> [hits, misses]
+        self.counts: dict[str, list[int]] = {}
+        self.lock = threading.Lock()
+
+    def _count(self, name, idx) -> None:
+        with self.lock:
+            self.counts.setdefault(name, [0, 0])[idx] += 1
+
+    def hit(self, name, filename=None) -> None:
+        self._count(name, 0)
+        if filename is not None:
+            mark_used(filename)
+
+    def miss(self, name) -> None:
+        self._count(name, 1)
+
+    def save(self, filename=STATS_FILE, keep=20) -> None:
+        """Add the counts to the last `keep` builds in `filename`, and reset
+        them."""
+        with self.lock:
+            counts, self.counts = self.counts, {}
+        builds = load_builds_stats(filename)
+        builds.append({"time": time.time(), "counts": counts})
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(builds[-keep:], f)
+        os.replace(tmp_filename, filename)
+
+
+def load_builds_stats(filename=STATS_FILE) -> list[dict]:
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+cache_stats = CacheStats()
+
+
+# -- entries
+
+class CacheEntry(NamedTuple):
+    cache: str
+    key: str
+    paths: list[str]
+    size: int
+    # last access or modification time of its files
+    last_used: float
+
+
+def _get_size(path) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path) for f in files
+    )
+
+
+def get_entries(name) -> list[CacheEntry]:
+    folder, grouping = CACHES[name]
+    try:
+        filenames = os.listdir(folder)
+    except OSError:
+        return []
+
+    groups: dict[str, list[str]] = {}
+    for f in filenames:
+        path = os.path.join(folder, f)
+        if grouping == "slide" and os.path.isdir(path):
+            for slide_file in os.listdir(path):
+                key = f"{f}/{slide_file.split('_')[0]}"
+                groups.setdefault(key, []).append(
+                    os.path.join(path, slide_file))
+            continue
+        key = f.split("_")[0] if grouping == "slide" else f.split(".")[0]
+        groups.setdefault(key, []).append(path)
+
+    entries = []
+    for key, paths in groups.items():
+        try:
+            stats = [os.stat(p) for p in paths]
+            size = sum(_get_size(p) for p in paths)
+        except OSError:
+            # removed in the meantime
+            continue
+        last_used = max(max(st.st_atime, st.st_mtime) for st in stats)
+        entries.append(CacheEntry(name, key, paths, size, last_used))
+    return entries
+
+
+def get_stats(filename=STATS_FILE) -> dict[str, dict]:
+    """
+    Entries and size of each cache, and its hits and misses in the builds
+    saved in `filename`.
+    """
+    counts: dict[str, list[int]] = {}
+    builds = load_builds_stats(filename)
+    for build in builds:
+        for name, (hits, misses) in build["counts"].items():
+            c = counts.setdefault(name, [0, 0])
+            c[0] += hits
+            c[1] += misses
+
+    stats = {}
+    for name in CACHES:
+        entries = get_entries(name)
+        hits, misses = counts.get(name, (0, 0))
+        stats[name] = dict(
+            entries=len(entries), size=sum(e.size for e in entries),
+            hits=hits, misses=misses, builds=len(builds),
+        )
+    return stats
+
+
+def prune(max_size: int, dry_run=False) -> list[CacheEntry]:
+    """
+    Remove the least recently used entries of all the caches until their
+    total size is at most `max_size` bytes. Returns the removed entries.
+    """
+    entries = sorted((e for name in CACHES for e in get_entries(name)),
+                     key=lambda e: e.last_used)
+    total = sum(e.size for e in entries)
+
+    removed = []
+    for entry in entries:
+        if total <= max_size:
+            break
+        if not dry_run:
+            for path in entry.paths:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        total -= entry.size
+        removed.append(entry)
+    return removed
+
+
+# -- compression
+
+def has_zstd() -> bool:
+    return zstandard is not None
+
+
+def write_cache_file(filename, data: bytes, compression="none") -> None:
+    """
+    Write `data` to a cache file, compressed with zstd if `compression` is
+    'zstd' and the `zstandard` package is installed.
+    """
+    if compression == "zstd" and zstandard is not None:
+        data = zstandard.ZstdCompressor().compress(data)
+    elif compression not in ("none", "zstd"):
+        raise ValueError(
+            f"'cache.compression' must be 'none' or 'zstd', not {compression!r}"
+        )
+    with open(filename, "wb") as f:
+        f.write(data)
+
+
+def open_cache_file(filename) -> io.BufferedIOBase:
+    """
+    Open a file written by `write_cache_file` for reading, decompressing it
+    if needed, so files of builds with other settings can still be read.
+    """
+    f = open(filename, "rb")
+    if f.peek(4)[:4] != ZSTD_MAGIC:
+        return f
+    with f:
+        if zstandard is None:
+            raise OSError(f"'{filename}' is compressed with zstd, install "
+                          "the 'zstandard' package to read it")
+        return io.BytesIO(
+            zstandard.ZstdDecompressor().decompressobj().decompress(f.read())
+        )
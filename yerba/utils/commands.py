@@ -0,0 +1,217 @@
+from __future__ import annotations
+import ast
+from functools import lru_cache
+from types import CodeType
+from typing import NamedTuple
+
+from .parser import get_markdownit_nodes
+from ..defaults import codeblocks_namedict
+
+
+class Command(NamedTuple):
+    """
+    A parsed yerba command.
+
+    `kind` is "inline" for `>! command - args` lines, "python" for
+    `>! `python code`` lines and "block" for fenced code blocks. `code` holds
+    the compiled arguments (or the compiled statement for "python" commands)
+    and `args` the source of the arguments.
+    """
+    kind: str
+    name: str
+    code: CodeType | None
+    source: str
+    args: str | None = None
+
+    def eval_args(self, globals_: dict, locals_: dict) -> tuple[tuple, dict]:
+        """Evaluate the compiled arguments of the command."""
+        if self.code is None:
+            return tuple(), dict()
+        return eval(self.code, globals_,
+                    {**locals_, "__yerba_args__": _collect_args})
+
+    def literal_args(self) -> tuple[tuple, dict]:
+        """
+        Parse the arguments of the command without running any code, if all
+        of them are literals (see `ast.literal_eval`). Raises ValueError
+        otherwise. Used to look ahead at the commands (e.g. to prefetch),
+        where they must not have side effects.
+        """
+        if self.args is None or not self.args.strip():
+            return tuple(), dict()
+        try:
+            call = ast.parse(f"f({self.args})", mode="eval").body
+        except SyntaxError as e:
+            raise ValueError(str(e)) from None
+        args = tuple(ast.literal_eval(arg) for arg in call.args)
+        kwargs = {}
+        for keyword in call.keywords:
+            if keyword.arg is None:
+                raise ValueError("'**' arguments are not literals")
+            kwargs[keyword.arg] = ast.literal_eval(keyword.value)
+        return args, kwargs
+
+
+class CommandError(NamedTuple):
+    slide_number: int
+    title: str
+    source: str
+    error: str
+
+
+def _collect_args(*args, **kwargs):
+    return args, kwargs
+
+
+COMMANDS_CACHE_SIZE: int = 4096
+
+
+def _compile_args(str_args: str, source: str) -> CodeType | None:
+    if not str_args.strip():
+        return None
+    return compile(f"__yerba_args__({str_args})", f"<yerba: {source}>", "eval")
+
+
+@lru_cache(maxsize=COMMANDS_CACHE_SIZE)
+def parse_inline_command(line: str) -> Command:
+    """
+    Parse a blockquote command line (without the leading `>`).
+
+    The result is cached by source line, so every command is compiled only
+    once per process.
+    """
+    t = line.strip()
+    if t.startswith("! `"):
+        # TODO(bersp): Use regex to identify >!`(.*)`
+        statement = t.replace("!", "").replace("`", "").strip()
+        code = compile("p = self;" + statement, f"<yerba: {line}>", "exec")
+        return Command("python", "", code, line)
+    elif t.startswith("!"):
+        name, *str_args = t.replace("!", "").strip().split("-", maxsplit=1)
+        name = name.strip().replace(" ", "_")
+        if not name.isidentifier():
+            raise SyntaxError(f"{name!r} is not a valid command name")
+        code = _compile_args(str_args[0], line) if str_args else None
+        return Command("inline", name, code, line,
+                       str_args[0] if str_args else None)
+    else:
+        raise ValueError(f"{line!r} is not a command")
+
+
+@lru_cache(maxsize=COMMANDS_CACHE_SIZE)
+def parse_block_command(info: str) -> Command | None:
+    """
+    Parse the info string of a fenced code block. Returns None if the block is
+    not a yerba block.
+    """
+    node_name, *str_args = info.split("-", maxsplit=1)
+    for block_type, names in codeblocks_namedict.items():
+        if node_name.strip() in names:
+            code = _compile_args(str_args[0], info) if str_args else None
+            return Command("block", f"{block_type}_block", code, info,
+                           str_args[0] if str_args else None)
+    return None
+
+
+@lru_cache(maxsize=COMMANDS_CACHE_SIZE)
+def compile_python_block(content: str) -> CodeType:
+    """Compile the content of a `python yerba` block (cached by source)."""
+    return compile("p = self;" + content, "<yerba: python block>", "exec")
+
+
+def get_command_lines(node) -> list[str]:
+    """Return the command lines of a blockquote node."""
+    if not node.children or not node.children[0].children:
+        return []
+    text = node.children[0].children[0].content
+    return [t for t in text.split("\n") if t.strip().startswith("!")]
+
+
+def iter_commands(nodes):
+    """
+    Yield the commands of `nodes` in order, including the ones in nested
+    markdown blocks. Commands that can't be parsed are skipped.
+    """
+    for node in nodes:
+        if node.type == "blockquote":
+            for t in get_command_lines(node):
+                try:
+                    yield parse_inline_command(t)
+                except (SyntaxError, ValueError):
+                    continue
+
+        elif node.type == "fence" and node.tag == "code":
+            try:
+                command = parse_block_command(node.info)
+            except SyntaxError:
+                continue
+            if command is None:
+                continue
+
+            yield command
+            if command.name != "python_yerba_block":
+                yield from iter_commands(get_markdownit_nodes(node.content))
+
+
+def validate_nodes(nodes, presentation_cls) -> list[tuple[str, str]]:
+    """
+    Parse every command in `nodes` and check that it can be dispatched to
+    `presentation_cls`. Returns a list of (source, error) tuples.
+    """
+    errors = []
+
+    def check_name(command):
+        f = getattr(presentation_cls, command.name, None)
+        if not callable(f):
+            errors.append((command.source,
+                           f"{command.name!r} is not a valid command"))
+
+    for node in nodes:
+        if node.type == "blockquote":
+            for t in get_command_lines(node):
+                try:
+                    command = parse_inline_command(t)
+                except (SyntaxError, ValueError) as e:
+                    errors.append((t, f"{type(e).__name__}: {e}"))
+                    continue
+                if command.kind == "inline":
+                    check_name(command)
+
+        elif node.type == "fence" and node.tag == "code":
+            try:
+                command = parse_block_command(node.info)
+            except SyntaxError as e:
+                errors.append((node.info, f"{type(e).__name__}: {e}"))
+                continue
+            if command is None:
+                continue
+
+            check_name(command)
+            if command.name == "python_yerba_block":
+                try:
+                    compile_python_block(node.content)
+                except SyntaxError as e:
+                    errors.append((node.info, f"{type(e).__name__}: {e}"))
+            else:
+                nested_nodes = get_markdownit_nodes(node.content)
+                errors += validate_nodes(nested_nodes, presentation_cls)
+
+    return errors
+
+
+def validate_slides(slides: list[dict], presentation_cls) -> list[CommandError]:
+    """
+    Validate the commands of all the slides without rendering them.
+    """
+    errors = []
+    for slide in slides:
+        if "title" in slide:
+            title = slide["title"].children[0].content
+        else:
+            title = ""
+        for source, error in validate_nodes(slide["content"],
+                                            presentation_cls):
+            errors.append(
+                CommandError(slide["slide_number"], title, source, error)
+            )
+    return errors
@@ -0,0 +1,100 @@
+"""
+Fingerprint of a build, used to skip builds when nothing changed.
+
+This module must not import manim (nor anything that imports it), since it is
+used before deciding whether manim is needed at all.
+"""
+from __future__ import annotations
+import os
+import re
+import glob
+import json
+import hashlib
+from urllib.parse import quote
+
+# tokens of the markdown that may be paths to files (images, templates...)
+PATH_PATTERN = re.compile(r"[^\s\"'`()\[\]{}<>,=]+\.[A-Za-z0-9]+")
+
+
+def get_yerba_version() -> str:
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        return "unknown"
+    try:
+        return version("yerba")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def find_dependencies(text: str, folder: str = "") -> list[str]:
+    """
+    Return the files the presentation may depend on: every existing file
+    referenced in the markdown (and in the markdown files it references,
+    e.g. included ones), and the python files of the current folder (custom
+    templates). Paths are looked up in the current folder and, like
+    `!include`, in the folder of the markdown file (`folder`).
+    """
+    deps = set()
+    texts = [(text, folder)]
+    while texts:
+        text, folder = texts.pop()
+        for ref in PATH_PATTERN.findall(text):
+            for path in {ref, os.path.normpath(os.path.join(folder, ref))}:
+                if path in deps or not os.path.isfile(path):
+                    continue
+                deps.add(path)
+                if path.endswith(".md"):
+                    with open(path, "rb") as f:
+                        texts.append((f.read().decode(errors="ignore"),
+                                      os.path.dirname(path)))
+    deps.update(glob.glob("*.py"))
+    return sorted(deps)
+
+
+def _stat_key(path) -> str:
+    st = os.stat(path)
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def get_build_fingerprint(filename, extra: dict | None = None) -> str:
+    """
+    Hash the markdown file, the size and modification time of its
+    dependencies, the yerba version and `extra` (e.g. the command line
+    options).
+    """
+    with open(filename, "rb") as f:
+        content = f.read()
+
+    h = hashlib.sha256(content)
+    h.update(get_yerba_version().encode())
+    h.update(json.dumps(extra or {}, sort_keys=True).encode())
+    for dep in find_dependencies(content.decode(errors="ignore"),
+                                 os.path.dirname(filename)):
+        h.update(_stat_key(dep).encode())
+    return h.hexdigest()
+
+
+def get_fingerprint_filename(filename) -> str:
+    return (f"./media/.fingerprint."
+            f"{quote(os.path.normpath(filename), safe='')}.json")
+
+
+def save_build_fingerprint(filename, output_filename, fingerprint) -> None:
+    with open(get_fingerprint_filename(filename), "w") as f:
+        json.dump({"fingerprint": fingerprint,
+                   "output": _stat_key(output_filename)}, f)
+
+
+def is_build_up_to_date(filename, output_filename, fingerprint) -> bool:
+    """
+    Check if the last build had the same fingerprint and its output wasn't
+    modified or removed since then.
+    """
+    try:
+        with open(get_fingerprint_filename(filename)) as f:
+            last = json.load(f)
+        return (last["fingerprint"] == fingerprint
+                and last["output"] == _stat_key(output_filename))
+    except (OSError, ValueError, KeyError):
+        return False
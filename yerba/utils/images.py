@@ -0,0 +1,115 @@
+from __future__ import annotations
+import os
+import hashlib
+from functools import lru_cache
+
+from PIL import Image
+
+from .others import get_cache_dir
+from .cache import cache_stats
+
+# the PDF page has one point per slide pixel, i.e. 72 slide pixels per inch
+SLIDE_PX_PER_INCH: float = 72
+
+# only resample if the image is at least this much bigger than needed
+RESAMPLE_MIN_RATIO: float = 1.1
+
+# images with at most this number of colors are considered line art
+LINE_ART_MAX_COLORS: int = 4096
+
+
+@lru_cache(maxsize=1024)
+def _file_hash(filename, size, mtime_ns) -> str:
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_file_hash(filename) -> str:
+    """Hash of the content of a file (cached by size and mtime)."""
+    st = os.stat(filename)
+    return _file_hash(filename, st.st_size, st.st_mtime_ns)
+
+
+@lru_cache(maxsize=1024)
+def _image_size(filename, size, mtime_ns) -> tuple[int, int]:
+    with Image.open(filename) as img:
+        return img.size
+
+
+def get_image_size(filename) -> tuple[int, int]:
+    """Size of an image in pixels (cached by size and mtime of the file)."""
+    st = os.stat(filename)
+    return _image_size(filename, st.st_size, st.st_mtime_ns)
+
+
+def is_line_art(img: Image.Image) -> bool:
+    return img.getcolors(maxcolors=LINE_ART_MAX_COLORS) is not None
+
+
+def get_target_size(img_size, display_width, display_height,
+                    target_dpi) -> tuple[int, int] | None:
+    """
+    Size that the image needs to have to be displayed with `target_dpi`, or
+    None if it is already small enough.
+    """
+    scale = target_dpi/SLIDE_PX_PER_INCH
+    tw = max(1, round(display_width*scale))
+    th = max(1, round(display_height*scale))
+    iw, ih = img_size
+    if iw < tw*RESAMPLE_MIN_RATIO and ih < th*RESAMPLE_MIN_RATIO:
+        return None
+    return tw, th
+
+
+def get_resampled_image(filename, display_width, display_height,
+                        target_dpi=144, jpeg_quality=90) -> str:
+    """
+    Return the filename of a copy of the image resampled to the size (in
+    slide pixels) at which it is displayed, with `target_dpi` dots per inch.
+
+    Photos are encoded as JPEG and line art and images with transparency as
+    PNG. The copies are stored in ./media/yerba_cache/images/, by hash of
+    the original file and target size. If the image doesn't need to be
+    resampled (or `target_dpi` is None), the original filename is returned.
+    """
+    if not target_dpi:
+        return filename
+
+    with Image.open(filename) as img:
+        target_size = get_target_size(img.size, display_width,
+                                      display_height, target_dpi)
+        if target_size is None:
+            return filename
+
+        has_alpha = (img.mode in ("RGBA", "LA", "PA")
+                     or "transparency" in img.info)
+        line_art = has_alpha or is_line_art(img)
+        ext = "png" if line_art else "jpg"
+
+        w, h = target_size
+        out_filename = os.path.join(
+            get_cache_dir("images", shared=True),
+            f"{get_file_hash(filename)}_{w}x{h}_q{jpeg_quality}.{ext}"
+        )
+        if os.path.exists(out_filename):
+            cache_stats.hit("images", out_filename)
+            return out_filename
+        cache_stats.miss("images")
+
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        img = img.resize(target_size, Image.LANCZOS)
+
+        # write to a temporary file, so a killed build doesn't leave a broken
+        # image in the cache
+        tmp_filename = f"{out_filename}.{os.getpid()}.tmp"
+        if line_art:
+            img.save(tmp_filename, format="PNG", optimize=True)
+        else:
+            img.save(tmp_filename, format="JPEG", quality=jpeg_quality,
+                     optimize=True, progressive=True)
+        os.replace(tmp_filename, out_filename)
+
+    return out_filename
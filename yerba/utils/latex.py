@@ -1,6 +1,11 @@
+from __future__ import annotations
 import os
 import re
-import pkg_resources
+import math
+import shutil
+import hashlib
+import subprocess
+from functools import lru_cache
 from markdown_it import MarkdownIt
 from markdown_it.tree import SyntaxTreeNode
 import mdformat
@@ -8,8 +13,12 @@ from mdformat.renderer._context import (
     DEFAULT_RENDERERS, make_render_children, longest_consecutive_sequence
 )
 
+from manim import logger
+
 from .constants import *
-from ..defaults import colors
+from .others import get_cache_dir
+from .cache import cache_stats
+from ..defaults import colors, template_params
 
 # make colors global variables
 for k, v in colors.items():
@@ -119,13 +128,18 @@ class YerbaRenderers:
 
 # ---
 
+# fonts shipped with yerba (with a trailing slash, as fontspec expects)
+YERBA_FONTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "templates", "fonts", ""
+)
+
 
 def add_font_to_preamble(preamble, regular, bold, italic, bold_italic,
                          fonts_path=None):
 
     if fonts_path is None:
-        yerba_font_path = pkg_resources.resource_filename(
-            __name__, '../templates/fonts/')
+        yerba_font_path = YERBA_FONTS_DIR
         yerba_regular_font_path = os.path.join(yerba_font_path, regular)
         if os.path.exists(yerba_regular_font_path):
             fonts_path_str = f"Path = {yerba_font_path}"
@@ -146,11 +160,178 @@ def add_font_to_preamble(preamble, regular, bold, italic, bold_italic,
     preamble.add_to_preamble(t)
 
 
-def update_tex_enviroment_using_box(box, font_size, tex_template, xmargin=0):
-    tex_template = tex_template.copy()
-    pt = box.width/SLIDE_WIDTH * 24/font_size * (820-xmargin)
-    tex_template.add_to_preamble(fr"""
-        \usepackage{{geometry}}
-        \geometry{{papersize={{{pt}pt, 20cm}}}}
-    """)
+BOX_ENVIRONMENT_PREAMBLE = r"""
+    \newlength{\yerbaparindent}
+    \newenvironment{yerbabox}[2]{%
+        \setlength{\yerbaparindent}{\parindent}%
+        \edef\yerbaboxenv{#2}%
+        \begin{minipage}{#1}%
+        \setlength{\parindent}{\yerbaparindent}%
+        \expandafter\begin\expandafter{\yerbaboxenv}%
+    }{%
+        \expandafter\end\expandafter{\yerbaboxenv}%
+        \end{minipage}%
+    }
+"""
+
+
+def add_box_environment_to_preamble(tex_template):
+    """
+    Define the `yerbabox` environment, used to typeset paragraphs with the
+    width of their box without changing the preamble.
+    """
+    if "{yerbabox}" not in tex_template.preamble:
+        tex_template.add_to_preamble(BOX_ENVIRONMENT_PREAMBLE)
     return tex_template
+
+
+def get_tex_environment_using_box(box, font_size, tex_environment,
+                                  xmargin=0, step=1):
+    """
+    Return a `yerbabox` environment (see `add_box_environment_to_preamble`)
+    that wraps `tex_environment` in a minipage with the width of the box.
+
+    The width goes in the body of the document, so every box shares the same
+    preamble. It is rounded down to a multiple of `step` (in pt) so boxes with
+    almost the same width produce the same TeX code and hit the same cache.
+    """
+    paper_pt = box.width/SLIDE_WIDTH * 24/font_size * (820-xmargin)
+    # 0.7 is the default text width / paper width ratio of `geometry`
+    pt = step * math.floor(0.7*paper_pt/step)
+    return f"yerbabox}}{{{pt:g}pt}}{{{tex_environment}"
+
+
+# ---
+
+FONT_COMMANDS_PATTERN = (
+    r"\\(setmainfont|setsansfont|setmonofont|setmathfont|newfontfamily"
+    r"|newfontface|defaultfontfeatures)\b"
+)
+
+_precompiled_tex_templates: dict = {}
+
+
+@lru_cache(maxsize=None)
+def _get_xelatex_version() -> str | None:
+    if not shutil.which("xelatex"):
+        return None
+    return subprocess.run(["xelatex", "--version"], stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL).stdout.decode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def _has_mylatexformat() -> bool:
+    if not shutil.which("kpsewhich"):
+        return False
+    out = subprocess.run(["kpsewhich", "mylatexformat.ltx"],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return bool(out.stdout.strip())
+
+
+def _split_preamble_for_dump(preamble) -> tuple[str, str]:
+    """
+    Split the preamble in the part that can be dumped into a format and the
+    part that can't. XeTeX can't store OpenType fonts in a format, so
+    everything from the first fontspec font command on is loaded on each run.
+    """
+    m = re.search(FONT_COMMANDS_PATTERN, preamble)
+    if m is None:
+        return preamble, ""
+    line_start = preamble.rfind("\n", 0, m.start()) + 1
+    return preamble[:line_start], preamble[line_start:]
+
+
+def _build_tex_format(fmt_dir, fmt_name, documentclass, dump_preamble) -> bool:
+    # built with its own name and renamed, since other processes (sharing
+    # 'cache.shared_dir') may be building or loading the same format
+    job_name = f"{fmt_name}.{os.getpid()}"
+    tex_file = os.path.abspath(os.path.join(fmt_dir, f"{job_name}.tex"))
+    with open(tex_file, "w") as f:
+        f.write("\n".join([documentclass, dump_preamble, r"\endofdump",
+                           r"\begin{document}", r"\end{document}", ""]))
+
+    subprocess.run(
+        ["xelatex", "-ini", "-interaction=batchmode", "-halt-on-error",
+         f"-jobname={job_name}", f"-output-directory={fmt_dir}",
+         "&xelatex", "mylatexformat.ltx", tex_file],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for ext in (".tex", ".log", ".fmt"):
+        job_file = os.path.join(fmt_dir, f"{job_name}{ext}")
+        if os.path.exists(job_file):
+            os.replace(job_file, os.path.join(fmt_dir, f"{fmt_name}{ext}"))
+    return os.path.exists(os.path.join(fmt_dir, f"{fmt_name}.fmt"))
+
+
+def get_precompiled_tex_template(tex_template):
+    """
+    Return a copy of `tex_template` that loads a precompiled xelatex format
+    with its preamble (see `mylatexformat`). The format is dumped in
+    ./media/yerba_cache/tex_formats/ the first time a preamble is used, and
+    it is named after the hash of the preamble, so any change in the
+    template, the fonts or `add_to_preamble` produces a new format.
+
+    If the format can't be built, the original template is returned.
+    """
+    if (not template_params["tex.precompiled_format"]
+            or tex_template.tex_compiler != "xelatex"):
+        return tex_template
+
+    key = (tex_template.documentclass, tex_template.preamble)
+    if key in _precompiled_tex_templates:
+        return _precompiled_tex_templates[key]
+
+    xelatex_version = _get_xelatex_version()
+    if xelatex_version is None or not _has_mylatexformat():
+        _precompiled_tex_templates[key] = tex_template
+        return tex_template
+
+    dump_preamble, rest_preamble = _split_preamble_for_dump(
+        tex_template.preamble)
+
+    h = hashlib.sha256(
+        repr((xelatex_version, *key)).encode()
+    ).hexdigest()[:16]
+    fmt_name = f"yerba-{h}"
+    fmt_dir = os.path.abspath(get_cache_dir("tex_formats", shared=True))
+    fmt_file = os.path.join(fmt_dir, f"{fmt_name}.fmt")
+
+    # a failed build isn't recorded on disk (only in this process, see
+    # `_precompiled_tex_templates`), so it is retried by the next run, e.g.
+    # after installing a missing package
+    if os.path.exists(fmt_file):
+        built = True
+        cache_stats.hit("tex_formats", fmt_file)
+    else:
+        cache_stats.miss("tex_formats")
+        logger.info("Precompiling the TeX preamble")
+        built = _build_tex_format(fmt_dir, fmt_name,
+                                  tex_template.documentclass, dump_preamble)
+        if not built:
+            logger.warning(
+                "The TeX preamble can't be precompiled, using it as is "
+                f"(see {os.path.join(fmt_dir, fmt_name)}.log)"
+            )
+
+    if not built:
+        _precompiled_tex_templates[key] = tex_template
+        return tex_template
+
+    texformats = os.environ.get("TEXFORMATS", "")
+    if fmt_dir not in texformats.split(os.pathsep):
+        # the trailing separator keeps the default search path
+        os.environ["TEXFORMATS"] = os.pathsep.join([fmt_dir, texformats])
+
+    new_tex_template = tex_template.copy()
+    new_tex_template.documentclass = (
+        f"%&{fmt_name}\n" + tex_template.documentclass
+    )
+    new_tex_template.preamble = "\n".join(
+        [dump_preamble, r"\endofdump", rest_preamble]
+    )
+    _precompiled_tex_templates[key] = new_tex_template
+    # so precompiling it again returns it as is
+    _precompiled_tex_templates[
+        (new_tex_template.documentclass, new_tex_template.preamble)
+    ] = new_tex_template
+    return new_tex_template
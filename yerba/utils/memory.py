@@ -0,0 +1,108 @@
+from __future__ import annotations
+import gc
+import sys
+import tracemalloc
+from collections import OrderedDict
+
+import manim.mobject.svg.svg_mobject as svg_mobject
+from manim import logger
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class BoundedCache(OrderedDict):
+    """A dict that only keeps its `maxsize` most recently used items."""
+
+    def __init__(self, maxsize: int, *args, **kwargs):
+        self.maxsize = maxsize
+        super().__init__(*args, **kwargs)
+        self._trim()
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        self._trim()
+
+    def resize(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._trim()
+
+    def _trim(self) -> None:
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+def bound_manim_svg_cache(maxsize: int) -> None:
+    """
+    Manim keeps a copy of every SVGMobject (so every Tex) it creates in
+    `SVG_HASH_TO_MOB_MAP`, which grows with the deck. Replace it by a
+    `BoundedCache`.
+    """
+    cache = svg_mobject.SVG_HASH_TO_MOB_MAP
+    if isinstance(cache, BoundedCache):
+        cache.resize(maxsize)
+    else:
+        svg_mobject.SVG_HASH_TO_MOB_MAP = BoundedCache(maxsize, cache)
+
+
+def release_memory(clear_svg_cache: bool = False) -> None:
+    """
+    Collect the reference cycles between mobjects, boxes and slides. If
+    `clear_svg_cache` is True, the copies of the SVGMobjects kept by manim
+    (see `bound_manim_svg_cache`) are dropped first.
+    """
+    if clear_svg_cache:
+        svg_mobject.SVG_HASH_TO_MOB_MAP.clear()
+    gc.collect()
+
+
+def get_peak_rss_mb() -> float | None:
+    """Peak resident set size of the process, in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak/1024**2 if sys.platform == "darwin" else peak/1024
+
+
+class MemoryReporter:
+    """
+    Log the peak RSS after each slide is written. If `use_tracemalloc` is
+    True, the peak of the python allocations during each slide is also
+    logged (slower).
+    """
+
+    def __init__(self, use_tracemalloc: bool = False) -> None:
+        self.use_tracemalloc = use_tracemalloc
+        self.peaks: list[tuple[int, float | None]] = []
+        self.last_peak_rss: float | None = get_peak_rss_mb()
+
+        if use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def slide_written(self, slide_number: int) -> None:
+        rss = get_peak_rss_mb()
+        self.peaks.append((slide_number, rss))
+
+        msg = f"Memory after slide {slide_number}:"
+        if rss is not None:
+            msg += f" peak RSS {rss:.0f} MB"
+            if self.last_peak_rss is not None:
+                msg += f" (+{rss - self.last_peak_rss:.0f} MB)"
+            self.last_peak_rss = rss
+
+        if self.use_tracemalloc:
+            _, peak = tracemalloc.get_traced_memory()
+            msg += f", python peak {peak/1024**2:.0f} MB"
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+
+        logger.info(msg)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+import os
+import shutil
+import asyncio
+import tempfile
+import threading
+import concurrent.futures
+from pathlib import Path
+from contextvars import ContextVar
+from asyncio.subprocess import DEVNULL
+
+from manim import config, logger
+from manim.utils.tex_file_writing import tex_hash
+
+from .others import get_cache_dir
+
+
+def get_tex_code(expression, environment, tex_template) -> str:
+    """TeX file that manim writes for a snippet (see `generate_tex_file`)."""
+    if environment is not None:
+        return tex_template.get_texcode_for_expression_in_env(expression,
+                                                             environment)
+    return tex_template.get_texcode_for_expression(expression)
+
+
+def get_tex_svg_file(expression, environment, tex_template) -> Path:
+    """Svg file in which manim caches a snippet (see `tex_to_svg_file`)."""
+    tex_code = get_tex_code(expression, environment, tex_template)
+    return config.get_dir("tex_dir") / f"{tex_hash(tex_code)}.svg"
+
+
+def get_tex_compilation_command(tex_compiler, output_format, tex_file,
+                                out_dir) -> list[str]:
+    """Same command as `manim.utils.tex_file_writing.compile_tex`."""
+    if tex_compiler in {"latex", "pdflatex", "luatex", "lualatex"}:
+        return [tex_compiler, "-interaction=batchmode",
+                f"-output-format={output_format[1:]}", "-halt-on-error",
+                f"-output-directory={out_dir}", tex_file]
+    elif tex_compiler == "xelatex":
+        if output_format not in (".xdv", ".pdf"):
+            raise ValueError("xelatex output is either pdf or xdv")
+        outflag = ["-no-pdf"] if output_format == ".xdv" else []
+        return ["xelatex", *outflag, "-interaction=batchmode",
+                "-halt-on-error", f"-output-directory={out_dir}", tex_file]
+    raise ValueError(f"Tex compiler {tex_compiler} unknown.")
+
+
+# orchestrator of the build that is running (see `MainRutine.run`)
+current_orchestrator: ContextVar[BuildOrchestrator | None] = ContextVar(
+    "current_orchestrator", default=None
+)
+
+
+class BuildOrchestrator:
+    """
+    Run the external tools of a build in the background while the slides are
+    computed, which has to be done one after the other:
+
+    - TeX snippets of the next slides (see `prefetch_tex`) are compiled with
+      xelatex and dvisvgm as asyncio subprocesses, at most `max_jobs` at the
+      same time, and moved to manim's Tex cache. When `Ptex` reaches one of
+      them, it waits for its job instead of compiling it again.
+    - files that the slides will load (images, see `prefetch`) are loaded
+      in a thread pool by cached functions, so the result is waiting in the
+      cache when the slide is computed.
+    - the output of the written slides (files and PDF pages) is written by
+      `submit_output`, in the order in which it was submitted.
+
+    The event loop runs in its own thread. Snippets that fail to compile are
+    ignored here, so their errors are reported when manim compiles them.
+    """
+
+    def __init__(self, max_jobs: int | None = None) -> None:
+        self.max_jobs: int = max_jobs or os.cpu_count() or 1
+        self.jobs_dir: str = os.path.abspath(get_cache_dir("tex_jobs"))
+        # svg file -> compilation job
+        self.tex_jobs: dict[Path, concurrent.futures.Future] = {}
+        self.output_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="yerba-output"
+        )
+        self.output_futures: list[concurrent.futures.Future] = []
+        self.prefetch_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_jobs, thread_name_prefix="yerba-prefetch"
+        )
+        # (func, *args) -> prefetch job
+        self.prefetch_jobs: dict[tuple, concurrent.futures.Future] = {}
+        self.processes: set[asyncio.subprocess.Process] = set()
+        self.closing: bool = False
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name="yerba-build", daemon=True)
+        self.thread.start()
+        self._submit(self._setup()).result()
+
+    def _submit(self, coro) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _setup(self) -> None:
+        # created in the loop (needed before python 3.10)
+        self.semaphore = asyncio.Semaphore(self.max_jobs)
+
+    async def run_tool(self, *cmd) -> int | None:
+        """
+        Run an external program (waiting for a free job slot). Returns its
+        exit code, or None if the orchestrator was closed before it ran.
+        """
+        async with self.semaphore:
+            if self.closing:
+                return None
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=DEVNULL, stderr=DEVNULL
+            )
+            self.processes.add(proc)
+            try:
+                if self.closing:
+                    proc.kill()
+                return await proc.wait()
+            finally:
+                self.processes.discard(proc)
+
+    async def _stop_tools(self) -> None:
+        self.closing = True
+        for proc in self.processes:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        tasks = [t for t in asyncio.all_tasks()
+                 if t is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # -- TeX
+
+    async def _compile_tex(self, tex_code, tex_template, svg_file) -> bool:
+        # each job has its own folder, since manim deletes everything but the
+        # .tex and .svg files of its Tex cache after compiling
+        job_dir = tempfile.mkdtemp(dir=self.jobs_dir)
+        try:
+            tex_file = os.path.join(job_dir, f"{svg_file.stem}.tex")
+            with open(tex_file, "w", encoding="utf-8") as f:
+                f.write(tex_code)
+
+            output_format = tex_template.output_format
+            dvi_file = os.path.splitext(tex_file)[0] + output_format
+            job_svg_file = os.path.splitext(tex_file)[0] + ".svg"
+            pdf_flag = ["--pdf"] if output_format == ".pdf" else []
+            try:
+                await self.run_tool(*get_tex_compilation_command(
+                    tex_template.tex_compiler, output_format, tex_file,
+                    job_dir
+                ))
+                if not os.path.exists(dvi_file):
+                    return False
+                await self.run_tool("dvisvgm", *pdf_flag, "-p", "1",
+                                    dvi_file, "-n", "-v", "0",
+                                    "-o", job_svg_file)
+            except OSError:
+                # the program isn't installed
+                return False
+            if not os.path.exists(job_svg_file):
+                return False
+
+            svg_file.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(job_svg_file, svg_file)
+            return True
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def prefetch_tex(self, expression, environment, tex_template) -> None:
+        """Compile a snippet in the background if it isn't cached."""
+        svg_file = get_tex_svg_file(expression, environment, tex_template)
+        if svg_file in self.tex_jobs or svg_file.exists():
+            return
+        tex_code = get_tex_code(expression, environment, tex_template)
+        self.tex_jobs[svg_file] = self._submit(
+            self._compile_tex(tex_code, tex_template, svg_file.absolute())
+        )
+
+    def wait_for_tex(self, expression, environment, tex_template) -> bool:
+        """
+        Wait until the snippet is compiled, if it is being compiled. Returns
+        True if it was compiled in the background.
+        """
+        svg_file = get_tex_svg_file(expression, environment, tex_template)
+        job = self.tex_jobs.pop(svg_file, None)
+        if job is None:
+            return False
+        try:
+            job.result()
+        except Exception as e:
+            logger.debug(f"Background TeX compilation failed: {e}")
+        return True
+
+    # -- files
+
+    def prefetch(self, func, *args) -> None:
+        """
+        Call `func(*args)` in the prefetch pool. `func` must cache its
+        result (e.g. with `lru_cache`), since the result is discarded.
+        """
+        key = (func, *args)
+        if key not in self.prefetch_jobs:
+            self.prefetch_jobs[key] = self.prefetch_executor.submit(func,
+                                                                    *args)
+
+    def wait_for(self, func, *args) -> None:
+        """Wait until `func(*args)` is prefetched, if it is being prefetched."""
+        job = self.prefetch_jobs.pop((func, *args), None)
+        if job is not None:
+            # errors are raised again when `func` is called
+            concurrent.futures.wait([job])
+
+    # -- output
+
+    def submit_output(self, func, *args) -> None:
+        """Run `func(*args)` in the output thread, after the previous ones."""
+        self.output_futures.append(self.output_executor.submit(func, *args))
+        # raise the errors of the finished tasks as soon as possible
+        while self.output_futures and self.output_futures[0].done():
+            self.output_futures.pop(0).result()
+
+    def flush(self) -> None:
+        """Wait until all the output is written."""
+        while self.output_futures:
+            self.output_futures.pop(0).result()
+
+    def close(self) -> None:
+        """
+        Write the pending output and stop the prefetch and TeX jobs that are
+        left (they were wrong guesses). Tasks aren't cancelled, since a cancelled
+        subprocess creation may never finish.
+        """
+        self.flush()
+        self.output_executor.shutdown()
+        for job in self.prefetch_jobs.values():
+            job.cancel()
+        self.prefetch_jobs.clear()
+        self.prefetch_executor.shutdown()
+
+        self._submit(self._stop_tools()).result()
+        self.tex_jobs.clear()
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
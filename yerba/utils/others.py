@@ -1,11 +1,14 @@
 from __future__ import annotations
 import os
+import time
 import shutil
 from typing import NamedTuple
-from manim.utils.family import extract_mobject_family_members
+from urllib.parse import quote
+from contextvars import ContextVar
 from manim import Mobject, VGroup
 from manim import logger, console
 from ..defaults import parser_params
+from .cache import has_zstd
 
 
 class LinkedPositions(NamedTuple):
@@ -14,6 +17,18 @@ class LinkedPositions(NamedTuple):
     arrange: str | "Box" = None
 
 
+class SlideError(Exception):
+    """
+    Error in the content of a slide, raised by `exec_and_handle_exeption`
+    instead of quitting while `raise_slide_errors` is True.
+    """
+
+
+# True while a slide is computed in a keep-going build ('errors.keep_going')
+raise_slide_errors: ContextVar[bool] = ContextVar("raise_slide_errors",
+                                                  default=False)
+
+
 def exec_and_handle_exeption(func, msg, error_type="inline",
                              f_args=None, f_kwargs=None, verbose=None):
     f_args = f_args or tuple()
@@ -24,23 +39,29 @@ def exec_and_handle_exeption(func, msg, error_type="inline",
     try:
         return func(*f_args, **f_kwargs)
     except BaseException as e:
-        if verbose:
-            console.print_exception(suppress=(__file__, ))
+        if isinstance(e, (SlideError, KeyboardInterrupt, SystemExit)):
+            # already reported, or the build is being stopped
+            raise
 
-        elif error_type == "inline":
+        if error_type == "inline":
             t = (msg.replace(r"%20", r" ")
                  .replace(r"%22", r'"')
                  .replace(r"%5B", r"[")
                  .replace(r"%5D", r"]"))
-            logger.error(
-                f"There seems to be an error with the following line:\n{t}"
-                f"\nPython error: {e}"
-            )
+            message = (f"There seems to be an error with the following "
+                       f"line:\n{t}\nPython error: {e}")
         elif error_type == "custom":
-            logger.error(msg+f"\nPython error: {e}")
+            message = msg+f"\nPython error: {e}"
         else:
             raise ValueError("'error_type' must be 'inline' or 'custom'")
 
+        if verbose:
+            console.print_exception(suppress=(__file__, ))
+        else:
+            logger.error(message)
+
+        if raise_slide_errors.get():
+            raise SlideError(message) from e
         quit()
 
 
@@ -55,82 +76,23 @@ def look_for_parent_box_recursively(box):
         box = look_for_parent_box_recursively(box)
 
 
-def restructure_list_to_exclude_certain_family_members(mobject_list, to_remove):
-    """
-    Modified version of the function
-    `manim.utils.family_opts.restructure_list_to_exclude_certain_family_members`.
-    This version raise a value error if any member of to_remove is not a child of
-    the mobject_list.
-
-    ---
-    Removes anything in to_remove from mobject_list, but in the event that one of
-    the items to be removed is a member of the family of an item in mobject_list,
-    the other family members are added back into the list.
-
-    This is useful in cases where a scene contains a group, e.g. Group(m1, m2, m3),
-    but one of its submobjects is removed, e.g. scene.remove(m1), it's useful
-    for the list of mobject_list to be edited to contain other submobjects, but not m1.
-    """
-    new_list = []
-    to_remove = extract_mobject_family_members(to_remove)
-
-    def add_safe_mobjects_from_list(list_to_examine, set_to_remove):
-        removed = False
-        for mob in list_to_examine:
-            if mob in set_to_remove:
-                removed = True
-                continue
-            intersect = set_to_remove.intersection(mob.get_family())
-            if intersect:
-                removed = True
-                add_safe_mobjects_from_list(mob.submobjects, intersect)
-            else:
-                new_list.append(mob)
-        if not removed:
-            raise ValueError(f"Couldn't find the mobject in the list")
-
-    add_safe_mobjects_from_list(mobject_list, set(to_remove))
-
-    return new_list
-
-
-def replace_in_list(
-    mobj_list: list[Mobject], old_m: Mobject, new_m: Mobject
-) -> None:
+def get_deck_dir(kind, filename) -> str:
     """
-    Modified version of the function `manim.Scene.replace`
+    Folder of a presentation inside ./media/<kind>/ (e.g. its slides), so
+    presentations in the same folder don't share their files.
     """
-    # We use breadth-first search because some Mobjects get very deep and
-    # we expect top-level elements to be the most common targets for replace.
-    for i in range(0, len(mobj_list)):
-        # Is this the old mobject?
-        if mobj_list[i] == old_m:
-            # If so, write the new object to the same spot and stop looking.
-            mobj_list[i] = new_m
-            return
-    # Now check all the children of all these mobs.
-    for mob in mobj_list:  # noqa: SIM110
-        if replace_in_list(mob.submobjects, old_m, new_m):
-            # If we found it in a submobject, stop looking.
-            return
-    # If we did not find the mobject in the mobject list or any submobjects,
-    # (or the list was empty), indicate we did not make the replacement.
-    raise ValueError(f"Couldn't find the mobject in the list")
-
-
-def create_folder_structure():
-    if not os.path.exists("./media"):
-        os.mkdir("./media")
-
-    if not os.path.exists("./media/slides"):
-        os.mkdir("./media/slides")
-
-    if not os.path.exists("./media/old_slides"):
-        os.mkdir("./media/old_slides")
+    return os.path.join("./media", kind,
+                        quote(os.path.normpath(filename), safe=""))
+
+
+def create_folder_structure(filename):
+    os.makedirs(get_deck_dir("slides", filename), exist_ok=True)
+    os.makedirs(get_deck_dir("old_slides", filename), exist_ok=True)
 
 
 def check_dependencies():
-    if not shutil.which("rsvg-convert"):
+    if (parser_params["output.backend"] == "svg"
+            and not shutil.which("rsvg-convert")):
         logger.error(
             "rsvg-convert is not installed or it is not in the system's PATH."
         )
@@ -140,3 +102,39 @@ def check_dependencies():
             "xetex is not installed or it is not in the system's PATH."
         )
         quit()
+    if parser_params["cache.compression"] == "zstd" and not has_zstd():
+        logger.warning(
+            "The 'zstandard' package is not installed, the cache won't be "
+            "compressed."
+        )
+
+
+def get_source_date_epoch() -> int | None:
+    """
+    Time (in seconds since the epoch) to write in the output files instead
+    of the current time: SOURCE_DATE_EPOCH if it's set, 0 in reproducible
+    builds, and None otherwise.
+    """
+    epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if epoch:
+        return int(epoch)
+    return 0 if parser_params["output.reproducible"] else None
+
+
+def format_pdf_date(epoch: int) -> str:
+    """Date in the format of cairo's PDF metadata."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+def get_cache_dir(name, shared=False):
+    """
+    Return (and create if needed) a yerba cache folder inside ./media, or
+    inside 'cache.shared_dir' if it's set and the cache can be `shared` by
+    several presentations.
+    """
+    root = "./media/yerba_cache"
+    if shared and parser_params["cache.shared_dir"]:
+        root = parser_params["cache.shared_dir"]
+    path = os.path.join(root, name)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -1,14 +1,28 @@
+from __future__ import annotations
+import os
+import re
+import json
+import hashlib
+from functools import lru_cache
+from urllib.parse import quote
+
 from markdown_it import MarkdownIt
 from markdown_it.tree import SyntaxTreeNode
 from mdit_py_plugins.front_matter import front_matter_plugin
 from mdit_py_plugins.dollarmath import dollarmath_plugin
 
 
+def _token_without_map(token):
+    d = token.as_dict()
+    d.pop("map", None)
+    return d
+
+
 def are_nodes_equal(node1, node2):
-    node1_tokens = node1.to_tokens()
-    node2_tokens = node2.to_tokens()
-    for nt in node1_tokens+node2_tokens:
-        nt.map = [0, 0]
+    # the line numbers are ignored without modifying the tokens (their
+    # `map` is used to find the slide of a line)
+    node1_tokens = [_token_without_map(t) for t in node1.to_tokens()]
+    node2_tokens = [_token_without_map(t) for t in node2.to_tokens()]
     return node1_tokens == node2_tokens
 
 
@@ -25,7 +39,7 @@ def get_markdownit_nodes(text):
 
 def get_slides_md_nodes(md_file, old_md_file) -> list[dict]:
     if old_md_file is None:
-        old_text = '#'
+        old_text = None
     else:
         with open(old_md_file, "r") as f:
             old_text = f.read()
@@ -33,9 +47,37 @@ def get_slides_md_nodes(md_file, old_md_file) -> list[dict]:
     with open(md_file, "r") as f:
         text = f.read()
 
+    return get_slides_md_nodes_from_text(text, old_text)
+
+
+def split_slides(nodes, is_new_slide=True) -> list[dict]:
+    """
+    Split the nodes in slides, without comparing them with an old version
+    (the content before the first title is the slide 0).
+    """
+    slides = [{'slide_number': 0, 'content': [],
+               'is_new_slide': is_new_slide}]
+    for node in nodes:
+        if is_h1(node):
+            slides.append({'slide_number': len(slides), 'title': node,
+                           'content': [], 'is_new_slide': is_new_slide})
+        else:
+            slides[-1]['content'].append(node)
+    return slides
+
+
+def get_slides_md_nodes_from_text(text, old_text=None) -> list[dict]:
     nodes = get_markdownit_nodes(text)
+    if old_text == text or not any(map(is_h1, nodes)):
+        # nothing to compare slide by slide
+        return split_slides(nodes, is_new_slide=old_text != text)
+
+    if old_text is None:
+        old_text = '#'
 
     old_nodes = get_markdownit_nodes(old_text)
+    if not any(map(is_h1, old_nodes)):
+        old_nodes = get_markdownit_nodes('#')
 
     old_idx = 0
     old_idx_max = len(tuple(old_nodes))-1
@@ -129,3 +171,226 @@ def get_slides_md_nodes(md_file, old_md_file) -> list[dict]:
     slides.append(d)
 
     return slides
+
+
+# --- decks of several files
+
+INCLUDE_PATTERN = re.compile(r"!include\s+(\S+)")
+
+
+def get_snapshot_filename(filename) -> str:
+    """
+    Copy of a markdown file made after each build, to find the slides that
+    changed in the next one.
+    """
+    return f"./media/.old.{quote(os.path.normpath(filename), safe='')}"
+
+
+def get_slide_numbers_filename(filename) -> str:
+    """
+    File with the number of each slide (by name) in the last build of a
+    presentation (see `save_slide_numbers`).
+    """
+    return (f"./media/.slide_numbers."
+            f"{quote(os.path.normpath(filename), safe='')}.json")
+
+
+def get_errors_filename(filename) -> str:
+    """File with the slides that failed in a keep-going build."""
+    return (f"./media/.errors."
+            f"{quote(os.path.normpath(filename), safe='')}.json")
+
+
+def save_slide_numbers(filename, slides) -> None:
+    with open(get_slide_numbers_filename(filename), "w") as f:
+        json.dump({s["name"]: s["slide_number"] for s in slides}, f)
+
+
+def load_slide_numbers(filename) -> dict[str, int] | None:
+    try:
+        with open(get_slide_numbers_filename(filename)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_include_filename(node, folder="") -> str | None:
+    """
+    Return the file of an `!include path.md` paragraph, if it is one. The
+    path is relative to `folder` (the folder of the file that has it).
+    """
+    if node.type != "paragraph" or len(node.children) != 1:
+        return None
+    m = INCLUDE_PATTERN.fullmatch(node.children[0].content.strip())
+    if m is None:
+        return None
+    return os.path.normpath(os.path.join(folder, m.group(1)))
+
+
+def get_slide_name_prefix(filename, is_main_file) -> str:
+    """
+    Prefix of the names of the slides of a file (see `get_deck_slides`), so
+    each file has its own slide files. The main file has none, so a deck
+    without includes keeps the names of the slide numbers.
+    """
+    if is_main_file:
+        return ""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    stem = re.sub(r"[^A-Za-z0-9-]", "-", stem)
+    h = hashlib.sha1(os.path.normpath(filename).encode()).hexdigest()[:6]
+    return f"{stem}-{h}-"
+
+
+def get_deck_slides(filename, text=None) -> tuple[list[dict], list[str]]:
+    """
+    Return the slides of a presentation and the markdown files they come
+    from. An `!include path.md` paragraph (the path is relative to the
+    folder of the file that has it) adds the slides of that file after the
+    slide that has it, and the content before its first title to that
+    slide.
+
+    Each file is compared with its own snapshot (see `get_snapshot_filename`),
+    and files that weren't modified since their snapshot are not compared
+    at all. Besides the keys of `get_slides_md_nodes_from_text`, each slide
+    has its 'source' file and a 'name' for its files (its number in the
+    source file, with the prefix of `get_slide_name_prefix`), which doesn't
+    change when other files change. Since the slides show their number in
+    the whole presentation (e.g. in the footer), slides whose number changed
+    since the last build (see `save_slide_numbers`) are also new.
+
+    If `text` is given, it is used as the content of `filename` (e.g. an
+    unsaved editor buffer), and all the slides are considered new.
+    """
+    sources = []
+    slides = _get_file_slides(filename, text, text is None, (), sources)
+    old_slide_numbers = load_slide_numbers(filename) if text is None else None
+    for slide_number, slide in enumerate(slides):
+        slide["slide_number"] = slide_number
+        if (old_slide_numbers is not None
+                and old_slide_numbers.get(slide["name"]) != slide_number):
+            slide["is_new_slide"] = True
+    return slides, sources
+
+
+@lru_cache(maxsize=64)
+def _parse_markdown_file(filename, size, mtime_ns):
+    # keyed by the size and modification time, so long-lived processes
+    # (`yerba serve`, `yerba build`) only parse the files that changed
+    with open(filename, "r") as f:
+        text = f.read()
+    return text, get_markdownit_nodes(text)
+
+
+def is_snapshot_up_to_date(filename, snapshot_filename) -> bool:
+    """
+    Check if a file wasn't modified since its snapshot was taken (they are
+    copied with their modification time, see `MainRutine.run`).
+    """
+    try:
+        st, snapshot_st = os.stat(filename), os.stat(snapshot_filename)
+    except OSError:
+        return False
+    return (st.st_size == snapshot_st.st_size
+            and st.st_mtime_ns == snapshot_st.st_mtime_ns)
+
+
+def _get_file_slides(filename, text, use_snapshots, including,
+                     sources) -> list[dict]:
+    # `including` are the files that include this one (recursively)
+    if filename in sources:
+        # its slides would have the same names
+        raise ValueError(f"'{filename}' is included more than once")
+    sources.append(filename)
+
+    snapshot_filename = get_snapshot_filename(filename)
+    if text is None:
+        st = os.stat(filename)
+        text, nodes = _parse_markdown_file(filename, st.st_size,
+                                           st.st_mtime_ns)
+        if use_snapshots and is_snapshot_up_to_date(filename,
+                                                    snapshot_filename):
+            # unchanged: no need to read the snapshot and compare them
+            file_slides = split_slides(nodes, is_new_slide=False)
+        else:
+            file_slides = None
+    else:
+        file_slides = None
+
+    if file_slides is None:
+        old_text = None
+        if use_snapshots and os.path.exists(snapshot_filename):
+            with open(snapshot_filename, "r") as f:
+                old_text = f.read()
+        file_slides = get_slides_md_nodes_from_text(text, old_text)
+
+    prefix = get_slide_name_prefix(filename, is_main_file=not including)
+    slides = []
+    for slide in file_slides:
+        slide["source"] = filename
+        slide["name"] = f"{prefix}s{slide['slide_number']:04g}"
+
+        content = []
+        included_slides = []
+        for node in slide["content"]:
+            include_filename = get_include_filename(
+                node, os.path.dirname(filename))
+            if include_filename is None:
+                content.append(node)
+                continue
+            if not os.path.isfile(include_filename):
+                raise FileNotFoundError(
+                    f"'{include_filename}' (included in '{filename}') "
+                    "doesn't exist"
+                )
+            first, *others = _get_file_slides(
+                include_filename, None, use_snapshots,
+                (*including, filename), sources
+            )
+            content += first["content"]
+            slide["is_new_slide"] = (slide["is_new_slide"]
+                                     or first["is_new_slide"])
+            included_slides += others
+
+        slide["content"] = content
+        slides.append(slide)
+        slides += included_slides
+    return slides
+
+
+def get_slide_number_at_line(slides, line) -> int:
+    """
+    Return the number of the slide of the main file (the source of the
+    slide 0) that contains a (0-based) line.
+    """
+    slide_number = 0
+    for slide in slides[1:]:
+        if slide.get("source") != slides[0].get("source"):
+            continue
+        if slide["title"].map[0] > line:
+            break
+        slide_number = slide["slide_number"]
+    return slide_number
+
+
+def parse_slide_ranges(ranges: str) -> set[int]:
+    """Parse slide ranges like '12-15,18' into a set of slide numbers."""
+    slide_numbers = set()
+    for part in ranges.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition("-")
+        if sep:
+            slide_numbers.update(range(int(start), int(end)+1))
+        else:
+            slide_numbers.add(int(start))
+    return slide_numbers
+
+
+def get_slide_numbers_by_title(slides, titles) -> set[int]:
+    """Return the numbers of the slides whose title is one of `titles`."""
+    titles = {t.strip().lower() for t in titles}
+    return {
+        slide["slide_number"] for slide in slides[1:]
+        if slide["title"].children[0].content.strip().lower() in titles
+    }
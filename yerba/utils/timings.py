@@ -0,0 +1,33 @@
+"""
+Timings of the startup (imports) and of the build stages, shown with
+`yerba --timings`. Like `fingerprint`, this module must not import manim.
+"""
+from __future__ import annotations
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.t0: float = time.perf_counter()
+        self.records: list[tuple[str, float]] = []
+
+    @contextmanager
+    def measure(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append((name, time.perf_counter() - t0))
+
+    def report(self, file=sys.stderr) -> None:
+        total = time.perf_counter() - self.t0
+        width = max((len(name) for name, _ in self.records), default=0)
+        print("Timings:", file=file)
+        for name, dt in self.records:
+            print(f"  {name:<{width}}  {dt:8.3f} s", file=file)
+        print(f"  {'total':<{width}}  {total:8.3f} s", file=file)
+
+
+timings = Timings()